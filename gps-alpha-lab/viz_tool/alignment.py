@@ -0,0 +1,285 @@
+import numpy as np
+
+
+def preceding_indices(source_ns, target_ns):
+    """
+    For each target timestamp, find the index of the last source sample at or
+    before it (same semantics as pd.merge_asof(direction="backward")).
+
+    Args:
+        source_ns (np.ndarray): Sorted int64 nanosecond timestamps of the stream.
+        target_ns (np.ndarray): int64 nanosecond timestamps to align onto.
+
+    Returns:
+        np.ndarray: Indices into source_ns, -1 where no preceding sample exists.
+    """
+    return np.searchsorted(source_ns, target_ns, side="right") - 1
+
+
+def nearest_indices(source_ns, target_ns):
+    """
+    For each target timestamp, find the index of the closest source sample
+    (same semantics as pd.merge_asof(direction="nearest")).
+
+    Args:
+        source_ns (np.ndarray): Sorted int64 nanosecond timestamps of the stream.
+        target_ns (np.ndarray): int64 nanosecond timestamps to align onto.
+
+    Returns:
+        np.ndarray: Indices into source_ns, -1 if the stream is empty.
+    """
+    if len(source_ns) == 0:
+        return np.full(len(target_ns), -1, dtype=np.intp)
+
+    right = np.searchsorted(source_ns, target_ns, side="left")
+    left = np.clip(right - 1, 0, len(source_ns) - 1)
+    right = np.clip(right, 0, len(source_ns) - 1)
+
+    # ties go to the earlier sample, like merge_asof
+    use_right = np.abs(source_ns[right] - target_ns) < np.abs(
+        target_ns - source_ns[left]
+    )
+    return np.where(use_right, right, left)
+
+
+def take_aligned(values, indices):
+    """
+    Gather values at the aligned indices, filling -1 (no match) with NaN
+    for float columns and -1 for integer columns.
+    """
+    values = np.asarray(values)
+    if len(values) == 0:
+        fill = np.nan if values.dtype.kind == "f" else -1
+        return np.full(len(indices), fill, dtype=values.dtype)
+
+    missing = indices < 0
+    out = values[np.where(missing, 0, indices)]
+
+    if missing.any():
+        if out.dtype.kind == "f":
+            out[missing] = np.nan
+        elif out.dtype.kind == "i":
+            out[missing] = -1
+        else:
+            out = out.astype(object)
+            out[missing] = None
+
+    return out
+
+
+def align_streams(timeline_ns, streams, direction="backward"):
+    """
+    Align several timestamped streams onto a single timeline in one pass.
+
+    Each stream is matched against the timeline with one searchsorted call,
+    and only the requested columns are gathered. No intermediate merged
+    DataFrames are created.
+
+    Args:
+        timeline_ns (np.ndarray): int64 nanosecond timestamps to align onto
+            (e.g., the scene camera frames).
+        streams (dict): Maps a stream name to a (timestamps_ns, columns) tuple,
+            where columns is a dict of column name -> array.
+        direction (str): "backward" to take the preceding sample or "nearest"
+            to take the closest one. Can also be a dict of stream name ->
+            direction.
+
+    Returns:
+        dict: Struct-of-arrays table, mapping "timestamp [ns]" and every
+            requested column name to an array of len(timeline_ns).
+    """
+    timeline_ns = np.asarray(timeline_ns, dtype=np.int64)
+    table = {"timestamp [ns]": timeline_ns}
+
+    for name, (source_ns, columns) in streams.items():
+        source_ns = np.asarray(source_ns, dtype=np.int64)
+
+        # searchsorted needs sorted input, only pay for a sort when needed
+        order = None
+        if len(source_ns) > 1 and np.any(source_ns[1:] < source_ns[:-1]):
+            order = np.argsort(source_ns, kind="stable")
+            source_ns = source_ns[order]
+
+        stream_direction = (
+            direction.get(name, "backward")
+            if isinstance(direction, dict)
+            else direction
+        )
+        if stream_direction == "nearest":
+            indices = nearest_indices(source_ns, timeline_ns)
+        else:
+            indices = preceding_indices(source_ns, timeline_ns)
+
+        if order is not None:
+            indices = np.where(indices < 0, -1, order[np.maximum(indices, 0)])
+
+        for column, values in columns.items():
+            table[column] = take_aligned(values, indices)
+
+    return table
+
+
+class FrameTimeline:
+    """
+    The scene frames of a recording as an int64 nanosecond timeline, with
+    the recording start cached and per-frame columns held as contiguous NumPy
+    arrays. Going from video time to a frame is a single searchsorted, and
+    reading a frame's values are plain array lookups, without pandas.
+    """
+
+    def __init__(self, timestamps_ns, columns):
+        """
+        Args:
+            timestamps_ns (np.ndarray): Sorted timestamps of the scene frames.
+            columns (dict): Maps column name -> per-frame values.
+        """
+        self.timestamps_ns = np.ascontiguousarray(timestamps_ns, dtype=np.int64)
+        self.start_ns = int(self.timestamps_ns[0]) if len(self.timestamps_ns) else 0
+        self.columns = {
+            name: np.ascontiguousarray(values) for name, values in columns.items()
+        }
+
+    def __len__(self):
+        return len(self.timestamps_ns)
+
+    def __getitem__(self, column):
+        return self.columns[column]
+
+    def index_at(self, seconds, start=0, end=None):
+        """
+        The frame closest to a video time (seconds since the first frame),
+        clamped to the frame range [start, end].
+        """
+        end = len(self.timestamps_ns) - 1 if end is None else end
+        target_ns = self.start_ns + round(seconds * 1e9)
+
+        idx = int(np.searchsorted(self.timestamps_ns, target_ns, side="left"))
+        # ties go to the earlier frame, as in nearest_indices
+        if idx == len(self.timestamps_ns) or (
+            idx > 0
+            and target_ns - self.timestamps_ns[idx - 1]
+            <= self.timestamps_ns[idx] - target_ns
+        ):
+            idx -= 1
+
+        return min(max(idx, start), end)
+
+    def window(self, start_ns, end_ns):
+        """
+        Frame range [start, end] of the frames between two timestamps. It is
+        empty (end < start) if there are none, e.g., start is len(self) if
+        start_ns is after the last frame, and end is -1 if end_ns is before
+        the first.
+        """
+        return (
+            int(np.searchsorted(self.timestamps_ns, start_ns, side="left")),
+            int(np.searchsorted(self.timestamps_ns, end_ns, side="right")) - 1,
+        )
+
+    def seconds_since_start(self, timestamp_ns):
+        """
+        Video time of a timestamp, in seconds since the first frame.
+        """
+        return (int(timestamp_ns) - self.start_ns) / 1e9
+
+
+class PiecewiseInterpolator:
+    """
+    Interpolates a stream with dropouts (e.g., GPS in tunnels or indoors)
+    without inventing data across them.
+
+    The stream is split wherever consecutive samples are more than
+    max_gap_ns apart, and every segment gets its own monotone cubic (PCHIP)
+    interpolant, fitted the first time a timestamp falls into it. Timestamps
+    outside all segments (in a gap, or before the first or after the last
+    sample) are invalid and get NaN.
+    """
+
+    def __init__(self, source_ns, columns, max_gap_ns):
+        """
+        Args:
+            source_ns (np.ndarray): Strictly increasing timestamps of the stream.
+            columns (dict): Maps column name -> values at source_ns.
+            max_gap_ns (float): Longest time between two samples that is
+                still interpolated (np.inf to never split).
+        """
+        self.source_ns = np.asarray(source_ns, dtype=np.int64)
+        self.names = list(columns)
+        self.values = np.column_stack(
+            [np.asarray(columns[name], dtype=np.float64) for name in self.names]
+        ).reshape(len(self.source_ns), len(self.names))
+
+        # segment k holds the samples segment_starts[k]:segment_ends[k]
+        breaks = np.flatnonzero(np.diff(self.source_ns) > max_gap_ns) + 1
+        if len(self.source_ns):
+            self.segment_starts = np.concatenate([[0], breaks])
+            self.segment_ends = np.concatenate([breaks, [len(self.source_ns)]])
+        else:
+            self.segment_starts = self.segment_ends = np.empty(0, dtype=np.intp)
+        self._interpolants = {}
+
+    def __len__(self):
+        return len(self.segment_starts)
+
+    def segment_indices(self, target_ns):
+        """
+        The segment each timestamp falls into, -1 if it is in none of them.
+        """
+        target_ns = np.asarray(target_ns, dtype=np.int64)
+        if len(self) == 0:
+            return np.full(len(target_ns), -1, dtype=np.intp)
+
+        first_ns = self.source_ns[self.segment_starts]
+        last_ns = self.source_ns[self.segment_ends - 1]
+        segments = np.searchsorted(first_ns, target_ns, side="right") - 1
+        inside = (segments >= 0) & (target_ns <= last_ns[np.maximum(segments, 0)])
+        return np.where(inside, segments, -1)
+
+    def __call__(self, target_ns):
+        """
+        Interpolate all columns at the given timestamps.
+
+        Returns:
+            dict: Maps column name -> values at target_ns, NaN where invalid.
+        """
+        target_ns = np.asarray(target_ns, dtype=np.int64)
+        out = np.full((len(target_ns), len(self.names)), np.nan)
+
+        segments = self.segment_indices(target_ns)
+        valid = np.flatnonzero(segments >= 0)
+        # group the valid timestamps by segment, only those segments are fitted
+        valid = valid[np.argsort(segments[valid], kind="stable")]
+        group_starts = np.flatnonzero(np.diff(segments[valid], prepend=-1))
+        for rows in np.split(valid, group_starts[1:]):
+            if len(rows) == 0:
+                continue
+            segment = int(segments[rows[0]])
+            first_ns, interpolant = self._interpolant(segment)
+            out[rows] = interpolant((target_ns[rows] - first_ns).astype(np.float64))
+
+        return {name: out[:, k] for k, name in enumerate(self.names)}
+
+    def _interpolant(self, segment):
+        if segment not in self._interpolants:
+            # scipy is only needed once data is interpolated, and this module
+            # is imported when the tool starts
+            from scipy.interpolate import PchipInterpolator
+
+            start = self.segment_starts[segment]
+            end = self.segment_ends[segment]
+            first_ns = self.source_ns[start]
+            values = self.values[start:end]
+            if end - start == 1:
+                # a lone sample is only valid at its own timestamp
+                def interpolant(x, values=values):
+                    return np.repeat(values, len(x), axis=0)
+
+            else:
+                # relative times keep the fit well conditioned
+                interpolant = PchipInterpolator(
+                    (self.source_ns[start:end] - first_ns).astype(np.float64),
+                    values,
+                    axis=0,
+                )
+            self._interpolants[segment] = (first_ns, interpolant)
+        return self._interpolants[segment]
@@ -0,0 +1,116 @@
+// Map updates that are computed in the browser from small inputs.
+//
+// The server only sends the wearer's pose (position, heading and gaze
+// direction) for a frame, and the fixed-shape pie arc, gaze arrow and
+// marker are placed here. The trajectory of the current view is sent once
+// with the row index of every point, so a trim (a start/end row window)
+// is applied here without sending the trajectory again.
+
+function renderPose(pose, shape) {
+    const lat = pose.lat;
+    const lon = pose.lon;
+    const heading = pose.heading === null ? 0 : pose.heading;
+    const gazeAzi = pose.gaze_azi;
+
+    let arrowEnd = [lat, lon];
+    if (gazeAzi !== null) {
+        const gazeRad = (gazeAzi * Math.PI) / 180;
+        arrowEnd = [
+            lat + shape.arrow_scale * Math.sin(gazeRad),
+            lon + shape.arrow_scale * Math.cos(gazeRad),
+        ];
+    }
+
+    // rotate the unit arc template by the heading, as in pie_arc.py
+    const headingRad = (heading * Math.PI) / 180;
+    const cosH = Math.cos(headingRad);
+    const sinH = Math.sin(headingRad);
+    const lonScale = 1 / Math.cos((lat * Math.PI) / 180);
+    const template = shape.pie_template;
+    const pies = shape.pie_radii.map(function (radius) {
+        const coords = [[lat, lon]];
+        for (let i = 0; i < template.length; i++) {
+            const cosA = template[i][0] * cosH - template[i][1] * sinH;
+            const sinA = template[i][1] * cosH + template[i][0] * sinH;
+            coords.push([lat + radius * sinA, lon + radius * cosA * lonScale]);
+        }
+        coords.push([lat, lon]);
+        return coords;
+    });
+
+    return [[lat, lon], [[lat, lon], arrowEnd], pies];
+}
+
+// first index in a sorted array whose value is >= target
+function lowerBound(values, target) {
+    let lo = 0;
+    let hi = values.length;
+    while (lo < hi) {
+        const mid = (lo + hi) >> 1;
+        if (values[mid] < target) {
+            lo = mid + 1;
+        } else {
+            hi = mid;
+        }
+    }
+    return lo;
+}
+
+function trimLines(trajectory, trimWindow) {
+    if (!trimWindow) {
+        return trajectory.positions;
+    }
+
+    const lines = [];
+    for (let k = 0; k < trajectory.rows.length; k++) {
+        const rows = trajectory.rows[k];
+        const positions = trajectory.positions[k];
+
+        const first = lowerBound(rows, trimWindow.start);
+        const last = lowerBound(rows, trimWindow.end + 1) - 1;
+        const line = positions.slice(first, last + 1);
+
+        // the window edges usually fall between two of the (simplified)
+        // points, so the line is extended to the exact edge positions
+        if (
+            trimWindow.start_position &&
+            first > 0 &&
+            first < rows.length &&
+            rows[first] !== trimWindow.start
+        ) {
+            line.unshift(trimWindow.start_position);
+        }
+        if (
+            trimWindow.end_position &&
+            last >= 0 &&
+            last < rows.length - 1 &&
+            rows[last] !== trimWindow.end
+        ) {
+            line.push(trimWindow.end_position);
+        }
+
+        if (line.length > 1) {
+            lines.push(line);
+        }
+    }
+    return lines;
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    map_updates: {
+        render_pose: function (pose, shape) {
+            const noUpdate = window.dash_clientside.no_update;
+            if (!pose || !shape) {
+                return [noUpdate, noUpdate, noUpdate];
+            }
+            return renderPose(pose, shape);
+        },
+
+        apply_trim: function (trajectory, trimWindow) {
+            if (!trajectory) {
+                return window.dash_clientside.no_update;
+            }
+            return trimLines(trajectory, trimWindow);
+        },
+    },
+});
@@ -0,0 +1,62 @@
+// Clientside playback for the Visualization Tool.
+//
+// When the tool is started with --clientside-playback, the per-frame arrays
+// are shipped to the browser once (see the "playback-frames" store) and the
+// wearer marker, gaze arrow and pie arc are updated here on every video tick,
+// without a request to the Dash server.
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    playback: {
+        update_map: function (currentTime, frames, trimWindow) {
+            const noUpdate = window.dash_clientside.no_update;
+            if (currentTime === null || currentTime === undefined || !frames) {
+                return [noUpdate, noUpdate, noUpdate];
+            }
+
+            const t = frames.t;
+            let start = 0;
+            let end = t.length - 1;
+            if (trimWindow) {
+                start = trimWindow.start;
+                end = trimWindow.end;
+            }
+            if (end < start) {
+                return [noUpdate, noUpdate, noUpdate];
+            }
+
+            // binary search for the nearest frame, then clamp to the trim window
+            let lo = 0;
+            let hi = t.length;
+            while (lo < hi) {
+                const mid = (lo + hi) >> 1;
+                if (t[mid] < currentTime) {
+                    lo = mid + 1;
+                } else {
+                    hi = mid;
+                }
+            }
+            let idx = Math.min(lo, t.length - 1);
+            if (idx > 0 && currentTime - t[idx - 1] <= t[idx] - currentTime) {
+                idx = idx - 1;
+            }
+            idx = Math.min(Math.max(idx, start), end);
+            // frames in GPS gaps have no position, the marker stays put
+            // (as for a pose the server cannot place)
+            if (frames.lat[idx] === null || frames.lon[idx] === null) {
+                return [noUpdate, noUpdate, noUpdate];
+            }
+
+            // the pie arc, arrow and marker are placed as for a pose sent
+            // by the server (see map_updates.js)
+            return renderPose(
+                {
+                    lat: frames.lat[idx],
+                    lon: frames.lon[idx],
+                    heading: frames.heading[idx],
+                    gaze_azi: frames.gaze_azi[idx],
+                },
+                frames
+            );
+        },
+    },
+});
@@ -0,0 +1,343 @@
+# /// script
+# requires-python = ">=3.11"
+# dependencies = [
+#     "geopy",
+#     "numpy",
+#     "pandas",
+#     "scipy",
+# ]
+# ///
+"""
+Process many Neon + GPS recordings without starting the visualization tool.
+
+For every recording, the aligned GPS + gaze + IMU table (one row per scene
+frame) and the located events are written to the output directory. Finished
+recordings are skipped when the command is run again, so an interrupted
+batch can simply be restarted.
+"""
+
+import argparse
+import glob
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import geocoding
+import ingest
+import numpy as np
+import pandas as pd
+import processing
+
+OUTPUT_FORMATS = ["csv", "parquet"]
+
+
+def find_recordings(input_dir):
+    """
+    All Neon Timeseries CSV folders (folders with a world_timestamps.csv)
+    below input_dir, sorted by path.
+    """
+    return sorted(
+        dirpath
+        for dirpath, _, filenames in os.walk(input_dir)
+        if "world_timestamps.csv" in filenames
+    )
+
+
+def timestamp_range(csv_path):
+    timestamps = ingest.read_columns(csv_path, {"timestamp [ns]": np.int64})[
+        "timestamp [ns]"
+    ].values
+    if len(timestamps) == 0:
+        return None
+    return int(timestamps.min()), int(timestamps.max())
+
+
+def find_gps_ranges(gps_dir):
+    """
+    The time range of every GPS CSV file in gps_dir (see find_gps_csv).
+    """
+    gps_ranges = {}
+    if gps_dir is not None:
+        for path in sorted(glob.glob(os.path.join(gps_dir, "*.csv"))):
+            gps_range = timestamp_range(path)
+            if gps_range is not None:
+                gps_ranges[path] = gps_range
+    return gps_ranges
+
+
+def find_gps_csv(neon_folder_path, gps_ranges):
+    """
+    The GPS CSV of a recording: a gps*.csv file inside the recording folder,
+    or else the file in gps_ranges whose time range overlaps the recording
+    the most.
+
+    Args:
+        neon_folder_path (str): Neon Timeseries CSV folder path.
+        gps_ranges (dict): Maps GPS CSV path -> (first, last) timestamp [ns].
+
+    Returns:
+        str: The GPS CSV path, or None if there is no matching file.
+    """
+    candidates = sorted(glob.glob(os.path.join(neon_folder_path, "gps*.csv")))
+    if candidates:
+        return candidates[0]
+
+    recording_range = timestamp_range(
+        os.path.join(neon_folder_path, "world_timestamps.csv")
+    )
+    if recording_range is None:
+        return None
+
+    best_path, best_overlap = None, 0
+    for path, (first, last) in gps_ranges.items():
+        overlap = min(last, recording_range[1]) - max(first, recording_range[0])
+        if overlap > best_overlap:
+            best_path, best_overlap = path, overlap
+    return best_path
+
+
+def output_paths(output_dir, name, output_format):
+    folder = os.path.join(output_dir, name)
+    return (
+        os.path.join(folder, f"aligned.{output_format}"),
+        os.path.join(folder, f"events.{output_format}"),
+    )
+
+
+def write_table(df, path, output_format):
+    # write to a temporary file first, so that an interrupted run never
+    # leaves a truncated file that looks finished. Unique per process and
+    # thread, as several servers may process the same recording at once
+    # (see comparison.prepare_recording).
+    tmp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    if output_format == "parquet":
+        df.to_parquet(tmp_path, index=False)
+    else:
+        df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def read_table(path, columns):
+    """
+    Read the given columns of a table written by write_table.
+
+    Args:
+        columns (dict): Maps column name -> dtype.
+    """
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path, columns=list(columns)).astype(columns)
+    return ingest.read_columns(path, columns)
+
+
+def align_recording(
+    neon_folder_path,
+    gps_csv_path,
+    aligned_path,
+    output_format,
+    csv_engine,
+    gaze_timeline,
+    clean_gps,
+    max_gps_gap_s,
+):
+    """
+    Align one recording and write its table (see
+    processing.open_and_populate_data).
+
+    Returns:
+        tuple: (world_gaze_gps_imu_df, events_df)
+    """
+    world_gaze_gps_imu_df, events_df = processing.open_and_populate_data(
+        neon_folder_path,
+        gps_csv_path,
+        gaze_timeline=gaze_timeline,
+        clean_gps=clean_gps,
+        max_gps_gap_s=max_gps_gap_s,
+        csv_engine=csv_engine,
+    )
+    os.makedirs(os.path.dirname(aligned_path), exist_ok=True)
+    write_table(world_gaze_gps_imu_df, aligned_path, output_format)
+    return world_gaze_gps_imu_df, events_df
+
+
+def process_recording(*args):
+    """
+    Align one recording and write its table (see align_recording). Runs in
+    a worker process.
+
+    Returns:
+        pd.DataFrame: The located events (see processing.locate_events),
+            which are reverse geocoded and written by the main process.
+    """
+    return processing.locate_events(*align_recording(*args))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Align many Neon + GPS recordings without the visualization tool"
+    )
+    parser.add_argument(
+        "input_dir", help="Folder containing Neon Timeseries CSV folders"
+    )
+    parser.add_argument("output_dir", help="Folder to write the results to")
+    parser.add_argument(
+        "--gps-dir",
+        default=None,
+        help="Folder with GPS CSV files, matched to recordings by time "
+        "(by default, each recording folder contains its gps*.csv file)",
+    )
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="csv")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of recordings processed in parallel",
+    )
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="Process recordings again even if their results exist",
+    )
+    parser.add_argument(
+        "--reverse-geocode",
+        action="store_true",
+        help="Name events after their address",
+    )
+    parser.add_argument(
+        "--geocoder",
+        choices=["nominatim", "offline"],
+        default="nominatim",
+        help="Reverse geocoding backend (offline works without network access)",
+    )
+    parser.add_argument(
+        "--gazetteer",
+        default=None,
+        help="CSV file with name,latitude,longitude of places for the offline geocoder",
+    )
+    parser.add_argument(
+        "--geocode-cache",
+        default=geocoding.DEFAULT_CACHE_PATH,
+        help="Path of the on-disk reverse geocoding cache",
+    )
+    parser.add_argument(
+        "--gaze-timeline",
+        choices=processing.GAZE_TIMELINES,
+        default="imu",
+        help="Compute world-relative gaze for every IMU sample, or only at the "
+        "scene camera frames (faster, with interpolated IMU orientation)",
+    )
+    parser.add_argument(
+        "--raw-gps",
+        action="store_true",
+        help="Interpolate the GPS samples as recorded, without removing "
+        "outliers and smoothing the track",
+    )
+    parser.add_argument(
+        "--max-gps-gap",
+        type=float,
+        default=processing.DEFAULT_MAX_GPS_GAP_S,
+        help="GPS dropouts longer than this many seconds are not interpolated "
+        "across, the frames in them get empty latitude and longitude",
+    )
+    parser.add_argument(
+        "--csv-engine",
+        choices=ingest.CSV_ENGINES,
+        default=ingest.CSV_ENGINE,
+        help="CSV parser: c uses the least memory, pyarrow (if installed) is faster",
+    )
+    args = parser.parse_args(argv)
+
+    if args.format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            print(
+                "Error: --format parquet requires pyarrow (pip install pyarrow).",
+                file=sys.stderr,
+            )
+            return 1
+
+    gps_ranges = find_gps_ranges(args.gps_dir)
+
+    # recordings are named by their path below input_dir
+    jobs = []
+    skipped = 0
+    for neon_folder_path in find_recordings(args.input_dir):
+        name = os.path.relpath(neon_folder_path, args.input_dir)
+        aligned_path, events_path = output_paths(args.output_dir, name, args.format)
+        if not args.overwrite and os.path.exists(events_path):
+            skipped += 1
+            continue
+
+        gps_csv_path = find_gps_csv(neon_folder_path, gps_ranges)
+        if gps_csv_path is None:
+            print(f"Skipping {name}: no GPS CSV found", file=sys.stderr)
+            continue
+        jobs.append((name, neon_folder_path, gps_csv_path, aligned_path, events_path))
+
+    print(f"{len(jobs)} recordings to process, {skipped} already done")
+    if not jobs:
+        return 0
+
+    if args.reverse_geocode:
+        geocoding_backend = geocoding.create_backend(args.geocoder, args.gazetteer)
+        geocode_cache = geocoding.GeocodeCache(args.geocode_cache)
+
+    failed = []
+    batch_start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {
+            pool.submit(
+                process_recording,
+                neon_folder_path,
+                gps_csv_path,
+                aligned_path,
+                args.format,
+                args.csv_engine,
+                args.gaze_timeline,
+                not args.raw_gps,
+                args.max_gps_gap,
+            ): (name, events_path)
+            for name, neon_folder_path, gps_csv_path, aligned_path, events_path in jobs
+        }
+
+        for done, future in enumerate(as_completed(futures), start=1):
+            name, events_path = futures[future]
+            prefix = f"[{done}/{len(jobs)}] {name}:"
+            try:
+                located_events_df = future.result()
+
+                # geocoding happens here, in a single process, so that the
+                # rate limit and the cache are shared by all recordings
+                if args.reverse_geocode:
+                    located_events_df["location"] = processing.geocode_event_locations(
+                        located_events_df, geocoding_backend, geocode_cache
+                    )
+                else:
+                    located_events_df["location"] = located_events_df["name"]
+
+                # the events file is written last and marks the recording as done
+                write_table(located_events_df, events_path, args.format)
+            except Exception as e:
+                failed.append(name)
+                print(f"{prefix} failed: {e!r}", file=sys.stderr)
+                traceback.print_exc()
+                continue
+
+            elapsed = time.perf_counter() - batch_start
+            print(f"{prefix} done ({elapsed:.0f} s elapsed)")
+
+    if args.reverse_geocode:
+        geocode_cache.close()
+
+    print(f"{len(jobs) - len(failed)} recordings processed, {len(failed)} failed")
+    for name in failed:
+        print(f"  failed: {name}", file=sys.stderr)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
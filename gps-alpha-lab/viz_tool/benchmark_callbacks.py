@@ -0,0 +1,125 @@
+"""
+Microbenchmark of the per-tick latency of the video-synced map callback.
+
+The recording is loaded as in gps_viz_tool.py, then simulated playback ticks
+(40 ms apart, like the video player's currentTime updates) are timed for:
+
+- the frame lookup alone (video time -> frame index),
+- the callback function (lookup + building the wearer's pose),
+- a full Dash request through the server (incl. JSON serialization),
+
+and the response size per tick and per second of playback.
+
+Usage:
+    python benchmark_callbacks.py neon_timeseries_folder gps_csv [--ticks N]
+"""
+
+import argparse
+import json
+import os
+import shlex
+import time
+
+import numpy as np
+
+
+def summarize(name, seconds):
+    seconds = np.asarray(seconds) * 1e6
+    print(
+        f"{name:<24}{np.median(seconds):>12.1f}{np.percentile(seconds, 95):>12.1f}"
+        f"{seconds.max():>12.1f}"
+    )
+
+
+def time_calls(function, arguments):
+    durations = []
+    for args in arguments:
+        start = time.perf_counter()
+        function(*args)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def playback_request(app):
+    """
+    The request body the browser sends for a currentTime update, without
+    the currentTime value.
+    """
+    dependencies = app.server.test_client().get("/_dash-dependencies").get_json()
+    for dependency in dependencies:
+        inputs = [(i["id"], i["property"]) for i in dependency["inputs"]]
+        if inputs == [("video-player", "currentTime")]:
+            break
+    else:
+        raise RuntimeError("No playback callback found (is it clientside?)")
+
+    component_id, component_property = dependency["output"].split("@")[0].rsplit(".", 1)
+    return {
+        "output": dependency["output"],
+        "outputs": {"id": component_id, "property": component_property},
+        "inputs": [{"id": "video-player", "property": "currentTime", "value": None}],
+        "state": [{"id": "trim-window", "property": "data", "value": None}],
+        "changedPropIds": ["video-player.currentTime"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("neon_folder", help="Neon Timeseries CSV + Scene Video folder")
+    parser.add_argument("gps_csv", help="GPS CSV file path")
+    parser.add_argument("--ticks", type=int, default=2000)
+    args = parser.parse_args()
+
+    # gps_viz_tool loads the recording when it is imported
+    os.environ["GPS_VIZ_TOOL_ARGS"] = shlex.join([args.neon_folder, args.gps_csv])
+    import gps_viz_tool
+
+    frame_timeline = gps_viz_tool.frame_timeline
+    duration = (frame_timeline.timestamps_ns[-1] - frame_timeline.start_ns) / 1e9
+    ticks = [(t, None) for t in np.arange(args.ticks) * 0.04 % duration]
+
+    print(f"{len(frame_timeline)} frames, {len(ticks)} ticks")
+    print(f"{'[us]':<24}{'median':>12}{'p95':>12}{'max':>12}")
+
+    summarize(
+        "frame lookup",
+        time_calls(lambda t, _: frame_timeline.index_at(t), ticks),
+    )
+
+    summarize(
+        "callback",
+        time_calls(gps_viz_tool.map_update_on_currentTime, ticks),
+    )
+
+    client = gps_viz_tool.app.server.test_client()
+    body = playback_request(gps_viz_tool.app)
+    requests = []
+    for t, _ in ticks:
+        body["inputs"][0]["value"] = float(t)
+        requests.append((json.dumps(body),))
+    summarize(
+        "dash request",
+        time_calls(
+            lambda body: client.post(
+                "/_dash-update-component", data=body, content_type="application/json"
+            ),
+            requests,
+        ),
+    )
+
+    sizes = [
+        len(
+            client.post(
+                "/_dash-update-component", data=body, content_type="application/json"
+            ).data
+        )
+        for (body,) in requests
+    ]
+    print(
+        f"response size: {np.mean(sizes):.0f} bytes per tick, "
+        f"{np.mean(sizes) * 25 / 1e3:.1f} kB per second of playback"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Benchmark of the loading pipeline on synthetic recordings of several lengths.
+
+Recordings are generated with synthetic_recording.py (and kept in --data-dir
+to be reused by later runs), then loaded as in gps_viz_tool.py. The wall
+time and peak memory (traced allocations, see ingest.StageReport) of every
+stage are printed per recording, and can be saved as JSON with --output to
+compare runs.
+
+Usage:
+    python benchmark_pipeline.py [--minutes 10 60 240] [--data-dir DIR]
+"""
+
+import argparse
+import glob
+import json
+import os
+import tempfile
+import time
+
+import alignment
+import ingest
+import numpy as np
+import processing
+import synthetic_recording
+from gaze_heatmap import GazeHeatmap
+from spatial_index import build_spatial_index
+from trajectory_lod import build_trajectory_pyramid
+
+
+def synthetic_recording_for(data_dir, minutes, seed=0):
+    """
+    The recording of the given length in data_dir, generated if needed.
+
+    Returns:
+        tuple: (neon_folder_path, gps_csv_path, seconds spent generating)
+    """
+    output_dir = os.path.join(data_dir, f"synthetic-{minutes:g}min-seed{seed}")
+    # events.csv is written last, so its presence marks a complete recording
+    existing = glob.glob(os.path.join(output_dir, "*", "events.csv"))
+    if existing:
+        neon_folder_path = os.path.dirname(existing[0])
+        return neon_folder_path, os.path.join(neon_folder_path, "gps.csv"), 0.0
+
+    start = time.perf_counter()
+    neon_folder_path, gps_csv_path = synthetic_recording.generate_recording(
+        output_dir, minutes * 60, seed=seed
+    )
+    return neon_folder_path, gps_csv_path, time.perf_counter() - start
+
+
+def run_pipeline(neon_folder_path, gps_csv_path, gaze_timeline, csv_engine=None):
+    """
+    Load a recording and build the tool's lookup structures, stage by stage.
+
+    Returns:
+        ingest.StageReport: The time and memory of every stage.
+    """
+    report = ingest.StageReport(enabled=True)
+    world_gaze_gps_imu_df, events_df = processing.open_and_populate_data(
+        neon_folder_path, gps_csv_path, report, gaze_timeline, csv_engine=csv_engine
+    )
+    lats = world_gaze_gps_imu_df["latitude"].values
+    lons = world_gaze_gps_imu_df["longitude"].values
+
+    with report.stage("locate events"):
+        processing.locate_events(world_gaze_gps_imu_df, events_df)
+
+    with report.stage("trajectory pyramid"):
+        build_trajectory_pyramid(lats, lons)
+
+    with report.stage("frame timeline"):
+        frame_timeline = alignment.FrameTimeline(
+            world_gaze_gps_imu_df["timestamp [ns]"].values,
+            {
+                "latitude": lats,
+                "longitude": lons,
+                "heading": world_gaze_gps_imu_df["yaw [deg]"].to_numpy(np.float64) + 90,
+                "gaze azi": world_gaze_gps_imu_df["gaze azi world [deg]"].to_numpy(
+                    np.float64
+                )
+                + 90,
+            },
+        )
+
+    with report.stage("spatial index"):
+        build_spatial_index(lats, lons)
+
+    with report.stage("gaze heatmap"):
+        GazeHeatmap(lats, lons, frame_timeline["gaze azi"])
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--minutes",
+        type=float,
+        nargs="+",
+        default=[10, 60, 240],
+        help="Recording durations to benchmark",
+    )
+    parser.add_argument(
+        "--data-dir",
+        default=None,
+        help="Folder to keep the generated recordings in "
+        "(by default, they are generated in a temporary folder and deleted)",
+    )
+    parser.add_argument(
+        "--gaze-timeline", choices=processing.GAZE_TIMELINES, default="imu"
+    )
+    parser.add_argument(
+        "--csv-engine", choices=ingest.CSV_ENGINES, default=ingest.CSV_ENGINE
+    )
+    parser.add_argument("--output", default=None, help="Save the results as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_dir = args.data_dir or temp_dir
+
+        # generate all recordings first, as tracing allocations (once the
+        # first report is enabled) would slow generation down a lot
+        recordings = []
+        for minutes in args.minutes:
+            neon_folder_path, gps_csv_path, generate_s = synthetic_recording_for(
+                data_dir, minutes
+            )
+            if generate_s:
+                print(f"generated {minutes:g} min recording in {generate_s:.1f} s")
+            recordings.append((minutes, neon_folder_path, gps_csv_path))
+
+        results = []
+        for minutes, neon_folder_path, gps_csv_path in recordings:
+            print(f"\n{minutes:g} min recording")
+            report = run_pipeline(
+                neon_folder_path, gps_csv_path, args.gaze_timeline, args.csv_engine
+            )
+            report.print()
+
+            total_s = sum(seconds for _, seconds, _, _ in report.stages)
+            peak = max(peak for _, _, peak, _ in report.stages)
+            print(f"{'total':<28}{total_s:>10.2f}{peak / 1e6:>12.1f}")
+            results.append(
+                {
+                    "minutes": minutes,
+                    "gaze_timeline": args.gaze_timeline,
+                    "csv_engine": args.csv_engine,
+                    "stages": [
+                        {
+                            "stage": name,
+                            "seconds": seconds,
+                            "peak_bytes": peak,
+                            "in_use_bytes": in_use,
+                        }
+                        for name, seconds, peak, in_use in report.stages
+                    ],
+                }
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Regression checks of the chunked gaze-to-world transform (see
+imu_transformations.gaze_in_world_at_imu) against the dense one.
+
+Gaze and IMU streams are simulated at their own rates, with the IMU starting
+before and ending after the gaze, and transformed block by block with block
+sizes that put the block boundaries of the two streams in different places.
+The result must equal gaze_3d_to_world on the whole recording.
+
+Usage:
+    python check_gaze_to_world.py
+"""
+
+import sys
+
+import numpy as np
+from imu_transformations import (
+    array_blocks,
+    cartesian_to_spherical_world,
+    gaze_3d_to_world,
+    gaze_3d_to_world_chunked,
+    gaze_in_world_at_imu,
+    resample_gaze_to_imu_chunked,
+)
+
+# largest difference to the dense result, in degrees
+TOLERANCE_DEG = 1e-9
+
+
+def simulate(duration_s=60, gaze_rate=200, imu_rate=110, seed=0):
+    """
+    Gaze and IMU samples with jittered timestamps, gaze wandering around the
+    scene and the head turning, as in a recording.
+
+    Returns:
+        tuple: (gaze timestamps [ns], elevation, azimuth, IMU timestamps [ns],
+            (N, 4) quaternions (w, x, y, z)).
+    """
+    rng = np.random.default_rng(seed)
+    start_ns = 1_717_000_000_000_000_000
+
+    def timestamps(rate, first_s, last_s):
+        seconds = np.arange(first_s, last_s, 1 / rate)
+        seconds += rng.uniform(0, 0.2 / rate, len(seconds))
+        return start_ns + np.round(seconds * 1e9).astype(np.int64)
+
+    gaze_ns = timestamps(gaze_rate, 0.5, duration_s - 0.5)
+    elevation = np.cumsum(rng.normal(0, 0.5, len(gaze_ns))).clip(-40, 40)
+    azimuth = np.cumsum(rng.normal(0, 0.5, len(gaze_ns))).clip(-50, 50)
+
+    imu_ns = timestamps(imu_rate, 0, duration_s)
+    # random rotation axes and a heading that turns all the way around
+    angles = np.cumsum(rng.normal(0, 0.05, len(imu_ns))) + np.linspace(
+        0, 4 * np.pi, len(imu_ns)
+    )
+    axes = rng.normal(0, 0.1, (len(imu_ns), 3)) + [0.0, 0.0, 1.0]
+    axes /= np.linalg.norm(axes, axis=1, keepdims=True)
+    quaternions = np.column_stack(
+        [np.cos(angles / 2), axes * np.sin(angles / 2)[:, np.newaxis]]
+    )
+    # the IMU CSV stores rounded quaternions, which are not quite unit length
+    quaternions = quaternions.astype(np.float32).astype(np.float64)
+
+    return gaze_ns, elevation, azimuth, imu_ns, quaternions
+
+
+def angle_difference(a, b):
+    return np.abs((a - b + 180) % 360 - 180)
+
+
+def check(name, elevation, azimuth, dense_elevation, dense_azimuth):
+    error = max(
+        np.max(np.abs(elevation - dense_elevation)),
+        np.max(angle_difference(azimuth, dense_azimuth)),
+    )
+    passed = len(elevation) == len(dense_elevation) and error <= TOLERANCE_DEG
+    print(f"{'ok' if passed else 'FAILED':<8}{name:<44}max error {error:.1e} deg")
+    return passed
+
+
+def main():
+    gaze_ns, elevation, azimuth, imu_ns, quaternions = simulate()
+
+    # the whole recording at once, with a rotation matrix per IMU sample
+    dense_elevation, dense_azimuth = cartesian_to_spherical_world(
+        gaze_3d_to_world(
+            np.interp(imu_ns - gaze_ns[0], gaze_ns - gaze_ns[0], elevation),
+            np.interp(imu_ns - gaze_ns[0], gaze_ns - gaze_ns[0], azimuth),
+            quaternions,
+        )
+    )
+
+    results = []
+    for block_size in [1, 7, 1000, len(imu_ns)]:
+        results.append(
+            check(
+                f"gaze_in_world_at_imu, blocks of {block_size}",
+                *gaze_in_world_at_imu(
+                    gaze_ns, elevation, azimuth, imu_ns, quaternions, block_size
+                ),
+                dense_elevation,
+                dense_azimuth,
+            )
+        )
+
+    # gaze and IMU blocks of unrelated sizes, as when reading two files
+    gaze = np.column_stack([elevation, azimuth])
+    for gaze_block_size, imu_block_size in [(3, 500), (4999, 13)]:
+        blocks = list(
+            gaze_3d_to_world_chunked(
+                resample_gaze_to_imu_chunked(
+                    array_blocks(gaze_block_size, gaze_ns, gaze),
+                    array_blocks(imu_block_size, imu_ns, quaternions),
+                )
+            )
+        )
+        results.append(
+            check(
+                f"gaze blocks of {gaze_block_size}, IMU blocks of {imu_block_size}",
+                np.concatenate([block[1] for block in blocks]),
+                np.concatenate([block[2] for block in blocks]),
+                dense_elevation,
+                dense_azimuth,
+            )
+        )
+
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
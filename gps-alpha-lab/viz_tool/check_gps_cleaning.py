@@ -0,0 +1,98 @@
+"""
+Regression checks of the GPS cleaning (see gps_cleaning.py) on simulated tracks.
+
+Each track is a known path sampled at 1 Hz with GPS noise, and the cleaned
+track must keep nearly all samples and stay close to the path:
+
+- walking with multipath spikes (the outliers must be removed),
+- driving at vehicle speed, faster than the cleaner's max_speed_m_s,
+- walking, then a 50 s dropout (e.g., a tunnel), then driving.
+
+Usage:
+    python check_gps_cleaning.py
+"""
+
+import sys
+
+import numpy as np
+from gps_cleaning import clean_gps
+from spatial_index import project_to_local_meters, unproject_from_local_meters
+
+ORIGIN = (52.5163, 13.3777)
+
+
+def simulate(speeds_m_s, seed=0, noise_m=4.0, spikes=0, dropout=None):
+    """
+    A 1 Hz GPS track along a gently curving path, at the given speed of
+    every second.
+
+    Args:
+        spikes (int): Number of samples replaced by outliers 50-150 m off.
+        dropout (tuple): (start, stop) samples that are left out.
+
+    Returns:
+        tuple: (timestamps [ns], latitudes, longitudes, true east, true
+            north), the true positions in meters from ORIGIN.
+    """
+    rng = np.random.default_rng(seed)
+    speeds_m_s = np.asarray(speeds_m_s, dtype=np.float64)
+    heading = np.cumsum(rng.normal(0, 0.02, len(speeds_m_s)))
+    east = np.cumsum(speeds_m_s * np.cos(heading))
+    north = np.cumsum(speeds_m_s * np.sin(heading))
+
+    measured_east = east + rng.normal(0, noise_m, len(east))
+    measured_north = north + rng.normal(0, noise_m, len(north))
+    spiked = rng.choice(np.arange(10, len(east) - 10), spikes, replace=False)
+    angles = rng.uniform(0, 2 * np.pi, spikes)
+    distances = rng.uniform(50, 150, spikes)
+    measured_east[spiked] += distances * np.cos(angles)
+    measured_north[spiked] += distances * np.sin(angles)
+
+    keep = np.ones(len(east), dtype=bool)
+    if dropout is not None:
+        keep[dropout[0] : dropout[1]] = False
+    timestamps_ns = np.arange(len(east), dtype=np.int64) * 1_000_000_000
+    lats, lons = unproject_from_local_meters(
+        measured_east[keep], measured_north[keep], *ORIGIN
+    )
+    return timestamps_ns[keep], lats, lons, east[keep], north[keep]
+
+
+def check(name, speeds_m_s, min_kept=0.95, max_rms_m=3.0, **kwargs):
+    timestamps_ns, lats, lons, east, north = simulate(speeds_m_s, **kwargs)
+    spikes = kwargs.get("spikes", 0)
+
+    cleaned_ns, cleaned_lats, cleaned_lons = clean_gps(timestamps_ns, lats, lons)
+    rows = np.searchsorted(timestamps_ns, cleaned_ns)
+    errors = np.hypot(
+        *(project_to_local_meters(cleaned_lats, cleaned_lons, *ORIGIN).T)
+        - np.array([east[rows], north[rows]])
+    )
+    kept = len(cleaned_ns) / (len(timestamps_ns) - spikes)
+    rms = float(np.sqrt(np.mean(errors**2))) if len(errors) else float("inf")
+
+    passed = kept >= min_kept and rms <= max_rms_m
+    print(
+        f"{'ok' if passed else 'FAILED':<8}{name:<36}"
+        f"kept {len(cleaned_ns)}/{len(timestamps_ns)}, RMS error {rms:.1f} m"
+    )
+    return passed
+
+
+def main():
+    results = [
+        check("walking with spikes", np.full(600, 1.4), spikes=20),
+        check("driving at 16-20 m/s", np.linspace(16, 20, 600)),
+        check("driving at 20 m/s, 1 m noise", np.full(600, 20.0), noise_m=1.0),
+        check("driving at 25 m/s with spikes", np.full(600, 25.0), spikes=10),
+        check(
+            "walking, 50 s dropout, driving",
+            np.concatenate([np.full(100, 1.4), np.full(320, 20.0)]),
+            dropout=(100, 150),
+        ),
+    ]
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
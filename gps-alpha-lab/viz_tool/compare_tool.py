@@ -0,0 +1,421 @@
+# /// script
+# requires-python = ">=3.11"
+# dependencies = [
+#     "dash",
+#     "dash-leaflet",
+#     "geopy",
+#     "numpy",
+#     "pandas",
+#     "scipy",
+# ]
+# ///
+import argparse
+import datetime
+import functools
+import os
+import shlex
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import batch
+import comparison
+import dash
+import dash_leaflet as dl
+import ingest
+import processing
+import tiles
+from dash import Input, Output, dcc, html
+from trajectory_lod import PYRAMID_ZOOM_LEVELS, select_trajectory
+
+# parse command line arguments for the folder of recordings to compare
+parser = argparse.ArgumentParser(
+    description="Neon GPS Visualization Tool: overlay and compare many recordings"
+)
+parser.add_argument("input_dir", help="Folder containing Neon Timeseries CSV folders")
+parser.add_argument(
+    "cache_dir",
+    help="Folder for the aligned recordings (as written by batch.py), "
+    "so that they are only processed once",
+)
+parser.add_argument(
+    "--gps-dir",
+    default=None,
+    help="Folder with GPS CSV files, matched to recordings by time "
+    "(by default, each recording folder contains its gps*.csv file)",
+)
+parser.add_argument("--format", choices=batch.OUTPUT_FORMATS, default="csv")
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=os.cpu_count(),
+    help="Number of recordings processed in parallel",
+)
+parser.add_argument(
+    "--overwrite",
+    action="store_true",
+    help="Process recordings again even if they are in the cache",
+)
+parser.add_argument(
+    "--gaze-timeline",
+    choices=processing.GAZE_TIMELINES,
+    default="imu",
+    help="Compute world-relative gaze for every IMU sample, or only at the "
+    "scene camera frames (faster, with interpolated IMU orientation)",
+)
+parser.add_argument(
+    "--raw-gps",
+    action="store_true",
+    help="Interpolate the GPS samples as recorded, without removing outliers "
+    "and smoothing the track",
+)
+parser.add_argument(
+    "--max-gps-gap",
+    type=float,
+    default=processing.DEFAULT_MAX_GPS_GAP_S,
+    help="GPS dropouts longer than this many seconds are left as gaps in the "
+    "trajectory instead of being interpolated across",
+)
+parser.add_argument(
+    "--csv-engine",
+    choices=ingest.CSV_ENGINES,
+    default=ingest.CSV_ENGINE,
+    help="CSV parser: c uses the least memory, pyarrow (if installed) is faster",
+)
+
+parser.add_argument(
+    "--tile-url",
+    default=tiles.DEFAULT_TILE_URL,
+    help="URL template of the map tile server (see gps_viz_tool.py)",
+)
+parser.add_argument(
+    "--tile-cache",
+    default=tiles.DEFAULT_CACHE_DIR,
+    help="Folder in which map tiles are cached",
+)
+parser.add_argument(
+    "--tile-cache-size",
+    type=float,
+    default=tiles.DEFAULT_MAX_SIZE_MB,
+    help="Size limit of the tile cache in MB",
+)
+parser.add_argument(
+    "--no-tile-cache",
+    action="store_true",
+    help="Let the browser load the map tiles from the tile server directly",
+)
+
+# see gps_viz_tool.py
+if "GPS_VIZ_TOOL_ARGS" in os.environ:
+    args = parser.parse_args(shlex.split(os.environ["GPS_VIZ_TOOL_ARGS"]))
+else:
+    args = parser.parse_args()
+
+# map tiles are served from the on-disk cache (see gps_viz_tool.py)
+if args.no_tile_cache:
+    tile_cache = None
+    tile_layer_url = args.tile_url
+else:
+    tile_cache = tiles.TileCache(
+        args.tile_cache, args.tile_url, int(args.tile_cache_size * 1024 * 1024)
+    )
+    tile_layer_url = tiles.TILE_LAYER_URL
+
+# one color per recording, repeated if there are more recordings
+COLORS = [
+    "#1f77b4",
+    "#ff7f0e",
+    "#2ca02c",
+    "#d62728",
+    "#9467bd",
+    "#8c564b",
+    "#e377c2",
+    "#7f7f7f",
+    "#bcbd22",
+    "#17becf",
+]
+
+
+def preprocess_recordings():
+    """
+    Align every recording below input_dir that is not in the cache yet, in
+    parallel, and load the overviews of all cached recordings.
+
+    Returns:
+        list: A comparison.RecordingOverview per recording, sorted by name.
+    """
+    gps_ranges = batch.find_gps_ranges(args.gps_dir)
+
+    options = comparison.processing_options(
+        args.format, args.gaze_timeline, not args.raw_gps, args.max_gps_gap
+    )
+
+    # recordings are named by their path below input_dir, as in batch.py
+    recordings = []
+    jobs = []
+    for neon_folder_path in batch.find_recordings(args.input_dir):
+        name = os.path.relpath(neon_folder_path, args.input_dir)
+        aligned_path, _ = batch.output_paths(args.cache_dir, name, args.format)
+        overview_file = comparison.overview_path(args.cache_dir, name)
+        if args.overwrite or not comparison.is_cached(
+            overview_file, aligned_path, options
+        ):
+            gps_csv_path = batch.find_gps_csv(neon_folder_path, gps_ranges)
+            if gps_csv_path is None:
+                print(f"Skipping {name}: no GPS CSV found", file=sys.stderr)
+                continue
+            jobs.append(
+                (name, overview_file, neon_folder_path, gps_csv_path, aligned_path)
+            )
+        recordings.append((name, overview_file, aligned_path))
+
+    print(f"{len(jobs)} recordings to process, {len(recordings) - len(jobs)} cached")
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {
+            pool.submit(
+                comparison.prepare_recording,
+                overview_file,
+                options,
+                neon_folder_path,
+                gps_csv_path,
+                aligned_path,
+                args.format,
+                args.csv_engine,
+                args.gaze_timeline,
+                not args.raw_gps,
+                args.max_gps_gap,
+            ): name
+            for name, overview_file, neon_folder_path, gps_csv_path, aligned_path in jobs
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            prefix = f"[{done}/{len(jobs)}] {futures[future]}:"
+            try:
+                future.result()
+            except Exception as e:
+                print(f"{prefix} failed: {e!r}", file=sys.stderr)
+                traceback.print_exc()
+                continue
+            print(f"{prefix} done ({time.perf_counter() - start:.0f} s elapsed)")
+
+    # failed recordings have no overview, or one from other options
+    return [
+        comparison.RecordingOverview(name, overview_file, aligned_path)
+        for name, overview_file, aligned_path in recordings
+        if comparison.is_cached(overview_file, aligned_path, options)
+    ]
+
+
+overviews = preprocess_recordings()
+if not overviews:
+    print("Error: No recordings to compare.", file=sys.stderr)
+    sys.exit(1)
+
+colors = [COLORS[idx % len(COLORS)] for idx in range(len(overviews))]
+
+all_bounds = [bounds for bounds in (o.bounds() for o in overviews) if bounds]
+initial_bounds = (
+    [
+        [min(b[0][0] for b in all_bounds), min(b[0][1] for b in all_bounds)],
+        [max(b[1][0] for b in all_bounds), max(b[1][1] for b in all_bounds)],
+    ]
+    if all_bounds
+    else [[-60, -180], [75, 180]]
+)
+
+
+@functools.lru_cache(maxsize=2)
+def recording_detail(idx):
+    """
+    The full trajectory of a recording, read from the cache the first time
+    the recording is selected and zoomed in on (and kept for the last two).
+    """
+    return comparison.RecordingDetail(overviews[idx].aligned_path)
+
+
+def trajectory_lines(idx, zoom, bounds, selected):
+    """
+    The polylines of a recording for a map view: from its overview, or from
+    its full trajectory if it is selected and zoomed in beyond the overview.
+    """
+    if idx == selected and zoom is not None and zoom > comparison.OVERVIEW_ZOOM:
+        source = recording_detail(idx)
+    else:
+        source = overviews[idx]
+    return select_trajectory(
+        source.pyramid,
+        source.lats,
+        source.lons,
+        # before the map reports its zoom, the coarsest level is enough
+        min(PYRAMID_ZOOM_LEVELS) if zoom is None else zoom,
+        bounds,
+        0,
+        len(source) - 1,
+    )
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return (
+        f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+    )
+
+
+def comparison_table(shown, selected):
+    """
+    Summary statistics of the shown recordings, computed when they were
+    preprocessed, with the selected one in bold.
+    """
+
+    def value(summary, name, unit, decimals=1):
+        if summary is None or summary[name] is None:
+            return "-"
+        return f"{summary[name]:.{decimals}f}{unit}"
+
+    header = html.Tr(
+        [
+            html.Th(label)
+            for label in [
+                "Recording",
+                "Start (UTC)",
+                "Duration",
+                "Distance",
+                "Mean speed",
+                "Max speed",
+                "Gaze dispersion",
+            ]
+        ]
+    )
+    rows = []
+    for idx in shown:
+        overview = overviews[idx]
+        summary = overview.summary
+        start = (
+            "-"
+            if overview.start_ns is None
+            else datetime.datetime.fromtimestamp(
+                overview.start_ns / 1e9, datetime.timezone.utc
+            ).strftime("%Y-%m-%d %H:%M")
+        )
+        cells = [
+            html.Td(overview.name, style={"color": colors[idx]}),
+            html.Td(start),
+            html.Td(
+                "-" if summary is None else format_duration(summary["duration [s]"])
+            ),
+            html.Td(value(summary, "distance [m]", " m", 0)),
+            html.Td(value(summary, "mean speed [m/s]", " m/s")),
+            html.Td(value(summary, "max speed [m/s]", " m/s")),
+            html.Td(value(summary, "gaze azimuth dispersion [deg]", "°")),
+        ]
+        rows.append(
+            html.Tr(cells, style={"fontWeight": "bold"} if idx == selected else {})
+        )
+    return html.Table([header] + rows)
+
+
+app = dash.Dash(__name__)
+server = app.server
+app.layout = html.Div(
+    [
+        html.Div(
+            dl.Map(
+                attributionControl=False,
+                children=[
+                    dl.TileLayer(
+                        url=tile_layer_url,
+                        detectRetina=True,
+                    ),
+                    dl.LayerGroup(id="trajectories"),
+                ],
+                bounds=initial_bounds,
+                style={"height": "90vh"},
+                id="map-graph",
+            ),
+            style={"flex": 2},
+        ),
+        html.Div(
+            [
+                "Selected recording:",
+                dcc.Dropdown(
+                    id="selected-recording",
+                    options=[
+                        {"label": overview.name, "value": idx}
+                        for idx, overview in enumerate(overviews)
+                    ],
+                    value=None,
+                ),
+                html.H4("Recordings"),
+                dcc.Checklist(
+                    id="shown-recordings",
+                    options=[
+                        {
+                            "label": html.Span(
+                                overview.name, style={"color": colors[idx]}
+                            ),
+                            "value": idx,
+                        }
+                        for idx, overview in enumerate(overviews)
+                    ],
+                    value=list(range(len(overviews))),
+                    labelStyle={"display": "block"},
+                ),
+                html.Div(id="comparison-table", style={"paddingTop": "10px"}),
+            ],
+            style={
+                "flex": 1,
+                "padding": "10px",
+                "height": "90vh",
+                "overflowY": "auto",
+            },
+        ),
+    ],
+    style={"display": "flex"},
+)
+
+
+if tile_cache is not None:
+    tiles.add_tile_route(server, tile_cache)
+
+
+@app.callback(
+    Output("trajectories", "children"),
+    Input("map-graph", "zoom"),
+    Input("map-graph", "bounds"),
+    Input("shown-recordings", "value"),
+    Input("selected-recording", "value"),
+)
+def draw_trajectories(zoom, bounds, shown, selected):
+    # every recording only sends the simplification level that fits the
+    # zoom, and only the part of it in (or near) the current viewport
+    lines = []
+    for idx in sorted(shown or [], key=lambda idx: idx == selected):
+        positions = trajectory_lines(idx, zoom, bounds, selected)
+        if not positions:
+            continue
+        lines.append(
+            dl.Polyline(
+                positions=positions,
+                color=colors[idx],
+                weight=4 if idx == selected else 2,
+                opacity=1.0 if selected is None or idx == selected else 0.5,
+                children=[dl.Tooltip(content=overviews[idx].name)],
+                id=f"trajectory-{idx}",
+            )
+        )
+    return lines
+
+
+@app.callback(
+    Output("comparison-table", "children"),
+    Input("shown-recordings", "value"),
+    Input("selected-recording", "value"),
+)
+def update_comparison_table(shown, selected):
+    return comparison_table(sorted(shown or []), selected)
+
+
+if __name__ == "__main__":
+    app.run(debug=True, use_reloader=False)
@@ -0,0 +1,176 @@
+import json
+import os
+import threading
+
+import batch
+import numpy as np
+from segment_stats import SegmentStatistics
+from trajectory_lod import build_trajectory_pyramid
+
+# zoom level the overview trajectories are simplified for. When zoomed in
+# further, the selected recording is drawn from its full aligned table.
+OVERVIEW_ZOOM = 16
+
+# columns of the aligned table that are read for the selected recording
+DETAIL_COLUMNS = {
+    "timestamp [ns]": np.int64,
+    "latitude": np.float64,
+    "longitude": np.float64,
+}
+
+
+def overview_path(cache_dir, name):
+    return os.path.join(cache_dir, name, "overview.npz")
+
+
+def processing_options(output_format, gaze_timeline, clean_gps, max_gps_gap_s):
+    """
+    The options a recording was processed with, stored in its overview, so
+    that a cache built with other options is processed again.
+    """
+    return {
+        "format": output_format,
+        "gaze_timeline": gaze_timeline,
+        "clean_gps": bool(clean_gps),
+        "max_gps_gap_s": float(max_gps_gap_s),
+    }
+
+
+def is_cached(overview_file, aligned_path, options):
+    """
+    Whether a recording's overview and aligned table are in the cache, and
+    were processed with these options (see processing_options).
+    """
+    if not (os.path.exists(overview_file) and os.path.exists(aligned_path)):
+        return False
+    try:
+        with np.load(overview_file) as overview:
+            if "options" not in overview:
+                # cached before the options were stored
+                return False
+            return json.loads(str(overview["options"])) == options
+    except (OSError, ValueError):
+        return False
+
+
+def build_overview(lats, lons):
+    """
+    The trajectory simplified for OVERVIEW_ZOOM (see trajectory_lod), with a
+    NaN point between runs of valid positions, so that gaps stay gaps.
+
+    Returns:
+        tuple: (rows, latitudes, longitudes), where rows are the rows of the
+            kept points in the full trajectory, -1 for the gap markers.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    rows = build_trajectory_pyramid(lats, lons)[OVERVIEW_ZOOM]
+
+    # the ends of every run are kept (see build_trajectory_pyramid), so there
+    # is a gap after a kept point exactly when the next row is invalid
+    following = np.minimum(rows + 1, len(lats) - 1)
+    gap_after = ~(np.isfinite(lats[following]) & np.isfinite(lons[following]))
+    rows = np.insert(rows, np.flatnonzero(gap_after[:-1]) + 1, -1)
+
+    valid = rows >= 0
+    kept = np.maximum(rows, 0)
+    return (
+        rows,
+        np.where(valid, lats[kept], np.nan),
+        np.where(valid, lons[kept], np.nan),
+    )
+
+
+def prepare_recording(overview_file, options, *align_args):
+    """
+    Align a recording and write its table (see batch.align_recording), then
+    write its overview: the simplified trajectory, summary statistics and
+    the processing options. The overview is written last and marks the
+    recording as cached. Runs in a worker process.
+
+    Returns:
+        dict: The summary statistics (see SegmentStatistics.segment).
+    """
+    world_gaze_gps_imu_df, _ = batch.align_recording(*align_args)
+    timestamps_ns = world_gaze_gps_imu_df["timestamp [ns]"].values
+    lats = world_gaze_gps_imu_df["latitude"].values
+    lons = world_gaze_gps_imu_df["longitude"].values
+
+    # headings and gaze directions as drawn on the map, as in gps_viz_tool.py
+    summary = SegmentStatistics(
+        timestamps_ns,
+        lats,
+        lons,
+        world_gaze_gps_imu_df["yaw [deg]"].to_numpy(np.float64) + 90,
+        world_gaze_gps_imu_df["gaze azi world [deg]"].to_numpy(np.float64) + 90,
+    ).segment(0, len(timestamps_ns) - 1)
+
+    rows, overview_lats, overview_lons = build_overview(lats, lons)
+    # np.savez adds .npz to names without it. Unique per process and thread,
+    # as several servers may process the same recording at once.
+    tmp_path = f"{overview_file}.{os.getpid()}-{threading.get_ident()}.tmp.npz"
+    np.savez(
+        tmp_path,
+        rows=rows.astype(np.int32),
+        latitude=overview_lats,
+        longitude=overview_lons,
+        start_ns=timestamps_ns[:1],
+        summary=json.dumps(summary),
+        options=json.dumps(options),
+    )
+    os.replace(tmp_path, overview_file)
+    return summary
+
+
+class RecordingOverview:
+    """
+    What the comparison view keeps in memory for a recording: its simplified
+    trajectory (see build_overview) with a level-of-detail pyramid over it,
+    and its summary statistics. The full aligned table stays on disk.
+    """
+
+    def __init__(self, name, overview_file, aligned_path):
+        self.name = name
+        self.aligned_path = aligned_path
+        with np.load(overview_file) as overview:
+            self.rows = overview["rows"]
+            self.lats = overview["latitude"]
+            self.lons = overview["longitude"]
+            self.start_ns = (
+                int(overview["start_ns"][0]) if overview["start_ns"].size else None
+            )
+            self.summary = json.loads(str(overview["summary"]))
+        self.pyramid = build_trajectory_pyramid(self.lats, self.lons)
+
+    def __len__(self):
+        return len(self.lats)
+
+    def bounds(self):
+        """
+        [[south, west], [north, east]] of the trajectory, or None if it has
+        no positions.
+        """
+        if not np.isfinite(self.lats).any():
+            return None
+        return [
+            [float(np.nanmin(self.lats)), float(np.nanmin(self.lons))],
+            [float(np.nanmax(self.lats)), float(np.nanmax(self.lons))],
+        ]
+
+
+class RecordingDetail:
+    """
+    The full trajectory of a recording, read from its aligned table when it
+    is needed, with a level-of-detail pyramid over it.
+    """
+
+    def __init__(self, aligned_path):
+        aligned_df = batch.read_table(aligned_path, DETAIL_COLUMNS)
+        self.timestamps_ns = aligned_df["timestamp [ns]"].to_numpy()
+        self.lats = aligned_df["latitude"].to_numpy()
+        self.lons = aligned_df["longitude"].to_numpy()
+        del aligned_df
+        self.pyramid = build_trajectory_pyramid(self.lats, self.lons)
+
+    def __len__(self):
+        return len(self.lats)
@@ -0,0 +1,384 @@
+"""
+Export a segment of an aligned recording as GPX, GeoJSON or Parquet.
+
+The segment is written in chunks of rows, straight from the per-frame
+arrays of the aligned table, so exporting a whole multi-hour recording needs
+no more memory than exporting a minute of it. The Visualization Tool serves
+the selected segment at /export/<format> (see gps_viz_tool.py), and this
+script exports from the command line:
+
+    python export.py neon_folder gps_csv output.gpx [--start-event 2 --end-event 5]
+"""
+
+import argparse
+import io
+import math
+import os
+import sys
+
+import numpy as np
+
+EXPORT_FORMATS = ["gpx", "geojson", "parquet"]
+
+MEDIA_TYPES = {
+    "gpx": "application/gpx+xml",
+    "geojson": "application/geo+json",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# exported columns of the aligned table, with their GPX extension element
+EXPORT_COLUMNS = {
+    "timestamp [ns]": None,
+    "latitude": None,
+    "longitude": None,
+    "yaw [deg]": "yaw",
+    "gaze ele world [deg]": "gaze_elevation_world",
+    "gaze azi world [deg]": "gaze_azimuth_world",
+    "elevation [deg]": "gaze_elevation",
+    "azimuth [deg]": "gaze_azimuth",
+}
+
+CHUNK_ROWS = 10_000
+
+
+def segment_columns(aligned_df):
+    """
+    The exported columns of an aligned table (see
+    processing.open_and_populate_data) as NumPy arrays, without copying them.
+    """
+    return {
+        column: aligned_df[column].to_numpy()
+        for column in EXPORT_COLUMNS
+        if column in aligned_df
+    }
+
+
+def segment_filename(recording_name, start, end, export_format):
+    return f"{recording_name}_frames-{start}-{end}.{export_format}"
+
+
+def iter_chunks(columns, start, end, chunk_rows=CHUNK_ROWS):
+    """
+    The rows start to end (inclusive) in chunks of at most chunk_rows rows.
+
+    Yields:
+        dict: Maps column name -> a slice (a view, not a copy) of its array.
+    """
+    for chunk_start in range(start, end + 1, chunk_rows):
+        chunk_end = min(chunk_start + chunk_rows, end + 1)
+        yield {
+            column: values[chunk_start:chunk_end] for column, values in columns.items()
+        }
+
+
+def utc_times(timestamps_ns):
+    """
+    ISO 8601 UTC times (to the millisecond) of nanosecond timestamps.
+    """
+    return [
+        f"{time}Z"
+        for time in np.datetime_as_string(
+            np.asarray(timestamps_ns, dtype="datetime64[ns]"), unit="ms"
+        ).tolist()
+    ]
+
+
+def _angle_texts(chunk, template, null):
+    # the exported angles of every row of a chunk, formatted with
+    # template.format(name, column, value) (or null.format for NaN) and
+    # joined per row. Formatting column by column keeps it fast.
+    texts = []
+    for column, name in EXPORT_COLUMNS.items():
+        if name is None or column not in chunk:
+            continue
+        values = np.round(chunk[column].astype(np.float64), 2).tolist()
+        texts.append(
+            [
+                (
+                    null.format(name=name, column=column)
+                    if math.isnan(value)
+                    else template.format(name=name, column=column, value=value)
+                )
+                for value in values
+            ]
+        )
+    if not texts:
+        return [""] * len(chunk["latitude"])
+    return ["".join(parts) for parts in zip(*texts)]
+
+
+def _positions(chunk):
+    # latitude, longitude and validity of the rows of a chunk
+    lats = chunk["latitude"].astype(np.float64)
+    lons = chunk["longitude"].astype(np.float64)
+    valid = np.isfinite(lats) & np.isfinite(lons)
+    return lats.tolist(), lons.tolist(), valid.tolist()
+
+
+def gpx_chunks(columns, start, end, chunk_rows=CHUNK_ROWS, name="Neon recording"):
+    """
+    The rows start to end as a GPX 1.1 track, in pieces of text. Each run of
+    frames with a position becomes a track segment, frames in GPS gaps are
+    left out. The heading and gaze angles are kept as track point extensions.
+    """
+    yield (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<gpx version="1.1" creator="Neon GPS Visualization Tool" '
+        'xmlns="http://www.topografix.com/GPX/1/1" '
+        'xmlns:neon="urn:neon-gps-visualization-tool">\n'
+        f"<trk><name>{_escape_xml(name)}</name>\n"
+    )
+
+    in_segment = False
+    for chunk in iter_chunks(columns, start, end, chunk_rows):
+        lats, lons, valid = _positions(chunk)
+        times = utc_times(chunk["timestamp [ns]"])
+        extensions = _angle_texts(chunk, "<neon:{name}>{value}</neon:{name}>", "")
+
+        lines = []
+        for row, is_valid in enumerate(valid):
+            if not is_valid:
+                if in_segment:
+                    lines.append("</trkseg>\n")
+                    in_segment = False
+                continue
+            if not in_segment:
+                lines.append("<trkseg>\n")
+                in_segment = True
+            lines.append(
+                f'<trkpt lat="{lats[row]:.7f}" lon="{lons[row]:.7f}">'
+                f"<time>{times[row]}</time>"
+                f"<extensions>{extensions[row]}</extensions></trkpt>\n"
+            )
+        yield "".join(lines)
+
+    yield ("</trkseg>\n" if in_segment else "") + "</trk>\n</gpx>\n"
+
+
+def geojson_chunks(columns, start, end, chunk_rows=CHUNK_ROWS):
+    """
+    The rows start to end as a GeoJSON FeatureCollection of points, in
+    pieces of text. Every frame with a position is a feature, with its
+    timestamp and heading and gaze angles as properties. The nanosecond
+    timestamp is a string, as JSON numbers above 2^53 lose precision in
+    JavaScript.
+    """
+    yield '{"type": "FeatureCollection", "features": [\n'
+
+    separator = ""
+    for chunk in iter_chunks(columns, start, end, chunk_rows):
+        lats, lons, valid = _positions(chunk)
+        timestamps = chunk["timestamp [ns]"].tolist()
+        times = utc_times(chunk["timestamp [ns]"])
+        properties = _angle_texts(chunk, ', "{column}": {value}', ', "{column}": null')
+
+        lines = []
+        for row, is_valid in enumerate(valid):
+            if not is_valid:
+                continue
+            lines.append(
+                f'{separator}{{"type": "Feature", "geometry": {{"type": "Point", '
+                f'"coordinates": [{lons[row]:.7f}, {lats[row]:.7f}]}}, '
+                f'"properties": {{"timestamp [ns]": "{timestamps[row]}", '
+                f'"time": "{times[row]}"{properties[row]}}}}}'
+            )
+            separator = ",\n"
+        yield "".join(lines)
+
+    yield "\n]}\n"
+
+
+def parquet_chunks(columns, start, end, chunk_rows=CHUNK_ROWS):
+    """
+    The rows start to end as a Parquet file, in pieces of bytes, with one
+    row group per chunk. All rows are kept, NaN where there is no position.
+    Requires pyarrow.
+    """
+    # optional dependency, only needed for Parquet
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _ChunkSink()
+    writer = None
+    for chunk in iter_chunks(columns, start, end, chunk_rows):
+        table = pa.table(chunk)
+        if writer is None:
+            writer = pq.ParquetWriter(sink, table.schema)
+        writer.write_table(table)
+        yield sink.drain()
+
+    if writer is None:
+        # an empty segment still gets a valid (empty) file
+        writer = pq.ParquetWriter(
+            sink,
+            pa.schema(
+                [
+                    (column, pa.from_numpy_dtype(values.dtype))
+                    for column, values in columns.items()
+                ]
+            ),
+        )
+    writer.close()
+    yield sink.drain()
+
+
+def export_chunks(columns, start, end, export_format, chunk_rows=CHUNK_ROWS):
+    """
+    The rows start to end in an export format, in pieces of bytes, e.g., to
+    stream as an HTTP response.
+    """
+    if export_format == "parquet":
+        yield from parquet_chunks(columns, start, end, chunk_rows)
+    elif export_format == "gpx":
+        for text in gpx_chunks(columns, start, end, chunk_rows):
+            yield text.encode()
+    elif export_format == "geojson":
+        for text in geojson_chunks(columns, start, end, chunk_rows):
+            yield text.encode()
+    else:
+        raise ValueError(f"Unknown export format: {export_format}")
+
+
+def write_segment(path, columns, start, end, export_format, chunk_rows=CHUNK_ROWS):
+    # write to a temporary file first, so that an interrupted export never
+    # leaves a truncated file that looks finished (as in batch.write_table)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        for data in export_chunks(columns, start, end, export_format, chunk_rows):
+            f.write(data)
+    os.replace(tmp_path, path)
+
+
+class _ChunkSink(io.RawIOBase):
+    # a write-only file that collects what is written until it is drained,
+    # so the Parquet writer's output can be streamed row group by row group
+
+    def __init__(self):
+        super().__init__()
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def _escape_xml(text):
+    return str(text).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("neon_folder_path", help="Neon Timeseries CSV folder path")
+    parser.add_argument("gps_csv_path", help="GPS CSV file path")
+    parser.add_argument("output_path", help="File to write the segment to")
+    parser.add_argument(
+        "--format",
+        choices=EXPORT_FORMATS,
+        default=None,
+        help="Export format (by default, from the output file extension)",
+    )
+    parser.add_argument(
+        "--start-event",
+        type=int,
+        default=None,
+        help="Number of the event the segment starts at, as in the tool's "
+        "event list (1 is the first event; by default, the first frame)",
+    )
+    parser.add_argument(
+        "--end-event",
+        type=int,
+        default=None,
+        help="Number of the event the segment ends at (by default, the last frame)",
+    )
+    # as in gps_viz_tool.py, spelled out as processing is imported later
+    parser.add_argument("--gaze-timeline", choices=["imu", "scene"], default="imu")
+    parser.add_argument(
+        "--raw-gps",
+        action="store_true",
+        help="Export the GPS samples as recorded, without removing outliers "
+        "and smoothing the track",
+    )
+    parser.add_argument(
+        "--max-gps-gap",
+        type=float,
+        default=10.0,
+        help="GPS dropouts longer than this many seconds are left as gaps",
+    )
+    parser.add_argument(
+        "--chunk-rows",
+        type=int,
+        default=CHUNK_ROWS,
+        help="Rows written at a time (and per Parquet row group)",
+    )
+    args = parser.parse_args(argv)
+
+    export_format = args.format
+    if export_format is None:
+        export_format = os.path.splitext(args.output_path)[1].lstrip(".").lower()
+        if export_format not in EXPORT_FORMATS:
+            parser.error(
+                "cannot tell the format from the output file extension, pass --format"
+            )
+    if export_format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            print(
+                "Error: Parquet export requires pyarrow (pip install pyarrow).",
+                file=sys.stderr,
+            )
+            return 1
+
+    # processing imports SciPy, which the tool only loads once it is running
+    import alignment
+    import processing
+
+    aligned_df, events_df = processing.open_and_populate_data(
+        args.neon_folder_path,
+        args.gps_csv_path,
+        gaze_timeline=args.gaze_timeline,
+        clean_gps=not args.raw_gps,
+        max_gps_gap_s=args.max_gps_gap,
+    )
+    timeline = alignment.FrameTimeline(aligned_df["timestamp [ns]"].values, {})
+
+    event_ns = events_df["timestamp [ns]"].values
+    for event in (args.start_event, args.end_event):
+        if event is not None and not 1 <= event <= len(event_ns):
+            parser.error(f"there are {len(event_ns)} events, numbered from 1")
+    start, end = timeline.window(
+        event_ns[args.start_event - 1] if args.start_event else timeline.start_ns,
+        (
+            event_ns[args.end_event - 1]
+            if args.end_event
+            else timeline.timestamps_ns[-1]
+        ),
+    )
+
+    write_segment(
+        args.output_path,
+        segment_columns(aligned_df),
+        start,
+        end,
+        export_format,
+        args.chunk_rows,
+    )
+    print(f"Wrote frames {start} to {end} to {args.output_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+import base64
+import struct
+import zlib
+
+import numpy as np
+from spatial_index import EARTH_RADIUS_M, unproject_from_local_meters
+
+# meters per degree of latitude
+METERS_PER_DEGREE = np.deg2rad(1.0) * EARTH_RADIUS_M
+
+
+def project_gaze(lats, lons, gaze_azimuths, distance_m):
+    """
+    The points distance_m away from each position in the gaze direction.
+
+    Args:
+        lats (np.ndarray): Latitudes of the wearer.
+        lons (np.ndarray): Longitudes of the wearer.
+        gaze_azimuths (np.ndarray): Gaze directions in the world as drawn on
+            the map, in degrees counterclockwise from east.
+        distance_m (float): How far away gaze is placed, in meters.
+
+    Returns:
+        tuple: (latitudes, longitudes) of the gazed-at points.
+    """
+    gaze_rad = np.deg2rad(np.asarray(gaze_azimuths, dtype=np.float64))
+    return unproject_from_local_meters(
+        distance_m * np.cos(gaze_rad),
+        distance_m * np.sin(gaze_rad),
+        np.asarray(lats, dtype=np.float64),
+        np.asarray(lons, dtype=np.float64),
+    )
+
+
+class GazeHeatmap:
+    """
+    Where the wearer looked along the route: the gaze direction of every
+    frame projected distance_m out from the wearer's position, counted in a
+    grid of cells cell_size_m wide.
+
+    Every frame is assigned its cell once. The counts of every occupied
+    cell are then summed up per block of block_rows frames, and kept as
+    running totals (cumulative grids), so the heatmap of any window of
+    frames is the difference of two totals plus the frames at the window
+    edges, without going over all frames in it again.
+    """
+
+    def __init__(
+        self,
+        lats,
+        lons,
+        gaze_azimuths,
+        distance_m=15.0,
+        cell_size_m=5.0,
+        max_image_size=2048,
+        block_rows=8192,
+    ):
+        """
+        Args:
+            lats (np.ndarray): Latitude of every frame (NaN if unknown).
+            lons (np.ndarray): Longitude of every frame (NaN if unknown).
+            gaze_azimuths (np.ndarray): Gaze direction in the world of every
+                frame, in degrees counterclockwise from east (NaN if unknown).
+            distance_m (float): How far away gaze is placed, in meters.
+            cell_size_m (float): Width of the grid cells, in meters. Cells
+                are made larger if the grid would otherwise be more than
+                max_image_size cells across.
+            block_rows (int): Frames per block of the running totals.
+        """
+        target_lats, target_lons = project_gaze(lats, lons, gaze_azimuths, distance_m)
+        valid = np.isfinite(target_lats) & np.isfinite(target_lons)
+        self.block_rows = block_rows
+
+        if valid.any():
+            south, north = target_lats[valid].min(), target_lats[valid].max()
+            west, east = target_lons[valid].min(), target_lons[valid].max()
+        else:
+            south = north = west = east = 0.0
+        mid_lat_cos = np.cos(np.deg2rad((south + north) / 2))
+        cell_size_m = max(
+            cell_size_m,
+            (north - south) * METERS_PER_DEGREE / max_image_size,
+            (east - west) * METERS_PER_DEGREE * mid_lat_cos / max_image_size,
+        )
+        lat_step = cell_size_m / METERS_PER_DEGREE
+        lon_step = cell_size_m / (METERS_PER_DEGREE * mid_lat_cos)
+
+        # image rows go from north to south
+        self.shape = (
+            int((north - south) / lat_step) + 1,
+            int((east - west) / lon_step) + 1,
+        )
+        self.bounds = [
+            [float(north - self.shape[0] * lat_step), float(west)],
+            [float(north), float(west + self.shape[1] * lon_step)],
+        ]
+
+        rows = np.minimum(
+            ((north - target_lats[valid]) / lat_step).astype(np.int64),
+            self.shape[0] - 1,
+        )
+        cols = np.minimum(
+            ((target_lons[valid] - west) / lon_step).astype(np.int64),
+            self.shape[1] - 1,
+        )
+        # only occupied cells are counted, a route covers few of the grid's
+        self.occupied, cells = np.unique(
+            rows * self.shape[1] + cols, return_inverse=True
+        )
+        cell_count = len(self.occupied)
+
+        # cell of every frame, cell_count for frames without one
+        self._cells = np.full(len(valid), cell_count, dtype=np.int32)
+        self._cells[valid] = cells
+
+        block_count = -(-len(self._cells) // block_rows)
+        blocks = np.arange(len(self._cells)) // block_rows
+        block_counts = np.bincount(
+            blocks * (cell_count + 1) + self._cells,
+            minlength=block_count * (cell_count + 1),
+        ).reshape(block_count, cell_count + 1)[:, :cell_count]
+        # totals[k] counts the frames of the first k blocks
+        self._totals = np.zeros((block_count + 1, cell_count), dtype=np.uint32)
+        np.cumsum(block_counts, axis=0, out=self._totals[1:])
+
+    def __len__(self):
+        return len(self._cells)
+
+    def counts(self, start, end):
+        """
+        Number of frames start to end (inclusive) gazing at each occupied cell.
+
+        Returns:
+            np.ndarray: Counts in the order of self.occupied.
+        """
+        start = max(int(start), 0)
+        end = min(int(end), len(self) - 1)
+        cell_count = len(self.occupied)
+        if end < start:
+            return np.zeros(cell_count, dtype=np.int64)
+
+        def frame_counts(first, stop):
+            return np.bincount(self._cells[first:stop], minlength=cell_count + 1)[
+                :cell_count
+            ]
+
+        # whole blocks from the running totals, the partial ones at the edges
+        first_block = -(-start // self.block_rows)
+        stop_block = (end + 1) // self.block_rows
+        if stop_block <= first_block:
+            return frame_counts(start, end + 1)
+        return (
+            self._totals[stop_block].astype(np.int64)
+            - self._totals[first_block]
+            + frame_counts(start, first_block * self.block_rows)
+            + frame_counts(stop_block * self.block_rows, end + 1)
+        )
+
+    def image(self, start, end):
+        """
+        The heatmap of frames start to end as an RGBA image covering
+        self.bounds: from transparent over yellow to opaque red, on a square
+        root scale of the counts.
+        """
+        counts = self.counts(start, end)
+        grid = np.zeros(self.shape[0] * self.shape[1])
+        grid[self.occupied] = counts
+        level = np.sqrt(grid / max(grid.max(), 1)).reshape(self.shape)
+
+        image = np.zeros(self.shape + (4,), dtype=np.uint8)
+        image[..., 0] = 255
+        image[..., 1] = np.round(255 * (1 - level))
+        image[..., 3] = np.where(level > 0, np.round(255 * (0.3 + 0.7 * level)), 0)
+        return image
+
+    def png_data_url(self, start, end):
+        """
+        The image of frames start to end as a PNG data URL, for
+        dl.ImageOverlay.
+        """
+        png = encode_png(self.image(start, end))
+        return "data:image/png;base64," + base64.b64encode(png).decode()
+
+
+def encode_png(image):
+    """
+    Encode an (height, width, 4) uint8 RGBA array as a PNG file.
+    """
+    height, width, _ = image.shape
+    # every scanline starts with its filter type, 0 (none)
+    scanlines = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    scanlines[:, 1:] = image.reshape(height, width * 4)
+
+    def chunk(kind, data):
+        return (
+            struct.pack(">I", len(data))
+            + kind
+            + data
+            + struct.pack(">I", zlib.crc32(kind + data))
+        )
+
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        # 8 bit RGBA, no interlacing
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(scanlines.tobytes(), 6))
+        + chunk(b"IEND", b"")
+    )
@@ -0,0 +1,207 @@
+import csv
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "gps-viz-tool", "geocode.sqlite"
+)
+
+# Nominatim's usage policy allows at most one request per second
+NOMINATIM_MIN_INTERVAL_S = 1.0
+
+
+class GeocodeCache:
+    """
+    Persistent on-disk cache of reverse geocoding results, keyed by backend
+    name and coordinates rounded to `precision` decimals (5 decimals is ~1 m).
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, precision=5):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.precision = precision
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS reverse_geocode ("
+            "backend TEXT, lat REAL, lon REAL, address TEXT, "
+            "PRIMARY KEY (backend, lat, lon))"
+        )
+        self._connection.commit()
+
+    def key(self, lat, lon):
+        return round(float(lat), self.precision), round(float(lon), self.precision)
+
+    def get(self, backend, lat, lon):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT address FROM reverse_geocode "
+                "WHERE backend = ? AND lat = ? AND lon = ?",
+                (backend, *self.key(lat, lon)),
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def put(self, backend, lat, lon, address):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO reverse_geocode VALUES (?, ?, ?, ?)",
+                (backend, *self.key(lat, lon), address),
+            )
+            self._connection.commit()
+
+    def close(self):
+        self._connection.close()
+
+
+class RateLimiter:
+    """
+    Thread-safe limiter that spaces out the start of calls by min_interval
+    seconds, while still allowing several calls to be in flight at once.
+    """
+
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.min_interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class NominatimBackend:
+    """
+    Reverse geocoding via OpenStreetMap's Nominatim service (requires network).
+
+    geopy is only imported here, so it is not needed for the offline backend.
+    """
+
+    name = "nominatim"
+    min_interval = NOMINATIM_MIN_INTERVAL_S
+
+    def __init__(self, user_agent="my_reverse_geocoder", timeout=10):
+        from geopy.geocoders import Nominatim
+
+        self._geolocator = Nominatim(user_agent=user_agent, timeout=timeout)
+
+    def reverse(self, lat, lon):
+        location = self._geolocator.reverse((lat, lon))
+        return None if location is None else location.address
+
+
+class OfflineBackend:
+    """
+    Reverse geocoding without network access.
+
+    With a gazetteer (a CSV file with name, latitude and longitude columns),
+    the name of the nearest place within max_distance_m is returned. Without
+    one, or if no place is close enough, the rounded coordinates are used as
+    the address.
+
+    spatial_index (and with it SciPy) is only imported with a gazetteer.
+    """
+
+    min_interval = 0.0
+
+    def __init__(self, gazetteer_csv=None, max_distance_m=250.0):
+        self.name = "offline" if gazetteer_csv is None else f"offline:{gazetteer_csv}"
+        self.max_distance_m = max_distance_m
+        self._names = []
+        self._spatial_index = None
+
+        if gazetteer_csv is not None:
+            from spatial_index import build_spatial_index
+
+            lats = []
+            lons = []
+            with open(gazetteer_csv, newline="") as f:
+                for row in csv.DictReader(f):
+                    self._names.append(row["name"])
+                    lats.append(float(row["latitude"]))
+                    lons.append(float(row["longitude"]))
+            self._spatial_index = build_spatial_index(lats, lons)
+
+    def reverse(self, lat, lon):
+        if self._spatial_index is not None:
+            from spatial_index import query_nearest
+
+            place, distance = query_nearest(self._spatial_index, lat, lon)
+            if place is not None and distance <= self.max_distance_m:
+                return self._names[place]
+        return f"{lat:.5f}, {lon:.5f}"
+
+
+def create_backend(name, gazetteer_csv=None):
+    if name == "nominatim":
+        return NominatimBackend()
+    elif name == "offline":
+        return OfflineBackend(gazetteer_csv)
+    raise ValueError(f"Unknown geocoding backend: {name}")
+
+
+def reverse_geocode_many(coords, backend, cache=None, max_workers=4):
+    """
+    Reverse geocode many coordinates concurrently.
+
+    Cached coordinates are answered from disk, and only the rest are sent
+    to the backend, with request starts spaced out to respect its rate limit.
+    New results are written to the cache as soon as they arrive, so an
+    interrupted run does not have to repeat them.
+
+    Args:
+        coords (list): (lat, lon) pairs.
+        backend: A NominatimBackend, OfflineBackend or any object with a
+            name, a min_interval (seconds) and a reverse(lat, lon) method.
+        cache (GeocodeCache): Optional persistent cache.
+        max_workers (int): Number of lookups that may be in flight at once.
+
+    Returns:
+        list: An address (or None, if the lookup failed) for every pair.
+    """
+    addresses = [None] * len(coords)
+
+    pending = {}
+    for i, (lat, lon) in enumerate(coords):
+        cached = None if cache is None else cache.get(backend.name, lat, lon)
+        if cached is not None:
+            addresses[i] = cached
+        else:
+            key = (lat, lon) if cache is None else cache.key(lat, lon)
+            pending.setdefault(key, []).append(i)
+
+    if not pending:
+        return addresses
+
+    limiter = RateLimiter(backend.min_interval)
+
+    def lookup(lat, lon):
+        limiter.wait()
+        return backend.reverse(lat, lon)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(lookup, *coords[indices[0]]): indices
+            for indices in pending.values()
+        }
+        for future in as_completed(futures):
+            indices = futures[future]
+            lat, lon = coords[indices[0]]
+            try:
+                address = future.result()
+            except Exception as e:
+                print(f"Could not reverse geocode ({lat}, {lon}): {e}")
+                continue
+
+            if address is not None and cache is not None:
+                cache.put(backend.name, lat, lon, address)
+            for i in indices:
+                addresses[i] = address
+
+    return addresses
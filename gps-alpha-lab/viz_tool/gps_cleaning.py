@@ -0,0 +1,266 @@
+import math
+
+import numpy as np
+from spatial_index import project_to_local_meters, unproject_from_local_meters
+
+
+class GpsCleaner:
+    """
+    Removes GPS outliers and smooths the track, chunk by chunk.
+
+    Samples more than max_speed_m_s (times the time since the previous
+    sample) away from where the filter predicts the wearer, e.g. multipath
+    spikes, are rejected. If several samples in a row are rejected, the
+    wearer really did move (or the filter was off, e.g. after a dropout), so
+    the filter restarts at the latest of them that agree with each other,
+    with the velocity they move at, and keeps those.
+    The remaining samples go through a constant-velocity Kalman filter and a
+    Rauch-Tung-Striebel (RTS) smoother.
+
+    The filter state is carried from one chunk to the next. The smoother
+    needs later samples, so the last `lag` samples are held back until more
+    data arrives (or flush is called). Processing everything as one chunk and
+    flushing gives the exact RTS smoother; smaller chunks (e.g., while a
+    recording is still being written) give a fixed-lag smoother.
+
+    Both axes (east and north, in meters) have the same noise and are
+    measured at the same times, so they share one covariance, and the
+    filter runs on plain floats.
+    """
+
+    def __init__(
+        self,
+        max_speed_m_s=15.0,
+        measurement_noise_m=4.0,
+        acceleration_noise_m_s2=0.5,
+        max_rejections=5,
+        lag=20,
+    ):
+        self.max_speed_m_s = max_speed_m_s
+        self.measurement_variance = measurement_noise_m**2
+        self.acceleration_variance = acceleration_noise_m_s2**2
+        self.max_rejections = max_rejections
+        self.lag = lag
+
+        self._origin = None
+        self._state = None
+        # (timestamp, east, north) of the samples rejected in a row
+        self._rejected = []
+        self._chain_length = 0
+        # filtered samples that may still change with later data
+        self._pending = []
+
+    def process(self, timestamps_ns, lats, lons):
+        """
+        Add GPS samples.
+
+        Returns:
+            tuple: (timestamps [ns], latitudes, longitudes) of the cleaned
+                samples that became final. Rejected samples are left out.
+        """
+        timestamps_ns = np.asarray(timestamps_ns, dtype=np.int64)
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        valid = np.isfinite(lats) & np.isfinite(lons)
+        timestamps_ns, lats, lons = timestamps_ns[valid], lats[valid], lons[valid]
+
+        if len(timestamps_ns) and self._origin is None:
+            self._origin = (float(lats[0]), float(lons[0]))
+        if len(timestamps_ns):
+            points = project_to_local_meters(lats, lons, *self._origin)
+            for timestamp, (east, north) in zip(timestamps_ns.tolist(), points):
+                self._filter(timestamp, float(east), float(north))
+
+        return self._emit(len(self._pending) - self.lag)
+
+    @property
+    def latest(self):
+        """
+        The filtered (not yet smoothed) position of the latest kept sample,
+        as (latitude, longitude), or None before the first sample.
+        """
+        if self._state is None:
+            return None
+        _, x, _, y, _, _, _, _ = self._state
+        lats, lons = unproject_from_local_meters(
+            np.array([x]), np.array([y]), *self._origin
+        )
+        return float(lats[0]), float(lons[0])
+
+    def flush(self):
+        """
+        Smooth and return all samples that are still held back.
+        """
+        return self._emit(len(self._pending))
+
+    def _filter(self, timestamp, east, north):
+        if self._state is None:
+            self._start(timestamp, east, north)
+            return
+
+        t, x, vx, y, vy, p00, p01, p11 = self._state
+        dt = (timestamp - t) / 1e9
+        if dt <= 0:
+            # out of order or repeated, the interpolation needs increasing times
+            return
+
+        # predict
+        px = x + vx * dt
+        py = y + vy * dt
+        q = self.acceleration_variance
+        pp00 = p00 + 2 * dt * p01 + dt * dt * p11 + q * dt**3 / 3
+        pp01 = p01 + dt * p11 + q * dt * dt / 2
+        pp11 = p11 + q * dt
+
+        # speed gate, against the predicted position
+        if math.hypot(east - px, north - py) / dt > self.max_speed_m_s:
+            self._rejected.append((timestamp, east, north))
+            if len(self._rejected) >= self.max_rejections:
+                self._restart()
+            return
+        self._rejected = []
+
+        # update
+        s = pp00 + self.measurement_variance
+        k0 = pp00 / s
+        k1 = pp01 / s
+        predicted = (px, vx, py, vy)
+        self._state = (
+            timestamp,
+            px + k0 * (east - px),
+            vx + k1 * (east - px),
+            py + k0 * (north - py),
+            vy + k1 * (north - py),
+            (1 - k0) * pp00,
+            (1 - k0) * pp01,
+            pp11 - k1 * pp01,
+        )
+        self._pending.append((self._state, predicted, (pp00, pp01, pp11, dt)))
+        self._chain_length += 1
+
+    def _restart(self):
+        # the latest rejected samples that agree with each other, i.e. move
+        # at a steady velocity (every one is within the speed gate of where
+        # the ones after it were heading from)
+        run = self._rejected[-2:]
+        for sample in reversed(self._rejected[:-2]):
+            if not self._agrees(sample, run[0], self._velocity(run[0], run[1])):
+                break
+            run.insert(0, sample)
+        self._rejected = []
+
+        if len(run) > 1:
+            velocity = self._velocity(run[0], run[-1])
+        else:
+            # from the filtered position to the one rejected sample
+            t, x, _, y, _, _, _, _ = self._state
+            velocity = self._velocity((t, x, y), run[0])
+
+        if self._chain_length == 1 and self._pending:
+            t, x, _, y = self._pending[-1][0][:4]
+            if not self._agrees((t, x, y), run[0], velocity):
+                # the restart is after a single sample that the following
+                # ones don't agree with, which was more likely the outlier
+                self._pending.pop()
+        self._start(*run[0], *velocity)
+        for sample in run[1:]:
+            self._filter(*sample)
+
+    @staticmethod
+    def _velocity(first, last):
+        dt = (last[0] - first[0]) / 1e9
+        if dt <= 0:
+            return 0.0, 0.0
+        return (last[1] - first[1]) / dt, (last[2] - first[2]) / dt
+
+    def _agrees(self, sample, later, velocity):
+        # whether a sample, moved on at velocity, is within the speed gate
+        # of a later sample
+        dt = (later[0] - sample[0]) / 1e9
+        if dt <= 0:
+            return False
+        return (
+            math.hypot(
+                later[1] - sample[1] - velocity[0] * dt,
+                later[2] - sample[2] - velocity[1] * dt,
+            )
+            / dt
+            <= self.max_speed_m_s
+        )
+
+    def _start(self, timestamp, east, north, east_speed=0.0, north_speed=0.0):
+        # with the position known to the measurement noise, and the velocity
+        # (by default at rest) to about a walking/cycling speed (5 m/s)
+        self._rejected = []
+        self._chain_length = 1
+        self._state = (
+            timestamp,
+            east,
+            east_speed,
+            north,
+            north_speed,
+            self.measurement_variance,
+            0.0,
+            25.0,
+        )
+        # a restart breaks the smoothing chain, nothing is predicted into it
+        self._pending.append((self._state, None, None))
+
+    def _emit(self, count):
+        empty = (np.empty(0, dtype=np.int64), np.empty(0), np.empty(0))
+        if count <= 0:
+            return empty
+
+        # RTS backward pass over all pending samples, from the newest
+        smoothed = [None] * len(self._pending)
+        next_smoothed = None
+        for idx in range(len(self._pending) - 1, -1, -1):
+            (t, x, vx, y, vy, p00, p01, p11), _, _ = self._pending[idx]
+            if next_smoothed is not None:
+                # gain C = P F^T inv(P_predicted) of the next step
+                predicted, covariance = self._pending[idx + 1][1:]
+                pp00, pp01, pp11, dt = covariance
+                det = pp00 * pp11 - pp01 * pp01
+                a00 = p00 + dt * p01
+                a10 = p01 + dt * p11
+                c00 = (a00 * pp11 - p01 * pp01) / det
+                c01 = (p01 * pp00 - a00 * pp01) / det
+                c10 = (a10 * pp11 - p11 * pp01) / det
+                c11 = (p11 * pp00 - a10 * pp01) / det
+
+                sx, svx, sy, svy = next_smoothed
+                px, pvx, py, pvy = predicted
+                x, vx = (
+                    x + c00 * (sx - px) + c01 * (svx - pvx),
+                    vx + c10 * (sx - px) + c11 * (svx - pvx),
+                )
+                y, vy = (
+                    y + c00 * (sy - py) + c01 * (svy - pvy),
+                    vy + c10 * (sy - py) + c11 * (svy - pvy),
+                )
+            smoothed[idx] = (t, x, y)
+            # samples after a restart don't inform the ones before it
+            next_smoothed = None if self._pending[idx][1] is None else (x, vx, y, vy)
+
+        final = smoothed[:count]
+        self._pending = self._pending[count:]
+
+        timestamps = np.array([t for t, _, _ in final], dtype=np.int64)
+        lats, lons = unproject_from_local_meters(
+            np.array([x for _, x, _ in final]),
+            np.array([y for _, _, y in final]),
+            *self._origin,
+        )
+        return timestamps, lats, lons
+
+
+def clean_gps(timestamps_ns, lats, lons, **kwargs):
+    """
+    Remove outliers from a complete GPS track and smooth it (see GpsCleaner).
+
+    Returns:
+        tuple: (timestamps [ns], latitudes, longitudes) of the kept samples.
+    """
+    cleaner = GpsCleaner(**kwargs)
+    chunks = [cleaner.process(timestamps_ns, lats, lons), cleaner.flush()]
+    return tuple(np.concatenate(parts) for parts in zip(*chunks))
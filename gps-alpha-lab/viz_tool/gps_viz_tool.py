@@ -11,21 +11,39 @@
 # ]
 # ///
 import argparse
-import json
+import atexit
+import functools
 import math
 import os
+import shlex
 import sys
+import threading
+import urllib.parse
 
+import alignment
 import dash
 import dash_leaflet as dl
 import dash_player as dp
-import imu_transformations as imu_transformations
+import export
+import flask
+import geocoding
+import ingest
+import loading
 import numpy as np
-import pandas as pd
-from dash import ALL, Input, Output, dcc, html
-from geopy.geocoders import Nominatim
-from pie_arc import create_leaflet_pie_sector_coords
-from scipy.interpolate import PchipInterpolator
+import profiling
+import tiles
+import video
+from dash import ALL, ClientsideFunction, Input, Output, State, dcc, html
+from pie_arc import (
+    create_leaflet_pie_gradient_coords,
+    create_unit_pie_sector_template,
+)
+
+# processing, spatial_index and trajectory_lod import SciPy, which takes most
+# of a second. They are only imported where they are used, once the server is
+# running and the recording is loaded in the background. pandas (via ingest)
+# is imported right away: Dash's JSON encoder uses it if it is in sys.modules,
+# so it must not be half-imported by the loader while a request is served.
 
 # parse command line arguments for neon timeseries folder and gps csv file
 parser = argparse.ArgumentParser(description="Neon GPS Visualization Tool")
@@ -34,219 +52,135 @@ parser.add_argument("gps_csv", help="GPS CSV file path")
 parser.add_argument(
     "reverse_geocode", nargs="?", default=False, help="Reverse geocode events"
 )
+parser.add_argument(
+    "--video",
+    default=None,
+    help="Scene video file to show (by default, the MP4 file in "
+    "assets/<recording id>/ or in the recording folder)",
+)
+parser.add_argument(
+    "--geocoder",
+    choices=["nominatim", "offline"],
+    default="nominatim",
+    help="Reverse geocoding backend (offline works without network access)",
+)
+parser.add_argument(
+    "--gazetteer",
+    default=None,
+    help="CSV file with name,latitude,longitude of places for the offline geocoder",
+)
+parser.add_argument(
+    "--geocode-cache",
+    default=geocoding.DEFAULT_CACHE_PATH,
+    help="Path of the on-disk reverse geocoding cache",
+)
+parser.add_argument(
+    "--gaze-timeline",
+    # processing.GAZE_TIMELINES, spelled out as processing is imported later
+    choices=["imu", "scene"],
+    default="imu",
+    help="Compute world-relative gaze for every IMU sample, or only at the "
+    "scene camera frames (faster, with interpolated IMU orientation)",
+)
+parser.add_argument(
+    "--raw-gps",
+    action="store_true",
+    help="Interpolate the GPS samples as recorded, without removing outliers "
+    "and smoothing the track",
+)
+parser.add_argument(
+    "--max-gps-gap",
+    type=float,
+    # processing.DEFAULT_MAX_GPS_GAP_S, spelled out as processing is imported later
+    default=10.0,
+    help="GPS dropouts longer than this many seconds are left as gaps in the "
+    "trajectory instead of being interpolated across",
+)
+parser.add_argument(
+    "--heatmap-distance",
+    type=float,
+    default=15.0,
+    help="Distance in meters from the wearer at which gaze directions are "
+    "counted for the gaze heatmap",
+)
+parser.add_argument(
+    "--tile-url",
+    default=tiles.DEFAULT_TILE_URL,
+    help="URL template of the map tile server, e.g., of a local tile server "
+    "(http://localhost:8080/{z}/{x}/{y}.png) or a folder of tiles "
+    "(file:///path/to/tiles/{z}/{x}/{y}.png)",
+)
+parser.add_argument(
+    "--tile-cache",
+    default=tiles.DEFAULT_CACHE_DIR,
+    help="Folder in which map tiles are cached",
+)
+parser.add_argument(
+    "--tile-cache-size",
+    type=float,
+    default=tiles.DEFAULT_MAX_SIZE_MB,
+    help="Size limit of the tile cache in MB, the least recently used tiles "
+    "are removed beyond it",
+)
+parser.add_argument(
+    "--no-tile-cache",
+    action="store_true",
+    help="Let the browser load the map tiles from the tile server directly",
+)
+parser.add_argument(
+    "--prefetch-zoom",
+    type=tiles.parse_zoom_levels,
+    default=None,
+    help="Fetch the map tiles around the trajectory at these zoom levels "
+    "(e.g., 13-18) into the tile cache, in the background once the "
+    "recording is loaded",
+)
+parser.add_argument(
+    "--csv-engine",
+    choices=ingest.CSV_ENGINES,
+    default=ingest.CSV_ENGINE,
+    help="CSV parser: c uses the least memory, pyarrow (if installed) is faster",
+)
+parser.add_argument(
+    "--memory-report",
+    action="store_true",
+    help="Print time and memory used by each data loading stage",
+)
+parser.add_argument(
+    "--profile-callbacks",
+    action="store_true",
+    help="Record time, response size and rate of every callback, served as JSON "
+    "on /_callback-profile",
+)
+parser.add_argument(
+    "--profile-dir",
+    default=None,
+    help="Also save cProfile stats of the slowest calls of every callback here "
+    "(implies --profile-callbacks)",
+)
+parser.add_argument(
+    "--clientside-playback",
+    action="store_true",
+    help="Update the map during video playback in the browser, without server requests",
+)
 
-args = parser.parse_args()
+# WSGI servers like gunicorn don't forward command line arguments to the app,
+# so they can also be passed in the GPS_VIZ_TOOL_ARGS environment variable
+if "GPS_VIZ_TOOL_ARGS" in os.environ:
+    args = parser.parse_args(shlex.split(os.environ["GPS_VIZ_TOOL_ARGS"]))
+else:
+    args = parser.parse_args()
 
 neon_folder_path = args.neon_folder
 gps_csv_path = args.gps_csv
 reverse_geocode = args.reverse_geocode
+clientside_playback = args.clientside_playback
 
 if not os.path.isdir(neon_folder_path):
     print(f"Error: '{neon_folder_path}' is not a valid directory.", file=sys.stderr)
     sys.exit(1)
 
 
-def open_and_populate_data():
-    # load data
-    with open(neon_folder_path + "/info.json") as f:
-        info = json.load(f)
-
-    # convert start_time to ISO format for compability with gps data + dash
-    info["start_time_iso"] = pd.to_datetime(info["start_time"], unit="ns")
-    info["start_timestamp"] = pd.to_datetime(info["start_time_iso"])
-
-    # load the scene camera timestamps
-    # to enable synced playback of GPS and Neon scene video
-    world_df = pd.read_csv(neon_folder_path + "/world_timestamps.csv")
-    world_df["timestamp_iso"] = pd.to_datetime(world_df["timestamp [ns]"], unit="ns")
-    # add a column with row indices
-    world_df["world_index"] = world_df.index
-    world_df["rel timestamp [s]"] = (
-        world_df["timestamp [ns]"] - world_df["timestamp [ns]"].min()
-    )
-    world_df["rel timestamp [s]"] = world_df["rel timestamp [s]"] / 1e9
-
-    # load gaze and GPS data
-    gps_df = pd.read_csv(gps_csv_path)
-
-    # interpolate GPS data a bit to better match the scene camera timestamps
-    lat_interp = PchipInterpolator(gps_df["timestamp [ns]"], gps_df["latitude"])
-    lon_interp = PchipInterpolator(gps_df["timestamp [ns]"], gps_df["longitude"])
-    # interp_tses = (
-    #     np.arange(
-    #         int(gps_df["timestamp [ns]"].min() * 1e-9),
-    #         int(gps_df["timestamp [ns]"].max() * 1e-9),
-    #         0.2,
-    #     )
-    #     * 1e9
-    # )
-    interp_tses = world_df["timestamp [ns]"].values
-    gps_df = pd.DataFrame(
-        {
-            "timestamp [ns]": interp_tses,
-            "latitude": lat_interp(interp_tses),
-            "longitude": lon_interp(interp_tses),
-        }
-    )
-
-    gaze = pd.read_csv(neon_folder_path + "/gaze.csv")
-
-    # load imu data
-    imu = pd.read_csv(neon_folder_path + "/imu.csv")
-    imu["timestamp_iso"] = pd.to_datetime(imu["timestamp [ns]"], unit="ns")
-    quaternions = np.array(
-        [
-            imu["quaternion w"],
-            imu["quaternion x"],
-            imu["quaternion y"],
-            imu["quaternion z"],
-        ]
-    ).T
-
-    # Resample the gaze azi/ele data to match the IMU timestamps
-    gaze["timestamp_iso"] = pd.to_datetime(gaze["timestamp [ns]"], unit="ns")
-    gaze_elevation_resampled = np.interp(
-        imu["timestamp_iso"], gaze["timestamp_iso"], gaze["elevation [deg]"]
-    )
-    gaze_azimuth_resampled = np.interp(
-        imu["timestamp_iso"], gaze["timestamp_iso"], gaze["azimuth [deg]"]
-    )
-
-    # use imu_transformations to convert gaze elevation and azimuth to world relative coordinates
-    # see: https://docs.pupil-labs.com/alpha-lab/imu-transformations/
-    cart_gazes_in_world = imu_transformations.gaze_3d_to_world(
-        gaze_elevation_resampled, gaze_azimuth_resampled, quaternions
-    )
-    gazes_ele_world, gazes_azi_world = imu_transformations.cartesian_to_spherical_world(
-        cart_gazes_in_world
-    )
-
-    # merge the resampled and transformed gaze data with the imu data
-    # makes some steps later with visualization easier
-    imu["gaze ele world [deg]"] = gazes_ele_world
-    imu["gaze azi world [deg]"] = gazes_azi_world
-
-    # load events
-    events_df = pd.read_csv(neon_folder_path + "/events.csv")
-
-    # Ensure all DataFrames have the same timestamp format
-    imu["timestamp"] = pd.to_datetime(imu["timestamp_iso"])
-    world_df["timestamp"] = pd.to_datetime(world_df["timestamp_iso"])
-    gps_df["timestamp"] = pd.to_datetime(gps_df["timestamp [ns]"])
-    gaze["timestamp"] = pd.to_datetime(gaze["timestamp_iso"])
-    events_df["timestamp_iso"] = pd.to_datetime(events_df["timestamp [ns]"], unit="ns")
-
-    events_df["timestamp"] = pd.to_datetime(events_df["timestamp_iso"])
-
-    # start merging the different dataframes into one
-    # comprehensive dataframe
-    gps_imu_df = pd.merge_asof(
-        gps_df.sort_values("timestamp"),
-        imu[
-            ["timestamp", "yaw [deg]", "gaze ele world [deg]", "gaze azi world [deg]"]
-        ].sort_values("timestamp"),
-        on="timestamp",
-    )
-    gps_imu_df.set_index("timestamp", inplace=True)
-    world_gps_imu_df = pd.merge_asof(
-        gps_imu_df.sort_values("timestamp"),
-        world_df[["timestamp", "world_index"]].sort_values("timestamp"),
-        on="timestamp",
-    )
-    world_gps_imu_df.set_index("timestamp", inplace=True)
-    world_gaze_gps_imu_df = pd.merge_asof(
-        world_gps_imu_df.sort_values("timestamp"),
-        gaze[["timestamp", "elevation [deg]", "azimuth [deg]"]].sort_values(
-            "timestamp"
-        ),
-        on="timestamp",
-    )
-    world_gaze_gps_imu_df.set_index("timestamp", inplace=True)
-
-    # make sure all dataframes have the same index
-    # some actions are a bit easier later with just the gps dataframe
-    # alone
-    gps_df.set_index("timestamp", inplace=True)
-
-    return (
-        world_gaze_gps_imu_df,
-        world_gps_imu_df,
-        gps_imu_df,
-        world_df,
-        events_df,
-        gps_df,
-    )
-
-
-def reverse_geocode_events(world_gaze_gps_imu_df, events_df):
-    # reverse geocode the events
-    geolocator = Nominatim(user_agent="my_reverse_geocoder")
-
-    # having reverse geocoded events in a separate dataframe
-    # with a copy of the gps coordinates makes the event selector
-    # easier to implement and use
-    event_gps_list = []
-    for idx, row in events_df.iterrows():
-        world_idx = world_gaze_gps_imu_df.index.get_indexer(
-            [row["timestamp"]], method="nearest"
-        )[0]
-        world_row = world_gaze_gps_imu_df.iloc[world_idx]
-        lat = world_row["latitude"]
-        lon = world_row["longitude"]
-        heading = world_row["yaw [deg]"]
-        gaze_azi = world_row["gaze azi world [deg]"]
-
-        if reverse_geocode:
-            try:
-                location = geolocator.reverse((lat, lon))
-
-                event_gps_list.append(
-                    {
-                        "lat": lat,
-                        "lon": lon,
-                        "location": location,
-                        "yaw [deg]": heading,
-                        "gaze azi world [deg]": gaze_azi,
-                        "timestamp": row["timestamp"],
-                    }
-                )
-            except Exception:
-                print("Could not reverse geocode event: ", row["name"])
-        else:
-            event_gps_list.append(
-                {
-                    "lat": lat,
-                    "lon": lon,
-                    "location": row["name"],
-                    "yaw [deg]": heading,
-                    "gaze azi world [deg]": gaze_azi,
-                    "timestamp": row["timestamp"],
-                }
-            )
-
-    # transform it to a dataframe
-    if reverse_geocode:
-        geocoded_events_df = pd.DataFrame(
-            {
-                "lat": [event["lat"] for event in event_gps_list],
-                "lon": [event["lon"] for event in event_gps_list],
-                "location": [event["location"].address for event in event_gps_list],
-                "size": [12 for event in event_gps_list],
-            }
-        )
-    else:
-        geocoded_events_df = pd.DataFrame(
-            {
-                "lat": [event["lat"] for event in event_gps_list],
-                "lon": [event["lon"] for event in event_gps_list],
-                "location": [event["location"] for event in event_gps_list],
-                "size": [12 for event in event_gps_list],
-            }
-        )
-
-    return geocoded_events_df, event_gps_list
-
-
 def calculate_arrow_latlon_coords(lat, lon, heading, scale=0.0006):
     """
     Compute the end coordinates for an arrow based on a starting point (lat, lat),
@@ -304,21 +238,34 @@ def make_frustum_base(lats, lons):
     return frustum_layer
 
 
-def find_neon_video_path(neon_folder_path):
-    datetime_uid = neon_folder_path.split("/")[1]
-    for filename in os.listdir("./assets/" + datetime_uid):
-        if filename.endswith(".mp4"):
-            neon_scene_filename = filename
-
-    if neon_scene_filename is None:
-        print(
-            "Error: No Neon scene video in the 'assets/`recording_id`' subdirectory. Please read the instructions.",
-            file=sys.stderr,
-        )
-        sys.exit(1)
-    else:
-        neon_scene_path = os.path.join("./assets/" + datetime_uid, neon_scene_filename)
-        return neon_scene_path
+def find_neon_video_path(neon_folder_path, video_path=None):
+    """
+    The scene video to show: video_path if given, else the MP4 file in
+    assets/<recording id>/ (e.g., a video with gaze rendered into it) or, if
+    there is none, the one in the recording folder, where Pupil Cloud's
+    "Timeseries Data + Scene Video" download puts it. The video is served
+    from where it is (see serve_video), it is not copied.
+    """
+    if video_path is not None:
+        if not os.path.isfile(video_path):
+            print(f"Error: Scene video {video_path} not found.", file=sys.stderr)
+            sys.exit(1)
+        return video_path
+
+    datetime_uid = os.path.basename(os.path.normpath(neon_folder_path))
+    for folder in [os.path.join("assets", datetime_uid), neon_folder_path]:
+        if not os.path.isdir(folder):
+            continue
+        for filename in sorted(os.listdir(folder)):
+            if filename.endswith(".mp4"):
+                return os.path.join(folder, filename)
+
+    print(
+        "Error: No Neon scene video in the recording folder or in the "
+        "'assets/`recording_id`' subdirectory. Please read the instructions.",
+        file=sys.stderr,
+    )
+    sys.exit(1)
 
 
 # 1. Define the properties of the pie
@@ -328,27 +275,103 @@ pie_end_angle = 50  # End angle to create a 100-degree arc
 number_of_gradient_layers = 40  # Increased for a smoother gradient
 pie_color = "#007BFF"  # Bright blue
 
+initial_zoom = 15
+
+# the arc template and the layer radii only depend on the properties above,
+# so they are computed once rather than on every video frame
+pie_template = create_unit_pie_sector_template(pie_start_angle, pie_end_angle)
+pie_radii = (
+    np.arange(number_of_gradient_layers, 0, -1) / number_of_gradient_layers
+) * maximum_radius
+
+# the fixed shape of the pie arc and the gaze arrow, sent to the browser once.
+# On every frame, only the wearer's pose is sent and the browser places
+# the shapes (see assets/map_updates.js)
+pie_shape = {
+    "arrow_scale": 0.0006,
+    "pie_template": pie_template.tolist(),
+    "pie_radii": pie_radii.tolist(),
+}
+
+
+def pie_positions_at(lat, lon, heading):
+    """
+    Coordinates of all gradient layers of the pie, largest first.
+    """
+    return create_leaflet_pie_gradient_coords(
+        lat, lon, pie_radii, heading, pie_template
+    ).tolist()
+
+
+def to_json_list(values, decimals):
+    """
+    Round an array for compact JSON and replace NaN with None (null).
+    """
+    values = np.round(np.asarray(values, dtype=np.float64), decimals)
+    return [None if np.isnan(v) else v for v in values.tolist()]
+
+
+def create_playback_frames(world_gaze_gps_imu_df):
+    """
+    Per-frame arrays that are shipped to the browser once for clientside
+    playback (see assets/playback.js).
+    """
+    timestamps_ns = world_gaze_gps_imu_df["timestamp [ns]"].values
+    return {
+        "t": to_json_list((timestamps_ns - timestamps_ns.min()) / 1e9, 4),
+        "lat": to_json_list(world_gaze_gps_imu_df["latitude"].values, 7),
+        "lon": to_json_list(world_gaze_gps_imu_df["longitude"].values, 7),
+        "heading": to_json_list(world_gaze_gps_imu_df["yaw [deg]"].values + 90, 2),
+        "gaze_azi": to_json_list(
+            world_gaze_gps_imu_df["gaze azi world [deg]"].values + 90, 2
+        ),
+        **pie_shape,
+    }
+
+
+def trajectory_view(zoom, bounds):
+    """
+    The trajectory points to draw for a map view (see select_trajectory_rows),
+    with their row indices, so the browser can apply trims by itself.
+    """
+    from trajectory_lod import select_trajectory_rows
+
+    lats = world_gaze_gps_imu_df["latitude"].values
+    lons = world_gaze_gps_imu_df["longitude"].values
+    lines = select_trajectory_rows(
+        trajectory_pyramid, lats, lons, zoom, bounds, 0, len(lats) - 1
+    )
+    return {
+        "rows": [rows.tolist() for rows in lines],
+        "positions": [
+            np.round(np.column_stack([lats[rows], lons[rows]]), 6).tolist()
+            for rows in lines
+        ],
+    }
+
+
+def create_base_map(
+    world_gaze_gps_imu_df, geocoded_events_df, trajectory_pyramid, gaze_heatmap
+):
+    from trajectory_lod import select_trajectory
 
-def create_base_map(world_gaze_gps_imu_df, world_df, geocoded_events_df):
     center_lat = world_gaze_gps_imu_df["latitude"].mean()
     center_lon = world_gaze_gps_imu_df["longitude"].mean()
 
-    # Add the wearer pos and arrows to the map that corresponds to earliest scene camera frame
-    target_timestamp = pd.Timedelta(seconds=0) + world_df["timestamp"].min()
-    idx = world_gaze_gps_imu_df.index.get_indexer([target_timestamp], method="nearest")[
-        0
-    ]
-    row = world_gaze_gps_imu_df.iloc[idx]
+    # Add the wearer pos and arrows to the map that corresponds to earliest scene
+    # camera frame with a GPS position (frames in GPS gaps have none)
+    positions = world_gaze_gps_imu_df[["latitude", "longitude"]].dropna()
+    if len(positions) == 0:
+        positions = world_gaze_gps_imu_df[["latitude", "longitude"]]
 
-    initial_lat = row["latitude"]
-    initial_lon = row["longitude"]
+    initial_lat, initial_lon = positions.iloc[0]
     # inital_heading = row["yaw [deg]"] + 90
     # initial_gaze_azi = row["gaze azi world [deg]"] + 90
 
-    final_lat = world_gaze_gps_imu_df.iloc[len(world_gaze_gps_imu_df) - 1]["latitude"]
-    final_lon = world_gaze_gps_imu_df.iloc[len(world_gaze_gps_imu_df) - 1]["longitude"]
+    final_lat, final_lon = positions.iloc[len(positions) - 1]
+    del positions
 
-    # add markers for all events
+    # add markers for all events that have a position
     event_markers = [
         dl.CircleMarker(
             center=[event[1].lat, event[1].lon],
@@ -363,25 +386,18 @@ def create_base_map(world_gaze_gps_imu_df, world_df, geocoded_events_df):
             id=f"event-marker-{idx + 1}",
         )
         for idx, event in enumerate(geocoded_events_df.iterrows())
+        if np.isfinite(event[1].lat) and np.isfinite(event[1].lon)
     ]
 
     # Create concentric sectors from largest (most transparent) to smallest (most opaque)
+    pie_positions = pie_positions_at(initial_lat, initial_lon, 0)
     pie_arc = []
-    pc = 0
-    for i in range(number_of_gradient_layers, 0, -1):
-        radius = (i / number_of_gradient_layers) * maximum_radius
+    for pc, sector_coords in enumerate(pie_positions):
         progress = (
-            (number_of_gradient_layers - i) / (number_of_gradient_layers - 1)
-            if number_of_gradient_layers > 1
-            else 1
+            pc / (number_of_gradient_layers - 1) if number_of_gradient_layers > 1 else 1
         )
         opacity = progress * 0.06
 
-        # Get the coordinates for the current sector
-        sector_coords = create_leaflet_pie_sector_coords(
-            initial_lat, initial_lon, radius, pie_start_angle, pie_end_angle
-        )
-
         # Each layer is a dash_leaflet Polygon component.
         # We set weight=0 to make the border invisible.
         pie_arc.append(
@@ -394,16 +410,36 @@ def create_base_map(world_gaze_gps_imu_df, world_df, geocoded_events_df):
                 id={"type": "pie-arc", "index": pc},
             )
         )
-        pc += 1
 
     map = dl.Map(
         attributionControl=False,
         children=[
             dl.TileLayer(
+                url=tile_layer_url,
                 detectRetina=True,
             ),
+            dl.LayersControl(
+                dl.Overlay(
+                    dl.ImageOverlay(
+                        url=gaze_heatmap.png_data_url(0, len(gaze_heatmap) - 1),
+                        bounds=gaze_heatmap.bounds,
+                        opacity=0.8,
+                        id="gaze-heatmap",
+                    ),
+                    name="Gaze heatmap",
+                    checked=True,
+                ),
+            ),
             dl.Polyline(
-                positions=world_gaze_gps_imu_df[["latitude", "longitude"]].values,
+                positions=select_trajectory(
+                    trajectory_pyramid,
+                    world_gaze_gps_imu_df["latitude"].values,
+                    world_gaze_gps_imu_df["longitude"].values,
+                    initial_zoom,
+                    None,
+                    0,
+                    len(world_gaze_gps_imu_df) - 1,
+                ),
                 color="blue",
                 weight=1.5,
                 id="wearer-trajectory",
@@ -457,7 +493,7 @@ def create_base_map(world_gaze_gps_imu_df, world_df, geocoded_events_df):
             ),
         ],
         center=[center_lat, center_lon],
-        zoom=15,
+        zoom=initial_zoom,
         style={"height": "50vh"},
         id="map-graph",
     )
@@ -465,45 +501,318 @@ def create_base_map(world_gaze_gps_imu_df, world_df, geocoded_events_df):
     return map
 
 
-# load up all data, prepare fig, find neon scene video
-(
-    world_gaze_gps_imu_df,
-    world_gps_imu_df,
-    gps_imu_df,
-    world_df,
-    events_df,
-    gps_df,
-) = open_and_populate_data()
+def load_recording(loader):
+    """
+    Load the recording and prepare everything the callbacks need. This runs
+    in the background while the server is already up (see loading.py), and
+    sets the module level variables that the callbacks read.
+    """
+    global world_gaze_gps_imu_df, events_df, geocoded_events_df, event_gps_list
+    global trajectory_pyramid, frame_timeline, segment_statistics, gaze_heatmap
+    global base_map, playback_frames
+
+    loader.set_stage("import modules")
+    import processing
+    from gaze_heatmap import GazeHeatmap
+    from segment_stats import SegmentStatistics
+    from trajectory_lod import build_trajectory_pyramid
+
+    # load up all data, prepare fig
+    load_report = ingest.StageReport(
+        enabled=args.memory_report, on_stage=loader.set_stage
+    )
+    world_gaze_gps_imu_df, events_df = processing.open_and_populate_data(
+        neon_folder_path,
+        gps_csv_path,
+        load_report,
+        args.gaze_timeline,
+        clean_gps=not args.raw_gps,
+        max_gps_gap_s=args.max_gps_gap,
+        csv_engine=args.csv_engine,
+    )
+    load_report.print()
 
-geocoded_events_df, event_gps_list = reverse_geocode_events(
-    world_gaze_gps_imu_df, events_df
-)
+    loader.set_stage("reverse geocode events" if reverse_geocode else "locate events")
+    if reverse_geocode:
+        geocoding_backend = geocoding.create_backend(args.geocoder, args.gazetteer)
+        geocode_cache = geocoding.GeocodeCache(args.geocode_cache)
+    else:
+        geocoding_backend = geocode_cache = None
+    geocoded_events_df, event_gps_list = processing.reverse_geocode_events(
+        world_gaze_gps_imu_df, events_df, geocoding_backend, geocode_cache
+    )
+    if geocode_cache is not None:
+        geocode_cache.close()
+
+    # simplified copies of the trajectory for each zoom level, so the browser
+    # only receives as many points as it can actually draw
+    loader.set_stage("simplify trajectory")
+    trajectory_pyramid = build_trajectory_pyramid(
+        world_gaze_gps_imu_df["latitude"].values,
+        world_gaze_gps_imu_df["longitude"].values,
+    )
 
-map = create_base_map(world_gaze_gps_imu_df, world_df, geocoded_events_df)
-neon_scene_path = find_neon_video_path(neon_folder_path)
+    # int64 timeline and contiguous per-frame arrays for the callbacks,
+    # so that video time -> frame is a single searchsorted
+    loader.set_stage("prepare map")
+    frame_timeline = alignment.FrameTimeline(
+        world_gaze_gps_imu_df["timestamp [ns]"].values,
+        {
+            "latitude": world_gaze_gps_imu_df["latitude"].values,
+            "longitude": world_gaze_gps_imu_df["longitude"].values,
+            # headings as drawn on the map
+            "heading": world_gaze_gps_imu_df["yaw [deg]"].to_numpy(np.float64) + 90,
+            "gaze azi": world_gaze_gps_imu_df["gaze azi world [deg]"].to_numpy(
+                np.float64
+            )
+            + 90,
+        },
+    )
 
-app_event_options = []
-if reverse_geocode:
-    app_event_options = [
-        {"label": event["location"].address, "value": idx + 1}
-        for idx, event in enumerate(event_gps_list)
+    # prefix sums for the statistics of any trimmed segment in constant time
+    segment_statistics = SegmentStatistics(
+        frame_timeline.timestamps_ns,
+        frame_timeline["latitude"],
+        frame_timeline["longitude"],
+        frame_timeline["heading"],
+        frame_timeline["gaze azi"],
+    )
+
+    # where gaze hit the ground, counted once, so the heatmap of any trim
+    # window is a difference of running totals
+    loader.set_stage("gaze heatmap")
+    gaze_heatmap = GazeHeatmap(
+        frame_timeline["latitude"],
+        frame_timeline["longitude"],
+        frame_timeline["gaze azi"],
+        distance_m=args.heatmap_distance,
+    )
+
+    base_map = create_base_map(
+        world_gaze_gps_imu_df, geocoded_events_df, trajectory_pyramid, gaze_heatmap
+    )
+    playback_frames = (
+        create_playback_frames(world_gaze_gps_imu_df) if clientside_playback else None
+    )
+
+    if tile_cache is not None and args.prefetch_zoom is not None:
+        # in the background, the map can be used in the meantime
+        threading.Thread(
+            target=prefetch_tiles,
+            args=(frame_timeline["latitude"], frame_timeline["longitude"]),
+            daemon=True,
+        ).start()
+
+
+def prefetch_tiles(lats, lons):
+    """
+    Fetch the map tiles around the trajectory into the tile cache, at the
+    zoom levels of --prefetch-zoom.
+    """
+    valid = np.isfinite(lats) & np.isfinite(lons)
+    if not valid.any():
+        return
+    bounds = [
+        [float(lats[valid].min()), float(lons[valid].min())],
+        [float(lats[valid].max()), float(lons[valid].max())],
     ]
-else:
+    try:
+        result = tile_cache.prefetch(bounds, args.prefetch_zoom)
+    except ValueError as e:
+        print(f"Not prefetching map tiles: {e}", file=sys.stderr)
+        return
+    print(
+        f"Prefetched map tiles: {result['tiles']} tiles, {result['cached']} "
+        f"were cached, {result['failed']} failed"
+    )
+
+
+def loading_view(status):
+    """
+    Shown in place of the map while the recording is loaded: the loading
+    stages so far, with their durations.
+    """
+    stages = [
+        html.Li(f"{name} ({seconds:.1f} s)") for name, seconds in status["stages"][:-1]
+    ]
+    if status["stages"]:
+        name, seconds = status["stages"][-1]
+        if status["done"]:
+            stages.append(html.Li(f"{name} ({seconds:.1f} s)"))
+        else:
+            stages.append(html.Li(html.B(f"{name} ...")))
+
+    if status["error"] is not None:
+        title = f"Loading the recording failed: {status['error']}"
+    else:
+        title = f"Loading the recording ({status['elapsed']:.0f} s)"
+
+    return html.Div(
+        [html.H4(title), html.Ul(stages)],
+        style={"height": "50vh", "padding": "10px", "boxSizing": "border-box"},
+    )
+
+
+def create_event_selectors():
+    """
+    The event list and the start/end event dropdowns for the loaded events.
+    """
     app_event_options = [
         {"label": event["location"], "value": idx + 1}
         for idx, event in enumerate(event_gps_list)
     ]
 
+    event_list = dcc.RadioItems(
+        id="gps-event-selector",
+        options=app_event_options,
+        value=None,
+        labelStyle={"display": "block"},
+    )
+    trim_selectors = [
+        html.Div(
+            [
+                "Start event:",
+                dcc.Dropdown(
+                    id="event-dropdown-1",
+                    options=app_event_options,
+                    value=1,
+                ),
+            ],
+            style={"flex": 1, "padding": "10px"},
+        ),
+        html.Div(
+            [
+                "End event:",
+                dcc.Dropdown(
+                    id="event-dropdown-2",
+                    options=app_event_options,
+                    value=len(event_gps_list),
+                ),
+            ],
+            style={"flex": 1, "padding": "10px"},
+        ),
+        html.Div(
+            segment_summary(*trim_window_bounds(None)),
+            id="segment-stats",
+            style={"padding": "10px"},
+        ),
+        html.Div(
+            export_links(*trim_window_bounds(None)),
+            id="export-links",
+            style={"padding": "10px"},
+        ),
+    ]
+    return event_list, trim_selectors
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return (
+        f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+    )
+
+
+def segment_summary(start, end):
+    """
+    Distance, duration, speed, turning and gaze spread of the frames
+    start to end, as shown below the trim selectors.
+    """
+    stats = segment_statistics.segment(start, end)
+    if stats is None:
+        return "Empty segment"
+
+    def value(name, unit, decimals=1):
+        return "-" if stats[name] is None else f"{stats[name]:.{decimals}f}{unit}"
+
+    distance = stats["distance [m]"]
+    rows = [
+        (
+            "Distance",
+            f"{distance / 1e3:.2f} km" if distance >= 1e3 else f"{distance:.0f} m",
+        ),
+        ("Duration", format_duration(stats["duration [s]"])),
+        ("Mean speed", value("mean speed [m/s]", " m/s")),
+        ("Max speed", value("max speed [m/s]", " m/s")),
+        (
+            "Heading change",
+            f"{value('heading change [deg]', '°', 0)} "
+            f"({value('turning [deg]', '°', 0)} turned in total)",
+        ),
+        ("Gaze azimuth dispersion", value("gaze azimuth dispersion [deg]", "°")),
+    ]
+    return html.Table(
+        [html.Tr([html.Td(label), html.Td(text)]) for label, text in rows]
+    )
 
-app = dash.Dash(__name__, prevent_initial_callbacks=True)
+
+def export_links(start, end):
+    """
+    Download links for the frames start to end in every export format.
+    """
+    links = ["Export segment:"]
+    for export_format in export.EXPORT_FORMATS:
+        links.append(
+            html.A(
+                export_format.upper(),
+                href=app.get_relative_path(
+                    f"/export/{export_format}?start={start}&end={end}"
+                ),
+                download=export.segment_filename(
+                    recording_name, start, end, export_format
+                ),
+                style={"marginLeft": "10px"},
+            )
+        )
+    return links
+
+
+# map tiles are served from the on-disk cache, and fetched into it on demand
+if args.no_tile_cache:
+    tile_cache = None
+    tile_layer_url = args.tile_url
+else:
+    tile_cache = tiles.TileCache(
+        args.tile_cache, args.tile_url, int(args.tile_cache_size * 1024 * 1024)
+    )
+    tile_layer_url = tiles.TILE_LAYER_URL
+
+# the scene video is served right away, the map and the events
+# are added to the page once the recording is loaded
+neon_scene_path = find_neon_video_path(neon_folder_path, args.video)
+recording_name = os.path.basename(os.path.normpath(neon_folder_path))
+recording_loader = loading.BackgroundLoader(load_recording)
+
+# WSGI servers like gunicorn (with --preload) import the app once and then fork
+# the workers, so the recording is loaded before, to be shared by all workers
+if "GPS_VIZ_TOOL_ARGS" in os.environ:
+    recording_loader.run()
+
+
+# the map, event list and trim selectors are only created once the recording
+# is loaded, so callbacks may refer to components that are not there yet
+app = dash.Dash(
+    __name__, prevent_initial_callbacks=True, suppress_callback_exceptions=True
+)
+server = app.server
 app.layout = html.Div(
     [
         html.Div(
             [
                 html.Div(
                     [
-                        map,
+                        html.Div(
+                            loading_view(recording_loader.status()), id="map-panel"
+                        ),
                         dcc.Interval(id="interval", interval=330, n_intervals=0),
+                        dcc.Interval(
+                            id="loading-interval", interval=250, n_intervals=0
+                        ),
+                        dcc.Store(id="playback-frames", data=None),
+                        dcc.Store(id="trim-window", data=None),
+                        dcc.Store(id="pie-shape", data=pie_shape),
+                        dcc.Store(id="wearer-pose", data=None),
+                        dcc.Store(id="trajectory-view", data=None),
                     ],
                     style={"flex": 1},
                 ),
@@ -511,7 +820,10 @@ app.layout = html.Div(
                     [
                         dp.DashPlayer(
                             id="video-player",
-                            url=neon_scene_path,
+                            url=app.get_relative_path(
+                                "/video/"
+                                + urllib.parse.quote(os.path.basename(neon_scene_path))
+                            ),
                             controls=True,
                             playing=False,
                             width="100%",
@@ -525,12 +837,7 @@ app.layout = html.Div(
                 html.Div(
                     [
                         html.H4("Events"),
-                        dcc.RadioItems(
-                            id="gps-event-selector",
-                            options=app_event_options,
-                            value=None,
-                            labelStyle={"display": "block"},
-                        ),
+                        html.Div(id="event-list-panel"),
                     ],
                     style={
                         "flex": 1,
@@ -543,121 +850,143 @@ app.layout = html.Div(
             style={"display": "flex"},
         ),
         html.Div(
-            [
-                html.Div(
-                    [
-                        "Start event:",
-                        dcc.Dropdown(
-                            id="event-dropdown-1",
-                            options=app_event_options,
-                            value=1,
-                        ),
-                    ],
-                    style={"flex": 1, "padding": "10px"},
-                ),
-                html.Div(
-                    [
-                        "End event:",
-                        dcc.Dropdown(
-                            id="event-dropdown-2",
-                            options=app_event_options,
-                            value=len(event_gps_list),
-                        ),
-                    ],
-                    style={"flex": 1, "padding": "10px"},
-                ),
-            ],
+            id="trim-panel",
             style={"flex": 1, "padding": "30px"},
         ),
     ]
 )
 
 
-global subset_df
-subset_df = None
-
-global trimmed
-trimmed = False
-
-global prev_selected_event
-prev_selected_event = None
+@app.callback(
+    Output("map-panel", "children"),
+    Output("loading-interval", "disabled"),
+    Output("event-list-panel", "children"),
+    Output("trim-panel", "children"),
+    Output("trajectory-view", "data", allow_duplicate=True),
+    Output("playback-frames", "data"),
+    Input("loading-interval", "n_intervals"),
+)
+def show_recording_when_loaded(n_intervals):
+    status = recording_loader.status()
+    if not recording_loader.loaded:
+        # keep polling until loading is done (or has failed)
+        return (loading_view(status), status["done"]) + (dash.no_update,) * 4
+
+    # components with their initial values, added to the page without
+    # triggering their callbacks (prevent_initial_callbacks)
+    event_list, trim_selectors = create_event_selectors()
+    return (
+        base_map,
+        True,
+        event_list,
+        trim_selectors,
+        trajectory_view(initial_zoom, None),
+        playback_frames,
+    )
 
-global trim_event1
-trim_event1 = None
 
-global trim_event2
-trim_event2 = None
+# All per-user state (the selected trim window) lives in the browser, in the
+# "trim-window" dcc.Store, and is passed to the callbacks that need it. The
+# loaded recording is only ever read, so one process can serve many sessions
+# and several worker processes can serve the same recording.
 
 
 # define all the Dash callbacks that enable user interaction.
 # they are called and managed by the Dash framework
-@app.callback(
-    Output("wearer-marker", "center", allow_duplicate=True),
-    Output("gaze-arrow", "positions", allow_duplicate=True),
-    Output({"type": "pie-arc", "index": ALL}, "positions", allow_duplicate=True),
-    Input("video-player", "currentTime"),
-)
-def map_update_on_currentTime(currentTime):
-    global subset_df
-    global trimmed
-    if currentTime is None:
+# a trim window without frames, e.g., between two events in reverse order
+EMPTY_TRIM_WINDOW = {
+    "start": 0,
+    "end": -1,
+    "start_position": None,
+    "end_position": None,
+}
+
+
+def trim_window_bounds(trim_window):
+    """
+    Row range [start, end] of the selected trim window (or the whole recording).
+    """
+    if trim_window is None:
+        return 0, len(frame_timeline) - 1
+    return trim_window["start"], trim_window["end"]
+
+
+def position_at(idx):
+    """
+    [lat, lon] of a frame, rounded for compact JSON (None if unknown).
+    """
+    # numpy would wrap negative rows around to the end of the recording
+    if not 0 <= idx < len(frame_timeline):
+        raise IndexError(f"Frame {idx} is out of range")
+    lat, lon = to_json_list(
+        [frame_timeline["latitude"][idx], frame_timeline["longitude"][idx]], 7
+    )
+    return None if lat is None or lon is None else [lat, lon]
+
+
+def pose_at(idx):
+    """
+    The wearer's pose at a frame: position, and the heading and gaze direction
+    as drawn on the map (None if unknown).
+    """
+    position = position_at(idx)
+    if position is None:
         return dash.no_update
 
-    target_timestamp = pd.Timedelta(seconds=currentTime) + world_df["timestamp"].min()
+    heading, gaze_azi = to_json_list(
+        [frame_timeline["heading"][idx], frame_timeline["gaze azi"][idx]], 2
+    )
+    return {
+        "lat": position[0],
+        "lon": position[1],
+        "heading": heading,
+        "gaze_azi": gaze_azi,
+    }
 
-    idx = 0
-    df_len = 0
-    df_to_sample = []
-    if trimmed:
-        idx = subset_df.index.get_indexer([target_timestamp], method="nearest")[0]
-        df_len = len(subset_df)
-        df_to_sample = subset_df
-    else:
-        idx = gps_imu_df.index.get_indexer([target_timestamp], method="nearest")[0]
-        df_len = len(gps_imu_df)
-        df_to_sample = gps_imu_df
-
-    if idx < df_len:
-        row = df_to_sample.iloc[idx]
-        new_lon = row["longitude"]
-        new_lat = row["latitude"]
-        heading = row["yaw [deg]"] + 90
-        gaze_azi = row["gaze azi world [deg]"] + 90
-
-        pie_heading = None
-        if np.isnan(heading):
-            pie_heading = 0
-        else:
-            pie_heading = heading
-
-        pie_positions = []
-        for i in range(number_of_gradient_layers, 0, -1):
-            radius = (i / number_of_gradient_layers) * maximum_radius
-
-            # Get the coordinates for the current sector
-            sector_coords = create_leaflet_pie_sector_coords(
-                new_lat,
-                new_lon,
-                radius,
-                pie_start_angle + pie_heading,
-                pie_end_angle + pie_heading,
-            )
-            pie_positions.append(sector_coords)
 
-        if np.isnan(gaze_azi):
-            new_x = new_lon
-            new_y = new_lat
-        else:
-            new_x = new_lon + 0.0006 * np.cos(np.radians(gaze_azi))
-            new_y = new_lat + 0.0006 * np.sin(np.radians(gaze_azi))
+def map_update_on_currentTime(currentTime, trim_window):
+    if currentTime is None or not recording_loader.loaded:
+        return dash.no_update
 
-        return (
-            [new_lat, new_lon],
-            [[new_lat, new_lon], [new_y, new_x]],
-            pie_positions,
-        )
+    start, end = trim_window_bounds(trim_window)
+    if end < start:
+        return dash.no_update
 
-    return dash.no_update
+    # the nearest frame within the trim window is the nearest frame overall,
+    # clamped to the window
+    return pose_at(frame_timeline.index_at(currentTime, start, end))
+
+
+wearer_outputs = [
+    Output("wearer-marker", "center", allow_duplicate=True),
+    Output("gaze-arrow", "positions", allow_duplicate=True),
+    Output({"type": "pie-arc", "index": ALL}, "positions", allow_duplicate=True),
+]
+if clientside_playback:
+    # the browser resolves the frame and updates the map by itself,
+    # so playback needs no server round-trip per video tick
+    app.clientside_callback(
+        ClientsideFunction(namespace="playback", function_name="update_map"),
+        *wearer_outputs,
+        Input("video-player", "currentTime"),
+        State("playback-frames", "data"),
+        State("trim-window", "data"),
+    )
+else:
+    app.callback(
+        Output("wearer-pose", "data", allow_duplicate=True),
+        Input("video-player", "currentTime"),
+        State("trim-window", "data"),
+    )(map_update_on_currentTime)
+
+# the marker, gaze arrow and pie arc are placed in the browser
+# for the pose the server sent
+app.clientside_callback(
+    ClientsideFunction(namespace="map_updates", function_name="render_pose"),
+    *wearer_outputs,
+    Input("wearer-pose", "data"),
+    State("pie-shape", "data"),
+)
 
 
 @app.callback(
@@ -666,123 +995,186 @@ def map_update_on_currentTime(currentTime):
     Input("event-dropdown-2", "value"),
 )
 def update_video_on_event_selection(start_event, end_event):
-    global trim_event1
-    global trim_event2
     if start_event is not None and end_event is not None:
-        # Get the start event's timestamp and convert it to seconds.
-        start_timestamp = (
-            event_gps_list[start_event - 1]["timestamp"] - world_gps_imu_df.index.min()
+        # Get the start event's timestamp in seconds since the first frame,
+        # and seek the video to that point.
+        return frame_timeline.seconds_since_start(
+            event_gps_list[start_event - 1]["timestamp [ns]"]
         )
-        start_timestamp = start_timestamp.total_seconds()
-        trim_event1 = start_event
-
-        # Get the end event's timestamp and convert it to seconds.
-        end_timestamp = (
-            event_gps_list[end_event - 1]["timestamp"] - world_gps_imu_df.index.min()
-        )
-        end_timestamp = end_timestamp.total_seconds()
-        trim_event2 = end_event
-
-        # Return the start timestamp to seek the video to that point.
-        return start_timestamp
 
     return dash.no_update
 
 
 @app.callback(
-    Output("wearer-trajectory", "positions", allow_duplicate=True),
+    Output("trim-window", "data"),
     Input("event-dropdown-1", "value"),
     Input("event-dropdown-2", "value"),
 )
 def update_map_on_event_selection(start_event, end_event):
-    global subset_df
-    global trimmed
-    # global trim_event1
-    # global trim_event2
     if start_event is not None and end_event is not None:
-        start_timestamp = event_gps_list[start_event - 1]["timestamp"]
-        end_timestamp = event_gps_list[end_event - 1]["timestamp"]
+        # the trim is stored per session as a window of row indices,
+        # which all other callbacks receive as State
+        start, end = frame_timeline.window(
+            event_gps_list[start_event - 1]["timestamp [ns]"],
+            event_gps_list[end_event - 1]["timestamp [ns]"],
+        )
+        start = max(start, 0)
+        end = min(end, len(frame_timeline) - 1)
+        if end < start:
+            # both events are before the first or after the last frame, or
+            # the end event is before the start event: no frames are selected
+            return EMPTY_TRIM_WINDOW
+
+        # the browser trims the trajectory it already has to these rows,
+        # and ends the line exactly at these positions
+        return {
+            "start": start,
+            "end": end,
+            "start_position": position_at(start),
+            "end_position": position_at(end),
+        }
 
-        # trim_event1 = start_event
-        # trim_event2 = end_event
+    return dash.no_update
 
-        subset_df = world_gaze_gps_imu_df[
-            (world_gaze_gps_imu_df.index >= start_timestamp)
-            & (world_gaze_gps_imu_df.index <= end_timestamp)
-        ]
 
-        trimmed = True
+@app.callback(
+    Output("segment-stats", "children"),
+    Input("trim-window", "data"),
+)
+def show_segment_statistics(trim_window):
+    # a handful of prefix sum lookups, however long the segment is
+    return segment_summary(*trim_window_bounds(trim_window))
 
-        return subset_df[["latitude", "longitude"]].values
 
-    return dash.no_update
+@app.callback(
+    Output("gaze-heatmap", "url"),
+    Input("trim-window", "data"),
+)
+def update_gaze_heatmap(trim_window):
+    # counted from the running totals, not from the frames in the window
+    return gaze_heatmap.png_data_url(*trim_window_bounds(trim_window))
 
 
 @app.callback(
-    Output("wearer-marker", "center", allow_duplicate=True),
-    Output("gaze-arrow", "positions", allow_duplicate=True),
-    Output({"type": "pie-arc", "index": ALL}, "positions", allow_duplicate=True),
+    Output("export-links", "children"),
+    Input("trim-window", "data"),
+)
+def update_export_links(trim_window):
+    return export_links(*trim_window_bounds(trim_window))
+
+
+if tile_cache is not None:
+    tiles.add_tile_route(server, tile_cache)
+
+
+@server.route("/video/<path:filename>")
+def serve_video(filename):
+    # only the scene video is served, its file name is in the URL so that
+    # a downloaded copy is named after it
+    if filename != os.path.basename(neon_scene_path):
+        flask.abort(404)
+    return video.send_video(neon_scene_path)
+
+
+@server.route("/export/<export_format>")
+def export_segment(export_format):
+    """
+    Stream the frames ?start= to &end= (by default, all of them) as a file
+    in an export format, written chunk by chunk as it is sent.
+    """
+    if export_format not in export.EXPORT_FORMATS:
+        flask.abort(404)
+    if not recording_loader.loaded:
+        flask.abort(503, "The recording is still being loaded")
+    if export_format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            flask.abort(501, "Parquet export requires pyarrow (pip install pyarrow)")
+
+    first, last = trim_window_bounds(None)
+    start = max(flask.request.args.get("start", first, type=int), first)
+    end = min(flask.request.args.get("end", last, type=int), last)
+    filename = export.segment_filename(recording_name, start, end, export_format)
+    return flask.Response(
+        export.export_chunks(
+            export.segment_columns(world_gaze_gps_imu_df), start, end, export_format
+        ),
+        mimetype=export.MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.callback(
+    Output("trajectory-view", "data"),
+    Input("map-graph", "zoom"),
+    Input("map-graph", "bounds"),
+)
+def update_trajectory_level_of_detail(zoom, bounds):
+    # only send the simplification level that fits the zoom, and only
+    # the part of it in (or near) the current viewport
+    return trajectory_view(zoom, bounds)
+
+
+# trims are applied in the browser, to the trajectory it already has
+app.clientside_callback(
+    ClientsideFunction(namespace="map_updates", function_name="apply_trim"),
+    Output("wearer-trajectory", "positions"),
+    Input("trajectory-view", "data"),
+    Input("trim-window", "data"),
+)
+
+
+@functools.lru_cache(maxsize=16)
+def spatial_index_for_window(start, end):
+    """
+    KD-tree over the trajectory within a trim window. It is built on first
+    use and then reused for every click on that window.
+    """
+    from spatial_index import build_spatial_index
+
+    return build_spatial_index(
+        frame_timeline["latitude"][start : end + 1],
+        frame_timeline["longitude"][start : end + 1],
+    )
+
+
+@functools.lru_cache(maxsize=32)
+def nearest_row_to_click(clicked_lat, clicked_lon, start, end):
+    """
+    Row of the trajectory sample closest (in meters) to a clicked map point.
+    Memoized, as both update_map_on_click and seek_video resolve each click.
+    """
+    from spatial_index import query_nearest
+
+    if end < start:
+        return None
+    point_index, _ = query_nearest(
+        spatial_index_for_window(start, end), clicked_lat, clicked_lon
+    )
+    if point_index is None:
+        return None
+    return start + point_index
+
+
+@app.callback(
+    Output("wearer-pose", "data", allow_duplicate=True),
     Input("map-graph", "clickData"),
+    State("trim-window", "data"),
 )
-def update_map_on_click(clickData):
-    global subset_df
-    global trimmed
+def update_map_on_click(clickData, trim_window):
     if clickData:
         point = clickData["latlng"]
         clicked_lon = point["lng"]
         clicked_lat = point["lat"]
 
-        dist = 0
-        if trimmed:
-            dist = np.sqrt(
-                (subset_df["latitude"] - clicked_lat) ** 2
-                + (subset_df["longitude"] - clicked_lon) ** 2
-            )
-        else:
-            dist = np.sqrt(
-                (gps_imu_df["latitude"] - clicked_lat) ** 2
-                + (gps_imu_df["longitude"] - clicked_lon) ** 2
-            )
-
-        point_index = np.argmin(dist.values)
-
-        closest_lat = []
-        closest_lon = []
-        heading = []
-        gaze_azi = []
-        if trimmed:
-            closest_lat = subset_df.iloc[point_index]["latitude"]
-            closest_lon = subset_df.iloc[point_index]["longitude"]
-            heading = subset_df.iloc[point_index]["yaw [deg]"] + 90
-            gaze_azi = subset_df.iloc[point_index]["gaze azi world [deg]"] + 90
-        else:
-            closest_lat = gps_imu_df.iloc[point_index]["latitude"]
-            closest_lon = gps_imu_df.iloc[point_index]["longitude"]
-            heading = gps_imu_df.iloc[point_index]["yaw [deg]"] + 90
-            gaze_azi = gps_imu_df.iloc[point_index]["gaze azi world [deg]"] + 90
-
-        pie_positions = []
-        for i in range(number_of_gradient_layers, 0, -1):
-            radius = (i / number_of_gradient_layers) * maximum_radius
-
-            # Get the coordinates for the current sector
-            sector_coords = create_leaflet_pie_sector_coords(
-                closest_lat,
-                closest_lon,
-                radius,
-                pie_start_angle + heading,
-                pie_end_angle + heading,
-            )
-            pie_positions.append(sector_coords)
-
-        new_x = closest_lon + 0.0006 * np.cos(np.radians(gaze_azi))
-        new_y = closest_lat + 0.0006 * np.sin(np.radians(gaze_azi))
-
-        return (
-            [closest_lat, closest_lon],
-            [[closest_lat, closest_lon], [new_y, new_x]],
-            pie_positions,
+        point_index = nearest_row_to_click(
+            clicked_lat, clicked_lon, *trim_window_bounds(trim_window)
         )
+        if point_index is None:
+            return dash.no_update
+
+        return pose_at(point_index)
     else:
         return dash.no_update
 
@@ -792,63 +1184,56 @@ def update_map_on_click(clickData):
     Output("video-player", "seekTo", allow_duplicate=True),
     Input("gps-event-selector", "value"),
     Input("map-graph", "clickData"),
+    State("trim-window", "data"),
 )
-def seek_video(selected_gps_event, clickData):
-    global prev_selected_event
-    global subset_df
-    global trimmed
-    global trim_event1
-    global trim_event2
-    if selected_gps_event and selected_gps_event != prev_selected_event:
-        # Reset the clickData to None when a new event is selected
+def seek_video(selected_gps_event, clickData, trim_window):
+    if dash.ctx.triggered_id == "gps-event-selector":
+        # Ignore the last map click when a new event is selected
         clickData = None
-        prev_selected_event = selected_gps_event
 
     if clickData:
         point = clickData["latlng"]
         clicked_lon = point["lng"]
         clicked_lat = point["lat"]
 
-        dist = 0
-        if trimmed:
-            dist = np.sqrt(
-                (subset_df["latitude"] - clicked_lat) ** 2
-                + (subset_df["longitude"] - clicked_lon) ** 2
-            )
-        else:
-            dist = np.sqrt(
-                (world_gps_imu_df["latitude"] - clicked_lat) ** 2
-                + (world_gps_imu_df["longitude"] - clicked_lon) ** 2
-            )
-
-        point_index = np.argmin(dist.values)
-
-        # Get the corresponding timestamp from the dataframe.
-        timestamp = 0
-        if trimmed:
-            timestamp = subset_df.index[point_index] - world_gps_imu_df.index.min()
-        else:
-            timestamp = (
-                world_gps_imu_df.index[point_index] - world_gps_imu_df.index.min()
-            )
+        point_index = nearest_row_to_click(
+            clicked_lat, clicked_lon, *trim_window_bounds(trim_window)
+        )
+        if point_index is None:
+            return dash.no_update
 
-        # Convert the timestamp to seconds.
-        timestamp = timestamp.total_seconds()
-        return timestamp
+        # Seek to the corresponding frame, in seconds since the first frame.
+        return frame_timeline.seconds_since_start(
+            frame_timeline.timestamps_ns[point_index]
+        )
     elif selected_gps_event:
-        # Get the selected event's timestamp and convert it to seconds.
-        # if selected_gps_event < trim_event1:
-        # selected_gps_event = trim_event1
-        # elif selected_gps_event > trim_event2:
-        # selected_gps_event = trim_event2
-
+        # Get the selected event's timestamp, kept within this session's
+        # trim window, and convert it to seconds.
+        start, end = trim_window_bounds(trim_window)
+        if end < start:
+            return dash.no_update
         selected_event = event_gps_list[selected_gps_event - 1]
-        timestamp = selected_event["timestamp"] - world_gps_imu_df.index.min()
-        timestamp = timestamp.total_seconds()
-        return timestamp
+        timestamp_ns = min(
+            max(
+                selected_event["timestamp [ns]"],
+                frame_timeline.timestamps_ns[start],
+            ),
+            frame_timeline.timestamps_ns[end],
+        )
+        return frame_timeline.seconds_since_start(timestamp_ns)
 
     return dash.no_update
 
 
+# opt-in instrumentation, installed after all callbacks are registered
+if args.profile_callbacks or args.profile_dir is not None:
+    callback_profiler = profiling.CallbackProfiler(profile_dir=args.profile_dir)
+    callback_profiler.install(app)
+    atexit.register(callback_profiler.print)
+
+
 if __name__ == "__main__":
-    app.run(debug=True)
+    recording_loader.start()
+    # without the reloader, which would load the recording a second time
+    # in a child process
+    app.run(debug=True, use_reloader=False)
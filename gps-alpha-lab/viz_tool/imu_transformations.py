@@ -4,6 +4,10 @@
 import numpy as np
 from scipy.spatial.transform import Rotation as R
 
+# IMU samples transformed at a time by gaze_in_world_at_imu (about 20 min at
+# 110 Hz), which bounds the size of the temporary arrays
+GAZE_BLOCK_SIZE = 131072
+
 
 def transform_imu_to_world(imu_coordinates, imu_quaternions):
     # This array contains a timeseries of transformation matrices,
@@ -106,6 +110,130 @@ def imu_heading_in_world(imu_quaternions):
     return transform_imu_to_world(heading_neutral_in_imu_coords, imu_quaternions)
 
 
+def rotate_by_quaternions(vectors, imu_quaternions):
+    """
+    Rotate 3D vectors by unit quaternions (w, x, y, z) without building
+    per-sample rotation matrices.
+
+    Uses v' = v + 2w (q x v) + 2 q x (q x v), which only needs a few
+    temporary (N, 3) arrays instead of an (N, 3, 3) matrix stack.
+    """
+
+    imu_quaternions = np.asarray(imu_quaternions, dtype=np.float64)
+    # the quaternions in the IMU CSV are rounded (float32), normalized as
+    # Rotation.from_quat does, so the result is the same as with SciPy
+    imu_quaternions = imu_quaternions / np.linalg.norm(
+        imu_quaternions, axis=1, keepdims=True
+    )
+    w = imu_quaternions[:, :1]
+    q_xyz = imu_quaternions[:, 1:]
+
+    t = 2.0 * np.cross(q_xyz, vectors)
+    return vectors + w * t + np.cross(q_xyz, t)
+
+
+def slerp_quaternions(timestamps_ns, imu_quaternions, target_ns):
+    """
+    Spherical linear interpolation of IMU orientations at arbitrary timestamps.
+
+    Only the two IMU samples around each target are used, so the cost only
+    depends on the number of targets. Targets outside of the IMU time range
+    get the first/last orientation.
+
+    Args:
+        timestamps_ns (np.ndarray): Sorted IMU timestamps in nanoseconds.
+        imu_quaternions (np.ndarray): An (N, 4) array of unit (w, x, y, z).
+        target_ns (np.ndarray): Timestamps to interpolate at, in nanoseconds.
+
+    Returns:
+        np.ndarray: An (M, 4) array of unit (w, x, y, z) quaternions.
+    """
+    imu_quaternions = np.asarray(imu_quaternions, dtype=np.float64)
+    target_ns = np.asarray(target_ns)
+
+    # the IMU samples before and after each target
+    after = np.clip(
+        np.searchsorted(timestamps_ns, target_ns, side="right"),
+        1,
+        max(len(timestamps_ns) - 1, 1),
+    )
+    before = after - 1
+    after = np.minimum(after, len(timestamps_ns) - 1)
+
+    span = (timestamps_ns[after] - timestamps_ns[before]).astype(np.float64)
+    offset = (target_ns - timestamps_ns[before]).astype(np.float64)
+    fraction = np.divide(offset, span, out=np.zeros_like(offset), where=span > 0)
+    fraction = np.clip(fraction, 0.0, 1.0)[:, np.newaxis]
+
+    q0 = imu_quaternions[before]
+    q1 = imu_quaternions[after]
+
+    # q and -q are the same rotation, take the shorter way around
+    dot = np.sum(q0 * q1, axis=1, keepdims=True)
+    q1 = np.where(dot < 0, -q1, q1)
+    dot = np.abs(dot)
+
+    angle = np.arccos(np.clip(dot, -1.0, 1.0))
+    sin_angle = np.sin(angle)
+    # fall back to linear interpolation for nearly identical orientations
+    nearly_equal = sin_angle < 1e-6
+    safe_sin = np.where(nearly_equal, 1.0, sin_angle)
+    w0 = np.where(
+        nearly_equal, 1.0 - fraction, np.sin((1.0 - fraction) * angle) / safe_sin
+    )
+    w1 = np.where(nearly_equal, fraction, np.sin(fraction * angle) / safe_sin)
+
+    interpolated = w0 * q0 + w1 * q1
+    return interpolated / np.linalg.norm(interpolated, axis=1, keepdims=True)
+
+
+def interpolate_gaze_directions(gaze_ns, gaze_elevation, gaze_azimuth, target_ns):
+    """
+    Interpolate gaze at arbitrary timestamps. Gaze directions are interpolated
+    as unit vectors in scene camera coordinates (normalized, so following the
+    arc between two samples) rather than linearly in elevation and azimuth.
+
+    Returns:
+        np.ndarray: An (M, 3) array of unit gaze vectors in scene coordinates.
+    """
+    cart_gazes_in_scene = spherical_to_cartesian_scene(gaze_elevation, gaze_azimuth)
+
+    # relative to the first sample, to keep float64 precision
+    x = (np.asarray(target_ns) - gaze_ns[0]).astype(np.float64)
+    xp = (gaze_ns - gaze_ns[0]).astype(np.float64)
+    interpolated = np.column_stack(
+        [np.interp(x, xp, cart_gazes_in_scene[:, i]) for i in range(3)]
+    )
+
+    return interpolated / np.linalg.norm(interpolated, axis=1, keepdims=True)
+
+
+def gaze_in_world_at(
+    gaze_ns, gaze_elevation, gaze_azimuth, imu_ns, imu_quaternions, target_ns
+):
+    """
+    World-relative gaze at a target timeline (e.g., the scene camera frames).
+
+    Gaze and IMU orientation are both interpolated at the target timestamps
+    (orientation with slerp), so the transformation only runs for the samples
+    that are actually used.
+
+    Returns:
+        tuple: (elevation, azimuth) of the gaze in world coordinates,
+            in degrees, see cartesian_to_spherical_world.
+    """
+    cart_gazes_in_scene = interpolate_gaze_directions(
+        gaze_ns, gaze_elevation, gaze_azimuth, target_ns
+    )
+    cart_gazes_in_imu = transform_scene_to_imu(
+        cart_gazes_in_scene, translation_in_imu=np.zeros(3)
+    )
+    cart_gazes_in_world = rotate_by_quaternions(
+        cart_gazes_in_imu, slerp_quaternions(imu_ns, imu_quaternions, target_ns)
+    )
+    return cartesian_to_spherical_world(cart_gazes_in_world)
+
+
 def cartesian_to_spherical_world(world_points_3d):
     """
     Convert points in 3D Cartesian world coordinates to spherical coordinates.
@@ -138,4 +266,147 @@ def cartesian_to_spherical_world(world_points_3d):
     elevation = np.rad2deg(elevation)
     azimuth = np.rad2deg(azimuth)
 
-    return elevation, azimuth
\ No newline at end of file
+    return elevation, azimuth
+
+
+def gaze_3d_to_world_chunked(blocks):
+    """
+    Streaming variant of gaze_3d_to_world + cartesian_to_spherical_world.
+
+    Peak memory is bounded by the size of a single block, so arbitrarily
+    long recordings can be processed block by block.
+
+    Args:
+        blocks (iterable): Yields (timestamps, gaze, imu_quaternions) tuples,
+            where gaze is an (N, 2) array of [elevation, azimuth] in degrees
+            and imu_quaternions is an (N, 4) array of (w, x, y, z), both
+            sampled at the same timestamps.
+
+    Yields:
+        tuple: (timestamps, elevation, azimuth) of the gaze in world
+            coordinates, in degrees.
+    """
+    for timestamps, gaze, imu_quaternions in blocks:
+        if len(timestamps) == 0:
+            continue
+
+        cart_gazes_in_scene = spherical_to_cartesian_scene(gaze[:, 0], gaze[:, 1])
+        cart_gazes_in_imu = transform_scene_to_imu(
+            cart_gazes_in_scene, translation_in_imu=np.zeros(3)
+        )
+        cart_gazes_in_world = rotate_by_quaternions(cart_gazes_in_imu, imu_quaternions)
+        elevation, azimuth = cartesian_to_spherical_world(cart_gazes_in_world)
+
+        yield timestamps, elevation, azimuth
+
+
+def resample_gaze_to_imu_chunked(gaze_blocks, imu_blocks):
+    """
+    Linearly interpolate gaze onto the IMU timestamps, one IMU block at a time.
+
+    Only the gaze samples needed to cover the current IMU block are kept in
+    memory. As with np.interp, IMU samples outside of the gaze time range are
+    clamped to the first/last gaze sample.
+
+    Args:
+        gaze_blocks (iterable): Yields (timestamps, gaze) tuples, where
+            timestamps are int64 nanoseconds and gaze is an (N, 2) array of
+            [elevation, azimuth] in degrees.
+        imu_blocks (iterable): Yields (timestamps, imu_quaternions) tuples.
+
+    Yields:
+        tuple: (timestamps, gaze, imu_quaternions) blocks, ready to be passed
+            to gaze_3d_to_world_chunked.
+    """
+    gaze_blocks = iter(gaze_blocks)
+    buffer_ts = np.empty(0, dtype=np.int64)
+    buffer_gaze = np.empty((0, 2))
+    gaze_exhausted = False
+
+    for imu_ts, imu_quaternions in imu_blocks:
+        if len(imu_ts) == 0:
+            continue
+
+        # pull gaze until it extends past the end of this IMU block
+        while not gaze_exhausted and (
+            len(buffer_ts) == 0 or buffer_ts[-1] < imu_ts[-1]
+        ):
+            try:
+                gaze_ts, gaze = next(gaze_blocks)
+            except StopIteration:
+                gaze_exhausted = True
+                break
+            buffer_ts = np.concatenate([buffer_ts, gaze_ts])
+            buffer_gaze = np.concatenate([buffer_gaze, gaze])
+
+        if len(buffer_ts) == 0:
+            return
+
+        # interpolate relative to the buffer start to keep float64 precision
+        ref = buffer_ts[0]
+        x = (imu_ts - ref).astype(np.float64)
+        xp = (buffer_ts - ref).astype(np.float64)
+        resampled = np.column_stack(
+            [
+                np.interp(x, xp, buffer_gaze[:, 0]),
+                np.interp(x, xp, buffer_gaze[:, 1]),
+            ]
+        )
+
+        yield imu_ts, resampled, imu_quaternions
+
+        # keep only the samples that later IMU blocks can still interpolate from
+        keep_from = max(np.searchsorted(buffer_ts, imu_ts[-1], side="right") - 1, 0)
+        buffer_ts = buffer_ts[keep_from:]
+        buffer_gaze = buffer_gaze[keep_from:]
+
+
+def array_blocks(block_size, timestamps, *columns):
+    """
+    Split a stream into blocks of block_size samples, e.g., to pass an
+    in-memory recording to the chunked transforms.
+
+    Yields:
+        tuple: (timestamps, *columns) of each block, as views.
+    """
+    for first in range(0, len(timestamps), block_size):
+        block = slice(first, first + block_size)
+        yield (timestamps[block],) + tuple(column[block] for column in columns)
+
+
+def gaze_in_world_at_imu(
+    gaze_ns,
+    gaze_elevation,
+    gaze_azimuth,
+    imu_ns,
+    imu_quaternions,
+    block_size=GAZE_BLOCK_SIZE,
+):
+    """
+    World-relative gaze at every IMU sample: gaze is linearly interpolated at
+    the IMU timestamps and transformed with the IMU orientation, block by
+    block (see resample_gaze_to_imu_chunked and gaze_3d_to_world_chunked).
+
+    Returns:
+        tuple: (elevation, azimuth) of the gaze in world coordinates,
+            in degrees, see cartesian_to_spherical_world.
+    """
+    gaze = np.column_stack([gaze_elevation, gaze_azimuth]).astype(np.float64)
+    blocks = gaze_3d_to_world_chunked(
+        resample_gaze_to_imu_chunked(
+            array_blocks(block_size, gaze_ns, gaze),
+            array_blocks(block_size, imu_ns, imu_quaternions),
+        )
+    )
+
+    elevation = np.empty(len(imu_ns))
+    azimuth = np.empty(len(imu_ns))
+    first = 0
+    for _, block_elevation, block_azimuth in blocks:
+        stop = first + len(block_elevation)
+        elevation[first:stop] = block_elevation
+        azimuth[first:stop] = block_azimuth
+        first = stop
+    if first < len(imu_ns):
+        raise ValueError("Cannot compute gaze in the world without gaze samples")
+    return elevation, azimuth
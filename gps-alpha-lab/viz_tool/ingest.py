@@ -0,0 +1,167 @@
+import os
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+# pandas' C parser keeps resident memory lowest. pyarrow's multithreaded
+# reader parses about twice as fast, but needs pyarrow to be installed.
+CSV_ENGINES = ["c", "pyarrow"]
+CSV_ENGINE = "c"
+
+# Only the columns the tool uses are read, with compact dtypes:
+# int64 nanosecond timestamps, float32 angles and float64 positions
+# (float32 would only resolve about 0.5 m of longitude/latitude).
+WORLD_COLUMNS = {"timestamp [ns]": np.int64}
+GAZE_COLUMNS = {
+    "timestamp [ns]": np.int64,
+    "elevation [deg]": np.float32,
+    "azimuth [deg]": np.float32,
+}
+IMU_COLUMNS = {
+    "timestamp [ns]": np.int64,
+    "yaw [deg]": np.float32,
+    "quaternion w": np.float32,
+    "quaternion x": np.float32,
+    "quaternion y": np.float32,
+    "quaternion z": np.float32,
+}
+EVENTS_COLUMNS = {"timestamp [ns]": np.int64, "name": str}
+GPS_COLUMNS = {
+    "timestamp [ns]": np.int64,
+    "latitude": np.float64,
+    "longitude": np.float64,
+}
+
+
+def read_columns(path, columns, engine=None):
+    """
+    Read only the given columns of a CSV file, with explicit dtypes.
+
+    Blank lines (as written between batches by the Android app) are skipped.
+
+    Args:
+        path (str): CSV file path.
+        columns (dict): Maps column name -> dtype.
+        engine (str): "c" or "pyarrow" (see CSV_ENGINES), defaults to
+            CSV_ENGINE.
+
+    Returns:
+        pd.DataFrame: The requested columns, in the order given.
+    """
+    engine = engine or CSV_ENGINE
+    df = pd.read_csv(
+        path,
+        usecols=list(columns),
+        dtype=columns,
+        engine=engine,
+        skip_blank_lines=True,
+    )
+
+    if engine == "pyarrow":
+        import pyarrow
+
+        # the columns were converted to NumPy, so hand the parse buffers
+        # back to the OS instead of keeping them in arrow's memory pool
+        pyarrow.default_memory_pool().release_unused()
+
+    return df[list(columns)]
+
+
+def read_world_timestamps(neon_folder_path, engine=None):
+    return read_columns(
+        os.path.join(neon_folder_path, "world_timestamps.csv"), WORLD_COLUMNS, engine
+    )
+
+
+def read_gaze(neon_folder_path, engine=None):
+    return read_columns(
+        os.path.join(neon_folder_path, "gaze.csv"), GAZE_COLUMNS, engine
+    )
+
+
+def read_imu(neon_folder_path, engine=None):
+    return read_columns(os.path.join(neon_folder_path, "imu.csv"), IMU_COLUMNS, engine)
+
+
+def read_events(neon_folder_path, engine=None):
+    return read_columns(
+        os.path.join(neon_folder_path, "events.csv"), EVENTS_COLUMNS, engine
+    )
+
+
+def read_gps(gps_csv_path, engine=None):
+    gps_df = read_columns(gps_csv_path, GPS_COLUMNS, engine)
+    # rows cut off mid-write (e.g., from a recording that is still running)
+    return gps_df.dropna()
+
+
+class StageReport:
+    """
+    Records wall time and memory use per processing stage.
+
+    When enabled, Python and NumPy allocations are traced (tracemalloc),
+    which slows processing down a little, so it is opt-in. Use as:
+
+        report = StageReport(enabled=True)
+        with report.stage("read gaze"):
+            ...
+        report.print()
+
+    Independently of that, on_stage (if given) is called with the name of
+    every stage as it starts, e.g. to show loading progress.
+    """
+
+    def __init__(self, enabled=False, on_stage=None):
+        self.enabled = enabled
+        self.on_stage = on_stage
+        self.stages = []
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def print(self, file=None):
+        if not self.enabled:
+            return
+        print(
+            f"{'stage':<28}{'time [s]':>10}{'peak [MB]':>12}{'in use [MB]':>15}",
+            file=file,
+        )
+        for name, seconds, peak, in_use in self.stages:
+            print(
+                f"{name:<28}{seconds:>10.2f}{peak / 1e6:>12.1f}{in_use / 1e6:>15.1f}",
+                file=file,
+            )
+
+
+class _Stage:
+    def __init__(self, report, name):
+        self.report = report
+        self.name = name
+
+    def __enter__(self):
+        if self.report.on_stage is not None:
+            self.report.on_stage(self.name)
+        if self.report.enabled:
+            tracemalloc.reset_peak()
+            self.start_current = tracemalloc.get_traced_memory()[0]
+            self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.report.enabled:
+            seconds = time.perf_counter() - self.start_time
+            current, peak = tracemalloc.get_traced_memory()
+            # peak is reported relative to what was allocated before the stage
+            self.report.stages.append(
+                (
+                    self.name,
+                    seconds,
+                    peak - self.start_current,
+                    current,
+                )
+            )
+        return False
@@ -0,0 +1,290 @@
+import bisect
+import os
+import threading
+
+import numpy as np
+from gps_cleaning import GpsCleaner
+from scipy.interpolate import PchipInterpolator
+
+
+class GpsTail:
+    """
+    Follows a GPS CSV file that is still being written, like `tail -f`.
+
+    Every poll only reads the bytes appended since the previous one. A row
+    is parsed once its line is complete, so a batch that is flushed halfway
+    through a line is picked up on the next poll.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # counts the times the file was truncated or replaced
+        self.generation = 0
+        self._offset = 0
+        self._partial = b""
+        self._inode = None
+
+    def poll(self):
+        """
+        Returns:
+            tuple: (timestamps [ns], latitudes, longitudes) of the rows
+                appended since the last poll.
+        """
+        try:
+            stat = os.stat(self.path)
+            size, inode = stat.st_size, stat.st_ino
+        except FileNotFoundError:
+            size, inode = 0, None
+
+        if self._offset and (size < self._offset or inode != self._inode):
+            # the file was replaced or truncated, start over
+            self.generation += 1
+            self._offset = 0
+            self._partial = b""
+        self._inode = inode
+
+        data = b""
+        if size > self._offset:
+            with open(self.path, "rb") as f:
+                f.seek(self._offset)
+                data = f.read(size - self._offset)
+            self._offset += len(data)
+
+        data = self._partial + data
+        complete, _, self._partial = data.rpartition(b"\n")
+
+        timestamps = []
+        lats = []
+        lons = []
+        for line in complete.split(b"\n"):
+            fields = line.strip().split(b",")
+            # skip the header, blank lines and anything else malformed
+            if len(fields) < 3:
+                continue
+            try:
+                timestamp = int(fields[0])
+                lat = float(fields[1])
+                lon = float(fields[2])
+            except ValueError:
+                continue
+            timestamps.append(timestamp)
+            lats.append(lat)
+            lons.append(lon)
+
+        return (
+            np.array(timestamps, dtype=np.int64),
+            np.array(lats, dtype=np.float64),
+            np.array(lons, dtype=np.float64),
+        )
+
+
+class IncrementalResampler:
+    """
+    PCHIP interpolation of a growing GPS track onto a regular timeline.
+
+    A PCHIP segment only depends on its two end points and their neighbors,
+    so a segment is final once the point after it has arrived. Only those
+    samples are emitted, and they are identical to interpolating the complete
+    track at once. Only the last few points of the track are kept.
+
+    As with alignment.PiecewiseInterpolator, the track is split at dropouts
+    longer than max_gap_ns, and every stretch between them is interpolated
+    on its own, on a timeline that starts at its first sample.
+    """
+
+    def __init__(self, interval_ns, max_gap_ns=np.inf):
+        self.interval_ns = interval_ns
+        self.max_gap_ns = max_gap_ns
+        # number of the current stretch between dropouts
+        self.segment = 0
+        self._timestamps = np.empty(0, dtype=np.int64)
+        self._lats = np.empty(0)
+        self._lons = np.empty(0)
+        self._next_timestamp = None
+
+    def extend(self, timestamps, lats, lons):
+        """
+        Add new GPS samples.
+
+        Returns:
+            tuple: (timestamps [ns], latitudes, longitudes, segments) of the
+                resampled track that became final with these samples, where
+                segments numbers the stretch between dropouts of each sample.
+        """
+        # GPS timestamps must be strictly increasing for the interpolation
+        keep = np.ones(len(timestamps), dtype=bool)
+        last = self._timestamps[-1] if len(self._timestamps) else None
+        for i, timestamp in enumerate(timestamps):
+            if last is not None and timestamp <= last:
+                keep[i] = False
+            else:
+                last = timestamp
+        timestamps, lats, lons = timestamps[keep], lats[keep], lons[keep]
+
+        # the stretch before a dropout is final up to its last sample
+        previous = self._timestamps[-1:]
+        dropouts = np.flatnonzero(
+            np.diff(np.concatenate([previous, timestamps])) > self.max_gap_ns
+        ) + (1 - len(previous))
+        parts = []
+        first = 0
+        for stop in dropouts.tolist() + [len(timestamps)]:
+            self._timestamps = np.concatenate(
+                [self._timestamps, timestamps[first:stop]]
+            )
+            self._lats = np.concatenate([self._lats, lats[first:stop]])
+            self._lons = np.concatenate([self._lons, lons[first:stop]])
+            parts.append(self._resample(final=stop < len(timestamps)))
+            if stop < len(timestamps):
+                self._timestamps = self._timestamps[:0]
+                self._lats = self._lats[:0]
+                self._lons = self._lons[:0]
+                self._next_timestamp = None
+                self.segment += 1
+            first = stop
+
+        return tuple(np.concatenate(columns) for columns in zip(*parts))
+
+    def _resample(self, final):
+        empty = (
+            np.empty(0, dtype=np.int64),
+            np.empty(0),
+            np.empty(0),
+            np.empty(0, dtype=np.int64),
+        )
+        if len(self._timestamps) == 0 or (not final and len(self._timestamps) < 3):
+            return empty
+        if self._next_timestamp is None:
+            self._next_timestamp = int(self._timestamps[0])
+
+        # everything up to the second to last point is final, and up to the
+        # last point at the end of a stretch
+        final_until = int(self._timestamps[-1 if final else -2])
+        if final_until < self._next_timestamp:
+            return empty
+
+        count = (final_until - self._next_timestamp) // self.interval_ns + 1
+        targets = self._next_timestamp + np.arange(count) * self.interval_ns
+        self._next_timestamp = int(targets[-1]) + self.interval_ns
+
+        if len(self._timestamps) == 1:
+            # a lone sample is only valid at its own timestamp
+            new_lats = self._lats.copy()
+            new_lons = self._lons.copy()
+        else:
+            # interpolate relative to the first retained point, to keep precision
+            t = (self._timestamps - self._timestamps[0]).astype(np.float64)
+            t_targets = (targets - self._timestamps[0]).astype(np.float64)
+            new_lats = PchipInterpolator(t, self._lats)(t_targets)
+            new_lons = PchipInterpolator(t, self._lons)(t_targets)
+
+        # the next final segment starts at the second to last point, and the
+        # slope there depends on the point before it
+        self._timestamps = self._timestamps[-3:]
+        self._lats = self._lats[-3:]
+        self._lons = self._lons[-3:]
+
+        return targets, new_lats, new_lons, np.full(count, self.segment)
+
+
+class LiveTrajectory:
+    """
+    The trajectory of a GPS recording in progress, resampled to a regular
+    timeline. The positions list only ever grows, so clients can fetch what
+    was added since they last asked by keeping a count. It is drawn as
+    separate lines, broken at GPS dropouts longer than max_gap_ns; each line
+    starts at the position in line_starts.
+
+    If the GPS file is truncated or replaced, e.g., by a new recording, the
+    trajectory starts over, and generation is incremented, so that clients
+    know to drop what they have.
+
+    With clean_gps, outliers are removed and the track is smoothed (see
+    gps_cleaning.GpsCleaner) before it is resampled. The smoother holds back
+    the last cleaning_lag samples, so the trajectory trails the latest
+    position (which is filtered right away) by that many samples.
+    """
+
+    def __init__(
+        self,
+        gps_csv_path,
+        interval_ns,
+        decimals=7,
+        clean_gps=True,
+        cleaning_lag=5,
+        max_gap_ns=np.inf,
+    ):
+        self.interval_ns = interval_ns
+        self.decimals = decimals
+        self.clean_gps = clean_gps
+        self.cleaning_lag = cleaning_lag
+        self.max_gap_ns = max_gap_ns
+        self._tail = GpsTail(gps_csv_path)
+        self._lock = threading.Lock()
+        self._start()
+
+    def _start(self):
+        self.generation = self._tail.generation
+        self.positions = []
+        self.line_starts = []
+        self.latest = None
+        self._cleaner = GpsCleaner(lag=self.cleaning_lag) if self.clean_gps else None
+        self._resampler = IncrementalResampler(self.interval_ns, self.max_gap_ns)
+        self._segment = None
+
+    def update(self):
+        """
+        Read new GPS samples and append their part of the trajectory.
+
+        Returns:
+            tuple: (generation, number of positions in the trajectory).
+        """
+        with self._lock:
+            timestamps, lats, lons = self._tail.poll()
+            if self._tail.generation != self.generation:
+                # the samples are from a new file, none of the state applies
+                self._start()
+
+            if self._cleaner is not None:
+                timestamps, lats, lons = self._cleaner.process(timestamps, lats, lons)
+                latest = self._cleaner.latest
+                if latest is not None:
+                    self.latest = list(latest)
+            elif len(timestamps):
+                self.latest = [float(lats[-1]), float(lons[-1])]
+
+            _, new_lats, new_lons, segments = self._resampler.extend(
+                timestamps, lats, lons
+            )
+            # a new line starts with every stretch between dropouts
+            for i in np.flatnonzero(
+                np.diff(
+                    segments, prepend=-1 if self._segment is None else self._segment
+                )
+            ):
+                self.line_starts.append(len(self.positions) + int(i))
+            if len(segments):
+                self._segment = int(segments[-1])
+            self.positions.extend(
+                np.round(np.column_stack([new_lats, new_lons]), self.decimals).tolist()
+            )
+            return self.generation, len(self.positions)
+
+    def line_pieces(self, start, stop):
+        """
+        The positions start to stop (exclusive), split where lines start.
+
+        Returns:
+            tuple: (continued, pieces), where continued is the index of the
+                line that the first piece continues (None if it starts a new
+                line), and every later piece starts a new line.
+        """
+        with self._lock:
+            if stop <= start:
+                return None, []
+            line = bisect.bisect_right(self.line_starts, start) - 1
+            cuts = [start]
+            cuts += [s for s in self.line_starts[line + 1 :] if s < stop]
+            cuts.append(stop)
+            pieces = [self.positions[a:b] for a, b in zip(cuts[:-1], cuts[1:])]
+            return (None if self.line_starts[line] == start else line), pieces
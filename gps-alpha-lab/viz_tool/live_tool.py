@@ -0,0 +1,210 @@
+# /// script
+# requires-python = ">=3.11"
+# dependencies = [
+#     "dash",
+#     "dash-leaflet",
+#     "numpy",
+#     "scipy",
+# ]
+# ///
+import argparse
+import os
+import shlex
+
+import dash
+import dash_leaflet as dl
+import live
+import tiles
+from dash import Input, Output, State, dcc, html
+
+# parse command line arguments for the gps csv file that is being recorded
+parser = argparse.ArgumentParser(
+    description="Neon GPS Visualization Tool: follow a GPS recording in progress"
+)
+parser.add_argument("gps_csv", help="GPS CSV file path (it may not exist yet)")
+parser.add_argument(
+    "--resample-hz",
+    type=float,
+    default=5.0,
+    help="Rate at which the trajectory is interpolated between GPS samples",
+)
+parser.add_argument(
+    "--poll-interval",
+    type=float,
+    default=1.0,
+    help="Seconds between checks for new GPS samples",
+)
+parser.add_argument(
+    "--max-gps-gap",
+    type=float,
+    # processing.DEFAULT_MAX_GPS_GAP_S, spelled out as processing needs pandas
+    default=10.0,
+    help="GPS dropouts longer than this many seconds are left as gaps in the "
+    "trajectory instead of being interpolated across",
+)
+parser.add_argument(
+    "--raw-gps",
+    action="store_true",
+    help="Show the GPS samples as recorded, without removing outliers and "
+    "smoothing (which delays the trajectory by a few samples)",
+)
+
+parser.add_argument(
+    "--tile-url",
+    default=tiles.DEFAULT_TILE_URL,
+    help="URL template of the map tile server (see gps_viz_tool.py)",
+)
+parser.add_argument(
+    "--tile-cache",
+    default=tiles.DEFAULT_CACHE_DIR,
+    help="Folder in which map tiles are cached",
+)
+parser.add_argument(
+    "--tile-cache-size",
+    type=float,
+    default=tiles.DEFAULT_MAX_SIZE_MB,
+    help="Size limit of the tile cache in MB",
+)
+parser.add_argument(
+    "--no-tile-cache",
+    action="store_true",
+    help="Let the browser load the map tiles from the tile server directly",
+)
+
+# see gps_viz_tool.py
+if "GPS_VIZ_TOOL_ARGS" in os.environ:
+    args = parser.parse_args(shlex.split(os.environ["GPS_VIZ_TOOL_ARGS"]))
+else:
+    args = parser.parse_args()
+
+# map tiles are served from the on-disk cache (see gps_viz_tool.py)
+if args.no_tile_cache:
+    tile_cache = None
+    tile_layer_url = args.tile_url
+else:
+    tile_cache = tiles.TileCache(
+        args.tile_cache, args.tile_url, int(args.tile_cache_size * 1024 * 1024)
+    )
+    tile_layer_url = tiles.TILE_LAYER_URL
+
+live_trajectory = live.LiveTrajectory(
+    args.gps_csv,
+    interval_ns=int(1e9 / args.resample_hz),
+    clean_gps=not args.raw_gps,
+    max_gap_ns=args.max_gps_gap * 1e9,
+)
+
+initial_zoom = 17
+
+app = dash.Dash(__name__)
+server = app.server
+app.layout = html.Div(
+    [
+        dl.Map(
+            attributionControl=False,
+            children=[
+                dl.TileLayer(
+                    url=tile_layer_url,
+                    detectRetina=True,
+                ),
+                dl.Polyline(
+                    positions=[],
+                    color="blue",
+                    weight=1.5,
+                    id="wearer-trajectory",
+                ),
+                dl.CircleMarker(
+                    center=[0, 0],
+                    radius=8,
+                    color="black",
+                    fill=True,
+                    fillColor="black",
+                    opacity=0.0,
+                    fillOpacity=0.0,
+                    stroke=True,
+                    children=[dl.Tooltip(content="Wearer")],
+                    id="wearer-marker",
+                ),
+            ],
+            center=[0, 0],
+            zoom=2,
+            style={"height": "90vh"},
+            id="map-graph",
+        ),
+        html.Div(id="live-status", children="Waiting for GPS samples..."),
+        dcc.Interval(id="live-poll", interval=int(args.poll_interval * 1000)),
+        # generation and number of trajectory positions this browser tab
+        # already has (see live.LiveTrajectory)
+        dcc.Store(id="live-sent", data=None),
+    ]
+)
+
+
+if tile_cache is not None:
+    tiles.add_tile_route(server, tile_cache)
+
+
+@app.callback(
+    Output("wearer-trajectory", "positions"),
+    Output("wearer-marker", "center"),
+    Output("wearer-marker", "opacity"),
+    Output("wearer-marker", "fillOpacity"),
+    Output("map-graph", "viewport"),
+    Output("live-sent", "data"),
+    Output("live-status", "children"),
+    Input("live-poll", "n_intervals"),
+    State("live-sent", "data"),
+)
+def append_new_positions(n_intervals, sent):
+    generation, count = live_trajectory.update()
+    if sent is None or sent["generation"] != generation:
+        # a new browser tab, or the GPS file was replaced: the trajectory in
+        # the browser is replaced by the current one
+        sent_count = 0
+        positions = live_trajectory.line_pieces(0, count)[1]
+    elif count > sent["count"]:
+        # only the new positions are sent, and appended to the lines
+        # of the trajectory in the browser
+        sent_count = sent["count"]
+        continued, pieces = live_trajectory.line_pieces(sent_count, count)
+        positions = dash.Patch()
+        if continued is not None:
+            positions[continued].extend(pieces.pop(0))
+        for piece in pieces:
+            positions.append(piece)
+    else:
+        sent_count = count
+        positions = dash.no_update
+
+    sent = {"generation": generation, "count": count}
+    if live_trajectory.latest is None:
+        return (
+            positions,
+            dash.no_update,
+            0.0,
+            0.0,
+            dash.no_update,
+            sent,
+            "Waiting for GPS samples...",
+        )
+
+    # center the map once, when the first samples arrive
+    viewport = (
+        {"center": live_trajectory.latest, "zoom": initial_zoom}
+        if sent_count == 0 and count > 0
+        else dash.no_update
+    )
+
+    return (
+        positions,
+        live_trajectory.latest,
+        1.0,
+        1.0,
+        viewport,
+        sent,
+        f"{count} trajectory points",
+    )
+
+
+if __name__ == "__main__":
+    app.run(debug=True)
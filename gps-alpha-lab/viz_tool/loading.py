@@ -0,0 +1,131 @@
+import threading
+import time
+import traceback
+
+
+class BackgroundLoader:
+    """
+    Runs a slow loading function in a background thread, so that a server
+    can start (and show progress) while the data it serves is prepared.
+
+    The function is called with the loader and reports its progress by
+    starting named stages. Use as:
+
+        def load(loader):
+            loader.set_stage("read data")
+            ...
+            return data
+
+        loader = BackgroundLoader(load)
+        loader.start()
+        ...
+        data = loader.wait()
+    """
+
+    def __init__(self, function):
+        self.function = function
+        self.result = None
+        self.error = None
+        self._lock = threading.Lock()
+        self._stages = []
+        self._start_time = None
+        self._end_time = None
+        self._done = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Start loading in a background thread (if it has not started yet).
+        """
+        with self._lock:
+            if self._start_time is not None:
+                return
+            self._start_time = time.perf_counter()
+        self._thread = threading.Thread(
+            target=self._run, name="background-loader", daemon=True
+        )
+        self._thread.start()
+
+    def run(self):
+        """
+        Load in the calling thread (if loading has not started yet).
+
+        Returns:
+            The function's result, see wait.
+        """
+        with self._lock:
+            started = self._start_time is not None
+            if not started:
+                self._start_time = time.perf_counter()
+        if not started:
+            self._run()
+        return self.wait()
+
+    def _run(self):
+        try:
+            self.result = self.function(self)
+        except Exception as error:
+            self.error = error
+            traceback.print_exc()
+        finally:
+            self._end_time = time.perf_counter()
+            self._done.set()
+
+    def set_stage(self, name):
+        """
+        Mark the start of a new loading stage (and the end of the previous one).
+        """
+        with self._lock:
+            self._stages.append((name, time.perf_counter()))
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    @property
+    def loaded(self):
+        return self._done.is_set() and self.error is None
+
+    def wait(self, timeout=None):
+        """
+        Block until loading has finished.
+
+        Returns:
+            The function's result, or None if the timeout expired first.
+
+        Raises:
+            RuntimeError: If loading failed.
+        """
+        if not self._done.wait(timeout):
+            return None
+        if self.error is not None:
+            raise RuntimeError("Loading failed") from self.error
+        return self.result
+
+    def status(self):
+        """
+        The progress so far, e.g. to show in a loading view.
+
+        Returns:
+            dict: "stages" lists (name, seconds) of the stages started so
+                far, the last one still running unless "done". "elapsed" is
+                the time since loading started and "error" describes why
+                loading failed (or is None).
+        """
+        with self._lock:
+            now = time.perf_counter()
+            end = self._end_time if self._end_time is not None else now
+            stage_ends = [start for _, start in self._stages[1:]] + [end]
+            return {
+                "stages": [
+                    (name, stage_end - start)
+                    for (name, start), stage_end in zip(self._stages, stage_ends)
+                ],
+                "elapsed": 0.0 if self._start_time is None else end - self._start_time,
+                "done": self.done,
+                "error": (
+                    None
+                    if self.error is None
+                    else f"{type(self.error).__name__}: {self.error}"
+                ),
+            }
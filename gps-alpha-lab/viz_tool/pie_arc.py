@@ -40,3 +40,59 @@ def create_leaflet_pie_sector_coords(
     coords.append([center_lat, center_lon])
 
     return coords
+
+
+def create_unit_pie_sector_template(start_angle, end_angle, num_segments=50):
+    """
+    Precomputes the arc of a unit pie sector, so that sectors at any position,
+    radius and heading can later be derived without evaluating trig per point.
+
+    Args:
+        start_angle (float): The starting angle of the sector in degrees.
+        end_angle (float): The ending angle of the sector in degrees.
+        num_segments (int): The number of line segments to use to approximate the arc.
+
+    Returns:
+        np.ndarray: A (num_segments, 2) array of [cos, sin] for each arc angle.
+    """
+    angles = np.deg2rad(np.linspace(start_angle, end_angle, num_segments))
+    return np.column_stack([np.cos(angles), np.sin(angles)])
+
+
+def create_leaflet_pie_gradient_coords(
+    center_lat, center_lon, radii, heading, unit_template
+):
+    """
+    Vectorized version of create_leaflet_pie_sector_coords, which creates the
+    coordinates of several concentric pie sectors (e.g., gradient layers) in
+    one NumPy operation.
+
+    Args:
+        center_lat (float): Latitude of the center of the pie.
+        center_lon (float): Longitude of the center of the pie.
+        radii (np.ndarray): The radius of each sector in degrees.
+        heading (float): Rotation of the sectors in degrees, which is added
+            to the start and end angles of the template.
+        unit_template (np.ndarray): Output of create_unit_pie_sector_template.
+
+    Returns:
+        np.ndarray: A (len(radii), num_segments + 2, 2) array of [lat, lon]
+            coordinates, one closed polygon per radius.
+    """
+    # rotating the template by the heading only needs one sin/cos pair
+    heading_rad = np.deg2rad(heading)
+    cos_h = np.cos(heading_rad)
+    sin_h = np.sin(heading_rad)
+    cos_a = unit_template[:, 0] * cos_h - unit_template[:, 1] * sin_h
+    sin_a = unit_template[:, 1] * cos_h + unit_template[:, 0] * sin_h
+
+    radii = np.asarray(radii, dtype=np.float64)[:, np.newaxis]
+    num_points = len(unit_template) + 2
+
+    coords = np.empty((len(radii), num_points, 2))
+    coords[:, 0] = [center_lat, center_lon]
+    coords[:, -1] = [center_lat, center_lon]
+    coords[:, 1:-1, 0] = center_lat + radii * sin_a
+    coords[:, 1:-1, 1] = center_lon + radii * cos_a / np.cos(np.deg2rad(center_lat))
+
+    return coords
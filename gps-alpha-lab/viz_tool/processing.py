@@ -0,0 +1,274 @@
+import alignment
+import geocoding
+import gps_cleaning
+import imu_transformations as imu_transformations
+import ingest
+import numpy as np
+import pandas as pd
+
+# timelines the world-relative gaze can be computed at, see open_and_populate_data
+GAZE_TIMELINES = ["imu", "scene"]
+
+# longest GPS dropout that is still interpolated across (GPS is sampled at 1 Hz)
+DEFAULT_MAX_GPS_GAP_S = 10.0
+
+
+def open_and_populate_data(
+    neon_folder_path,
+    gps_csv_path,
+    report=None,
+    gaze_timeline="imu",
+    clean_gps=True,
+    max_gps_gap_s=DEFAULT_MAX_GPS_GAP_S,
+    csv_engine=None,
+):
+    """
+    Load a Neon recording and its GPS CSV, and align all streams onto the
+    scene camera timeline.
+
+    Args:
+        neon_folder_path (str): Neon Timeseries CSV folder path.
+        gps_csv_path (str): GPS CSV file path.
+        report (ingest.StageReport): Optional report of time and memory
+            used per loading stage.
+        gaze_timeline (str): "imu" transforms gaze resampled to every IMU
+            sample and takes the latest one for each scene frame. "scene"
+            interpolates gaze and slerps the IMU orientation directly at
+            the scene frame timestamps, which is faster and more accurate.
+        clean_gps (bool): Remove GPS outliers and smooth the track before
+            interpolating it (see gps_cleaning.GpsCleaner).
+        max_gps_gap_s (float): GPS dropouts longer than this are not
+            interpolated across. Scene frames in them (and before the first
+            or after the last GPS sample) have NaN latitude and longitude.
+        csv_engine (str): CSV parser to read the files with (see
+            ingest.CSV_ENGINES), by default ingest.CSV_ENGINE.
+
+    Returns:
+        tuple: (world_gaze_gps_imu_df, events_df), one row per scene frame
+            indexed by timestamp, and the recording's events.
+    """
+    if report is None:
+        report = ingest.StageReport()
+
+    # load the scene camera timestamps
+    # to enable synced playback of GPS and Neon scene video
+    with report.stage("read world timestamps"):
+        world_ns = ingest.read_world_timestamps(neon_folder_path, csv_engine)[
+            "timestamp [ns]"
+        ].values
+
+    # load GPS data and interpolate it a bit to better match
+    # the scene camera timestamps
+    with report.stage("read gps"):
+        gps_df = ingest.read_gps(gps_csv_path, csv_engine)
+        gps_ns = gps_df["timestamp [ns]"].values
+        lats = gps_df["latitude"].values
+        lons = gps_df["longitude"].values
+        del gps_df
+
+    if clean_gps:
+        with report.stage("clean gps"):
+            gps_ns, lats, lons = gps_cleaning.clean_gps(gps_ns, lats, lons)
+
+    # every stretch of GPS samples between dropouts is interpolated on its own
+    with report.stage("interpolate gps"):
+        gps_interp = alignment.PiecewiseInterpolator(
+            gps_ns, {"latitude": lats, "longitude": lons}, max_gps_gap_s * 1e9
+        )
+        gps_positions = gps_interp(world_ns)
+        gps_lat = gps_positions["latitude"]
+        gps_lon = gps_positions["longitude"]
+        del gps_ns, lats, lons, gps_interp, gps_positions
+
+    with report.stage("read gaze"):
+        gaze = ingest.read_gaze(neon_folder_path, csv_engine)
+        gaze_ns = gaze["timestamp [ns]"].values
+
+    # load imu data
+    with report.stage("read imu"):
+        imu = ingest.read_imu(neon_folder_path, csv_engine)
+        imu_ns = imu["timestamp [ns]"].values
+        quaternions = imu[
+            ["quaternion w", "quaternion x", "quaternion y", "quaternion z"]
+        ].to_numpy(dtype=np.float64)
+
+    with report.stage("gaze to world"):
+        if gaze_timeline == "scene":
+            gazes_ele_world, gazes_azi_world = imu_transformations.gaze_in_world_at(
+                gaze_ns,
+                gaze["elevation [deg]"].values,
+                gaze["azimuth [deg]"].values,
+                imu_ns,
+                quaternions,
+                world_ns,
+            )
+            gaze_world_stream = "world"
+        elif gaze_timeline == "imu":
+            # use imu_transformations to convert gaze elevation and azimuth,
+            # resampled to the IMU timestamps, to world relative coordinates,
+            # block by block instead of with a rotation matrix per sample
+            # see: https://docs.pupil-labs.com/alpha-lab/imu-transformations/
+            gazes_ele_world, gazes_azi_world = imu_transformations.gaze_in_world_at_imu(
+                gaze_ns,
+                gaze["elevation [deg]"].values,
+                gaze["azimuth [deg]"].values,
+                imu_ns,
+                quaternions,
+            )
+            gaze_world_stream = "imu"
+        else:
+            raise ValueError(f"Unknown gaze timeline: {gaze_timeline}")
+        del quaternions
+
+    # load events
+    with report.stage("read events"):
+        events_df = ingest.read_events(neon_folder_path, csv_engine)
+        events_df["timestamp"] = pd.to_datetime(events_df["timestamp [ns]"], unit="ns")
+
+    # align every stream onto the scene camera timeline in a single pass,
+    # one row per scene frame (same semantics as a backward merge_asof)
+    with report.stage("align streams"):
+        streams = {
+            "gps": (world_ns, {"latitude": gps_lat, "longitude": gps_lon}),
+            "imu": (imu_ns, {"yaw [deg]": imu["yaw [deg]"].values}),
+            "world": (
+                world_ns,
+                {"world_index": np.arange(len(world_ns), dtype=np.int32)},
+            ),
+            "gaze": (
+                gaze_ns,
+                {
+                    "elevation [deg]": gaze["elevation [deg]"].values,
+                    "azimuth [deg]": gaze["azimuth [deg]"].values,
+                },
+            ),
+        }
+        # world-relative gaze is taken from the stream it was computed at
+        streams[gaze_world_stream][1].update(
+            {
+                "gaze ele world [deg]": gazes_ele_world.astype(np.float32),
+                "gaze azi world [deg]": gazes_azi_world.astype(np.float32),
+            }
+        )
+        aligned = alignment.align_streams(world_ns, streams)
+        del streams, gaze, imu, gazes_ele_world, gazes_azi_world
+
+        # a single DataFrame on the aligned arrays, indexed by timestamp.
+        # It is the only copy of the recording that is kept for the app's lifetime.
+        world_gaze_gps_imu_df = pd.DataFrame(
+            aligned,
+            index=pd.DatetimeIndex(
+                pd.to_datetime(aligned["timestamp [ns]"], unit="ns"), name="timestamp"
+            ),
+        )
+        del aligned
+
+    return world_gaze_gps_imu_df, events_df
+
+
+def locate_events(world_gaze_gps_imu_df, events_df):
+    """
+    Position, heading and gaze direction at the scene frame closest to each
+    event.
+
+    Returns:
+        pd.DataFrame: The events' timestamps and names, with latitude,
+            longitude, yaw [deg] and gaze azi world [deg] columns.
+    """
+    # find the closest scene frame for all events in one vectorized lookup
+    world_idx = alignment.nearest_indices(
+        world_gaze_gps_imu_df["timestamp [ns]"].values,
+        events_df["timestamp [ns]"].values,
+    )
+    located_events_df = events_df[["timestamp [ns]", "name"]].copy()
+    for column in ["latitude", "longitude", "yaw [deg]", "gaze azi world [deg]"]:
+        located_events_df[column] = world_gaze_gps_imu_df[column].values[world_idx]
+
+    return located_events_df
+
+
+def geocode_event_locations(located_events_df, backend, cache=None):
+    """
+    Reverse geocode located events (see locate_events) with a geocoding
+    backend. Cached, concurrent and rate-limited, falling back to the event
+    name if a lookup fails.
+
+    Returns:
+        list: A location string for every event.
+    """
+    locations = list(located_events_df["name"])
+    # events in GPS gaps have no position to look up
+    located = np.flatnonzero(
+        np.isfinite(located_events_df["latitude"].values)
+        & np.isfinite(located_events_df["longitude"].values)
+    )
+    addresses = geocoding.reverse_geocode_many(
+        list(
+            zip(
+                located_events_df["latitude"].values[located].tolist(),
+                located_events_df["longitude"].values[located].tolist(),
+            )
+        ),
+        backend,
+        cache,
+    )
+
+    for idx, address in zip(located.tolist(), addresses):
+        if address is None:
+            print("Could not reverse geocode event: ", locations[idx])
+        else:
+            locations[idx] = address
+
+    return locations
+
+
+def reverse_geocode_events(world_gaze_gps_imu_df, events_df, backend=None, cache=None):
+    """
+    Locate all events on the trajectory and, if a geocoding backend is given,
+    name them after their address.
+
+    Returns:
+        tuple: (geocoded_events_df, event_gps_list), the events as a
+            DataFrame for the map markers and as a list of dicts for the
+            event selectors.
+    """
+    located_events_df = locate_events(world_gaze_gps_imu_df, events_df)
+    lats = located_events_df["latitude"].values
+    lons = located_events_df["longitude"].values
+    headings = located_events_df["yaw [deg]"].values
+    gaze_azis = located_events_df["gaze azi world [deg]"].values
+
+    if backend is not None:
+        locations = geocode_event_locations(located_events_df, backend, cache)
+    else:
+        locations = list(located_events_df["name"])
+
+    # having reverse geocoded events in a separate dataframe
+    # with a copy of the gps coordinates makes the event selector
+    # easier to implement and use
+    event_gps_list = [
+        {
+            "lat": lats[idx],
+            "lon": lons[idx],
+            "location": locations[idx],
+            "yaw [deg]": headings[idx],
+            "gaze azi world [deg]": gaze_azis[idx],
+            "timestamp": timestamp,
+            "timestamp [ns]": int(timestamp_ns),
+        }
+        for idx, (timestamp, timestamp_ns) in enumerate(
+            zip(events_df["timestamp"], events_df["timestamp [ns]"])
+        )
+    ]
+
+    # transform it to a dataframe
+    geocoded_events_df = pd.DataFrame(
+        {
+            "lat": lats,
+            "lon": lons,
+            "location": locations,
+            "size": [12] * len(locations),
+        }
+    )
+
+    return geocoded_events_df, event_gps_list
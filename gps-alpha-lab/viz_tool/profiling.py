@@ -0,0 +1,161 @@
+import cProfile
+import heapq
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import flask
+
+# requests to this Dash endpoint run the server side callbacks
+DASH_CALLBACK_PATH = "/_dash-update-component"
+
+
+class CallbackProfiler:
+    """
+    Opt-in instrumentation of a Dash app's server side callbacks.
+
+    For every callback it records the number of calls, the server time per
+    call (including serialization of the response), the size of the JSON
+    response and the recent call rate. The numbers are served as JSON on
+    `path`. With a profile_dir, each call also runs under cProfile and the
+    stats of the slowest `keep_slowest` calls of every callback are written
+    to that folder as .prof files (e.g., to open with snakeviz).
+
+    Use as:
+
+        profiler = CallbackProfiler(profile_dir="profiles")
+        profiler.install(app)
+    """
+
+    def __init__(self, path="/_callback-profile", profile_dir=None, keep_slowest=5):
+        self.path = path
+        self.profile_dir = profile_dir
+        self.keep_slowest = keep_slowest
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._slowest = {}
+        self._callback_names = {}
+        self._profile_count = 0
+        if profile_dir is not None:
+            os.makedirs(profile_dir, exist_ok=True)
+
+    def install(self, app):
+        # map the output spec the browser sends to the callback's function name
+        for output, callback in app.callback_map.items():
+            function = callback.get("callback")
+            self._callback_names[output] = getattr(function, "__name__", output)
+
+        server = app.server
+        server.before_request(self._before_request)
+        server.after_request(self._after_request)
+        server.add_url_rule(
+            self.path, "callback_profile", lambda: flask.jsonify(self.summary())
+        )
+
+    def _before_request(self):
+        if flask.request.path != DASH_CALLBACK_PATH:
+            return
+
+        flask.g.callback_profile = None
+        if self.profile_dir is not None:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+                flask.g.callback_profile = profile
+            except ValueError:
+                # another request is being profiled in a different thread
+                pass
+        flask.g.callback_start = time.perf_counter()
+
+    def _after_request(self, response):
+        if flask.request.path != DASH_CALLBACK_PATH or "callback_start" not in flask.g:
+            return response
+
+        seconds = time.perf_counter() - flask.g.callback_start
+        profile = flask.g.callback_profile
+        if profile is not None:
+            profile.disable()
+
+        body = flask.request.get_json(silent=True) or {}
+        output = body.get("output", "?")
+        name = self._callback_names.get(output, output)
+        size = response.calculate_content_length() or 0
+
+        with self._lock:
+            self._record(name, seconds, size)
+            if profile is not None:
+                self._keep_profile(name, seconds, profile)
+
+        return response
+
+    def _record(self, name, seconds, size):
+        stats = self._stats.setdefault(
+            name,
+            {
+                "calls": 0,
+                "total_s": 0.0,
+                "max_s": 0.0,
+                "total_bytes": 0,
+                "max_bytes": 0,
+                "recent": deque(maxlen=1000),
+            },
+        )
+        stats["calls"] += 1
+        stats["total_s"] += seconds
+        stats["max_s"] = max(stats["max_s"], seconds)
+        stats["total_bytes"] += size
+        stats["max_bytes"] = max(stats["max_bytes"], size)
+        stats["recent"].append(time.monotonic())
+
+    def _keep_profile(self, name, seconds, profile):
+        # a min-heap of the slowest calls, so the fastest kept one is dropped
+        slowest = self._slowest.setdefault(name, [])
+        if len(slowest) >= self.keep_slowest and seconds <= slowest[0][0]:
+            return
+
+        self._profile_count += 1
+        path = os.path.join(
+            self.profile_dir,
+            f"{name}-{self._profile_count}-{seconds * 1e3:.0f}ms.prof",
+        )
+        profile.dump_stats(path)
+        heapq.heappush(slowest, (seconds, path))
+        if len(slowest) > self.keep_slowest:
+            _, dropped_path = heapq.heappop(slowest)
+            if os.path.exists(dropped_path):
+                os.remove(dropped_path)
+
+    def summary(self, window_s=10.0):
+        """
+        Per-callback statistics, slowest (by total time) first.
+
+        Returns:
+            list: One dict per callback, with the calls per second averaged
+                over the last window_s seconds.
+        """
+        now = time.monotonic()
+        with self._lock:
+            rows = []
+            for name, stats in self._stats.items():
+                recent = sum(1 for t in stats["recent"] if now - t <= window_s)
+                rows.append(
+                    {
+                        "callback": name,
+                        "calls": stats["calls"],
+                        "calls_per_s": recent / window_s,
+                        "mean_ms": stats["total_s"] / stats["calls"] * 1e3,
+                        "max_ms": stats["max_s"] * 1e3,
+                        "total_s": stats["total_s"],
+                        "mean_bytes": stats["total_bytes"] / stats["calls"],
+                        "max_bytes": stats["max_bytes"],
+                        "slowest_profiles": [
+                            path for _, path in sorted(self._slowest.get(name, []))
+                        ],
+                    }
+                )
+        return sorted(rows, key=lambda row: row["total_s"], reverse=True)
+
+    def print(self, file=None):
+        print(json.dumps(self.summary(), indent=2), file=file)
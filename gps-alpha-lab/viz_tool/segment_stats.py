@@ -0,0 +1,171 @@
+import numpy as np
+from spatial_index import EARTH_RADIUS_M
+
+
+def haversine_distances(lats1, lons1, lats2, lons2):
+    """
+    Great-circle distances in meters between two arrays of positions.
+    """
+    lats1, lons1, lats2, lons2 = (
+        np.deg2rad(np.asarray(values, dtype=np.float64))
+        for values in (lats1, lons1, lats2, lons2)
+    )
+    a = (
+        np.sin((lats2 - lats1) / 2) ** 2
+        + np.cos(lats1) * np.cos(lats2) * np.sin((lons2 - lons1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def prefix_sums(values):
+    """
+    Cumulative sums with a leading 0, so that the sum of values[i:j] is
+    sums[j] - sums[i]. NaN values count as 0.
+    """
+    values = np.nan_to_num(np.asarray(values, dtype=np.float64), nan=0.0)
+    sums = np.empty(len(values) + 1)
+    sums[0] = 0.0
+    np.cumsum(values, out=sums[1:])
+    return sums
+
+
+class RangeMax:
+    """
+    Maximum of any range of an array in constant time.
+
+    A sparse table over the maxima of fixed-size blocks answers the whole
+    blocks of a range in one lookup, and the (at most two) partial blocks at
+    its ends are scanned. It needs a fraction of the memory of a sparse table
+    over every element, (n / block_size) * log2(n / block_size) values.
+    """
+
+    def __init__(self, values, block_size=64):
+        self.values = np.asarray(values, dtype=np.float64)
+        self.block_size = block_size
+
+        block_count = -(-len(self.values) // block_size)
+        padded = np.full(block_count * block_size, -np.inf)
+        padded[: len(self.values)] = self.values
+        # levels[k][i] is the maximum of blocks i to i + 2**k - 1
+        self.levels = [padded.reshape(block_count, block_size).max(axis=1)]
+        width = 1
+        while 2 * width <= block_count:
+            previous = self.levels[-1]
+            self.levels.append(np.maximum(previous[:-width], previous[width:]))
+            width *= 2
+
+    def query(self, first, last):
+        """
+        Maximum of values[first:last + 1] (-inf for an empty range).
+        """
+        if last < first:
+            return -np.inf
+
+        first_block = first // self.block_size
+        last_block = last // self.block_size
+        if first_block == last_block:
+            return self.values[first : last + 1].max()
+
+        result = max(
+            self.values[first : (first_block + 1) * self.block_size].max(),
+            self.values[last_block * self.block_size : last + 1].max(),
+        )
+        inner_count = last_block - first_block - 1
+        if inner_count > 0:
+            level = inner_count.bit_length() - 1
+            result = max(
+                result,
+                self.levels[level][first_block + 1],
+                self.levels[level][last_block - 2**level],
+            )
+        return result
+
+
+class SegmentStatistics:
+    """
+    Statistics of the trajectory between any two frames, in constant time.
+
+    Prefix sums over the frames (cumulative distance, turning and gaze
+    direction) are computed once, so the statistics of any segment are a few
+    differences, no matter how long the recording or the segment is.
+
+    Args:
+        timestamps_ns (np.ndarray): Frame timestamps.
+        lats (np.ndarray): Latitude of every frame (NaN if unknown).
+        lons (np.ndarray): Longitude of every frame (NaN if unknown).
+        headings (np.ndarray): Heading of every frame, in degrees
+            counterclockwise.
+        gaze_azimuths (np.ndarray): Gaze direction in the world of every
+            frame, in degrees.
+    """
+
+    def __init__(self, timestamps_ns, lats, lons, headings, gaze_azimuths):
+        self.timestamps_ns = np.asarray(timestamps_ns, dtype=np.int64)
+
+        # step i goes from frame i to frame i + 1
+        steps_m = haversine_distances(lats[:-1], lons[:-1], lats[1:], lons[1:])
+        self._distance = prefix_sums(steps_m)
+
+        step_s = np.diff(self.timestamps_ns) / 1e9
+        with np.errstate(divide="ignore", invalid="ignore"):
+            speeds = np.where(step_s > 0, steps_m / step_s, np.nan)
+        self._max_speed = RangeMax(np.nan_to_num(speeds, nan=-np.inf))
+
+        # heading changes wrapped to [-180, 180), so turning past north counts
+        # as a small change
+        turns = (np.diff(np.asarray(headings, dtype=np.float64)) + 180) % 360 - 180
+        self._turn = prefix_sums(turns)
+        self._turning = prefix_sums(np.abs(turns))
+
+        # gaze directions as unit vectors, for the circular spread
+        gaze_rad = np.deg2rad(np.asarray(gaze_azimuths, dtype=np.float64))
+        self._gaze_count = prefix_sums(np.isfinite(gaze_rad))
+        self._gaze_cos = prefix_sums(np.cos(gaze_rad))
+        self._gaze_sin = prefix_sums(np.sin(gaze_rad))
+
+    def __len__(self):
+        return len(self.timestamps_ns)
+
+    def segment(self, start, end):
+        """
+        Statistics of the frames start to end (inclusive).
+
+        Returns:
+            dict: distance [m], duration [s], mean speed [m/s], max speed
+                [m/s] (between consecutive frames), heading change [deg]
+                (net, counterclockwise), turning [deg] (total, either way)
+                and gaze azimuth dispersion [deg] (circular standard
+                deviation). Values that cannot be computed are None.
+        """
+        start = max(int(start), 0)
+        end = min(int(end), len(self) - 1)
+        if end < start:
+            return None
+
+        distance = self._distance[end] - self._distance[start]
+        duration = (self.timestamps_ns[end] - self.timestamps_ns[start]) / 1e9
+        max_speed = self._max_speed.query(start, end - 1)
+
+        gaze_count = self._gaze_count[end + 1] - self._gaze_count[start]
+        dispersion = None
+        if gaze_count > 0:
+            resultant = (
+                np.hypot(
+                    self._gaze_cos[end + 1] - self._gaze_cos[start],
+                    self._gaze_sin[end + 1] - self._gaze_sin[start],
+                )
+                / gaze_count
+            )
+            dispersion = float(
+                np.rad2deg(np.sqrt(-2 * np.log(np.clip(resultant, 1e-12, 1.0))))
+            )
+
+        return {
+            "distance [m]": float(distance),
+            "duration [s]": float(duration),
+            "mean speed [m/s]": float(distance / duration) if duration > 0 else None,
+            "max speed [m/s]": float(max_speed) if np.isfinite(max_speed) else None,
+            "heading change [deg]": float(self._turn[end] - self._turn[start]),
+            "turning [deg]": float(self._turning[end] - self._turning[start]),
+            "gaze azimuth dispersion [deg]": dispersion,
+        }
@@ -0,0 +1,80 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+# mean Earth radius in meters
+EARTH_RADIUS_M = 6371008.8
+
+
+def project_to_local_meters(lats, lons, origin_lat, origin_lon):
+    """
+    Project latitude/longitude onto a local equirectangular plane in meters,
+    centered on (origin_lat, origin_lon). This is accurate enough for the
+    extent of a walking trajectory and, unlike raw degrees, keeps distances
+    consistent away from the equator.
+
+    Returns:
+        np.ndarray: An (N, 2) array of [east, north] offsets in meters.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+
+    east = np.deg2rad(lons - origin_lon) * np.cos(np.deg2rad(origin_lat))
+    north = np.deg2rad(lats - origin_lat)
+
+    return np.column_stack([east, north]) * EARTH_RADIUS_M
+
+
+def unproject_from_local_meters(east, north, origin_lat, origin_lon):
+    """
+    Inverse of project_to_local_meters.
+
+    Returns:
+        tuple: (latitudes, longitudes)
+    """
+    lats = origin_lat + np.rad2deg(np.asarray(north) / EARTH_RADIUS_M)
+    lons = origin_lon + np.rad2deg(
+        np.asarray(east) / EARTH_RADIUS_M / np.cos(np.deg2rad(origin_lat))
+    )
+    return lats, lons
+
+
+def build_spatial_index(lats, lons):
+    """
+    Build a KD-tree over a trajectory, for O(log n) nearest-point lookups.
+
+    Samples without a valid position are left out of the tree.
+
+    Returns:
+        tuple: (tree, origin, row_indices), where row_indices maps tree
+            entries back to positions in the input arrays.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+
+    valid = np.isfinite(lats) & np.isfinite(lons)
+    row_indices = np.flatnonzero(valid)
+    if len(row_indices) == 0:
+        return None, (0.0, 0.0), row_indices
+
+    origin = (float(np.mean(lats[valid])), float(np.mean(lons[valid])))
+    points = project_to_local_meters(lats[valid], lons[valid], *origin)
+
+    return cKDTree(points), origin, row_indices
+
+
+def query_nearest(spatial_index, lat, lon):
+    """
+    Find the trajectory sample closest to (lat, lon).
+
+    Returns:
+        tuple: (row_index, distance in meters), or (None, inf) if the index
+            is empty.
+    """
+    tree, origin, row_indices = spatial_index
+    if tree is None:
+        return None, np.inf
+
+    point = project_to_local_meters([lat], [lon], *origin)[0]
+    distance, tree_index = tree.query(point)
+
+    return int(row_indices[tree_index]), float(distance)
@@ -0,0 +1,388 @@
+"""
+Write synthetic Neon Timeseries CSV recordings with a matching GPS CSV.
+
+A wearer walks a random route (with turns and stops), looks around and
+fixates things along the way. The recording folder contains info.json,
+world_timestamps.csv, gaze.csv, imu.csv and events.csv with all columns of
+Neon's export, and a gps.csv as written by the GPS app, with position
+jitter, occasional outliers and blank lines between batches. All streams
+have timestamp jitter and dropouts (gaps), like real recordings.
+
+The files are written in chunks of simulated time, so recordings of many
+hours can be generated with little memory.
+
+Usage:
+    python synthetic_recording.py output_folder --duration 3600
+"""
+
+import argparse
+import json
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+from scipy.spatial.transform import Rotation as R
+from spatial_index import EARTH_RADIUS_M
+
+# sampling rates of Neon's streams and of the GPS app, in Hz
+RATES = {"scene": 30.0, "gaze": 200.0, "imu": 110.0, "gps": 1.0}
+
+# rate of the simulated route, the streams are interpolated from it
+WALK_RATE = 10.0
+
+# start of the route, in Berlin
+ORIGIN = (52.5163, 13.3777)
+
+# gaze.csv pixel coordinates: scene camera resolution and pixels per degree
+SCENE_SIZE = (1600, 1200)
+PIXELS_PER_DEGREE = 15.5
+
+
+def simulate_walk(duration_s, rng, origin=ORIGIN, speed=1.4):
+    """
+    A random walking route: mostly straight with some wander, an occasional
+    turn at a corner and short stops.
+
+    Returns:
+        tuple: (seconds, latitudes, longitudes, directions), sampled at
+            WALK_RATE. Directions are in degrees counterclockwise from east,
+            unwrapped so they can be interpolated.
+    """
+    seconds = np.arange(int(np.ceil(duration_s * WALK_RATE)) + 2) / WALK_RATE
+    dt = 1 / WALK_RATE
+
+    # wander, plus a turn about every 45 s
+    turn_rate = rng.normal(0, 4, len(seconds))
+    corners = rng.random(len(seconds)) < dt / 45
+    turn_rate[corners] += rng.choice([-90, 90], corners.sum()) / dt
+    directions = rng.uniform(0, 360) + np.cumsum(turn_rate * dt)
+
+    # stand still for about 10 s every 2 minutes
+    speeds = speed * rng.lognormal(0, 0.1, len(seconds))
+    stops = np.flatnonzero(rng.random(len(seconds)) < dt / 120)
+    for stop in stops:
+        speeds[stop : stop + int(rng.exponential(10) * WALK_RATE)] = 0
+
+    east = np.cumsum(speeds * dt * np.cos(np.deg2rad(directions)))
+    north = np.cumsum(speeds * dt * np.sin(np.deg2rad(directions)))
+    lats, lons = offset_positions(origin[0], origin[1], east, north)
+
+    return seconds, lats, lons, directions
+
+
+def offset_positions(lats, lons, east, north):
+    """
+    Move positions by east/north offsets in meters (the inverse of
+    spatial_index.project_to_local_meters).
+    """
+    lats = lats + np.rad2deg(north / EARTH_RADIUS_M)
+    lons = lons + np.rad2deg(east / EARTH_RADIUS_M) / np.cos(np.deg2rad(lats))
+    return lats, lons
+
+
+def random_gaps(duration_s, rng, per_hour, mean_s):
+    """
+    Non-overlapping [start, end) time spans, in seconds, in which a stream
+    has no samples.
+    """
+    count = rng.poisson(per_hour * duration_s / 3600)
+    starts = np.sort(rng.uniform(0, duration_s, count))
+    ends = starts + rng.exponential(mean_s, count)
+    ends[:-1] = np.minimum(ends[:-1], starts[1:])
+    return np.column_stack([starts, ends])
+
+
+def outside_gaps(seconds, gaps):
+    """
+    Boolean mask of the samples that do not fall into any of the gaps.
+    """
+    if len(gaps) == 0:
+        return np.ones(len(seconds), dtype=bool)
+    gap_idx = np.searchsorted(gaps[:, 0], seconds, side="right") - 1
+    inside = (gap_idx >= 0) & (seconds < gaps[np.maximum(gap_idx, 0), 1])
+    return ~inside
+
+
+def sample_times(start_s, end_s, rate, rng, jitter=0.1):
+    """
+    Nominal sample times in [start_s, end_s), jittered by up to
+    jitter / rate. Chunks of consecutive spans tile without duplicates.
+
+    Returns:
+        tuple: (sample numbers since the start of the recording, seconds)
+    """
+    numbers = np.arange(np.ceil(start_s * rate), np.ceil(end_s * rate))
+    seconds = (numbers + rng.uniform(-jitter, jitter, len(numbers))) / rate
+    return numbers.astype(np.int64), np.maximum(seconds, 0)
+
+
+def stream_sample_times(start_s, end_s, rate, gaps, rng):
+    """
+    Sample times in [start_s, end_s) of a stream with dropouts (see
+    sample_times and outside_gaps).
+
+    Returns:
+        tuple: (sample numbers since the start of the recording, seconds)
+    """
+    numbers, seconds = sample_times(start_s, end_s, rate, rng)
+    keep = outside_gaps(seconds, gaps)
+    return numbers[keep], seconds[keep]
+
+
+def to_ns(start_ns, seconds):
+    return start_ns + np.round(seconds * 1e9).astype(np.int64)
+
+
+class _CsvWriter:
+    """
+    Appends DataFrame chunks to a CSV file, writing the header once.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.header = True
+        open(path, "w").close()
+
+    def write(self, df):
+        df.to_csv(
+            self.path, mode="a", header=self.header, index=False, float_format="%.6f"
+        )
+        self.header = False
+
+
+def generate_recording(
+    output_dir,
+    duration_s,
+    rates=None,
+    seed=0,
+    start_ns=1_717_000_000_000_000_000,
+    gps_noise_m=3.0,
+    gps_outliers_per_hour=20,
+    gaps_per_hour=6,
+    events_per_hour=30,
+    chunk_s=300,
+):
+    """
+    Write a synthetic recording.
+
+    Args:
+        output_dir (str): Folder to create the recording folder in.
+        duration_s (float): Recording duration in seconds.
+        rates (dict): Sampling rates in Hz, to override RATES.
+        seed (int): Random seed, the same seed gives the same recording.
+        start_ns (int): Start time of the recording.
+        gps_noise_m (float): Standard deviation of the GPS position jitter.
+        gps_outliers_per_hour (float): GPS samples that are off by 20-100 m.
+        gaps_per_hour (float): Dropouts per hour in each stream, about 5 s
+            long in the Neon streams and 30 s long (e.g., in a tunnel) in
+            the GPS stream.
+        events_per_hour (float): Events besides recording.begin/end.
+        chunk_s (float): Seconds of the recording generated at a time.
+
+    Returns:
+        tuple: (neon_folder_path, gps_csv_path)
+    """
+    rates = {**RATES, **(rates or {})}
+    rng = np.random.default_rng(seed)
+    recording_id = str(uuid.UUID(bytes=rng.bytes(16)))
+    duration_ns = int(round(duration_s * 1e9))
+
+    start = pd.Timestamp(start_ns, unit="ns")
+    neon_folder_path = os.path.join(
+        output_dir, f"{start:%Y-%m-%d_%H-%M-%S}-{recording_id[:8]}"
+    )
+    os.makedirs(neon_folder_path, exist_ok=True)
+    gps_csv_path = os.path.join(neon_folder_path, "gps.csv")
+
+    walk_s, walk_lats, walk_lons, walk_directions = simulate_walk(duration_s, rng)
+    gaps = {
+        stream: random_gaps(
+            duration_s, rng, gaps_per_hour, 30.0 if stream == "gps" else 5.0
+        )
+        for stream in rates
+    }
+
+    with open(os.path.join(neon_folder_path, "info.json"), "w") as f:
+        json.dump(
+            {
+                "recording_id": recording_id,
+                "start_time": start_ns,
+                "duration": duration_ns,
+                "gaze_frequency": int(rates["gaze"]),
+                "android_device_name": "Neon Companion",
+                "wearer_name": "synthetic",
+                "template_data": {"name": "synthetic recording"},
+            },
+            f,
+            indent=4,
+        )
+
+    ids = {"section id": recording_id, "recording id": recording_id}
+    writers = {
+        name: _CsvWriter(os.path.join(neon_folder_path, f"{name}.csv"))
+        for name in ["world_timestamps", "gaze", "imu"]
+    }
+    with open(gps_csv_path, "w") as gps_file:
+        gps_file.write("timestamp [ns],latitude,longitude\n")
+
+        for chunk_start in np.arange(0, duration_s, chunk_s):
+            chunk_end = min(chunk_start + chunk_s, duration_s)
+
+            # scene camera, with a few single dropped frames
+            _, seconds = stream_sample_times(
+                chunk_start, chunk_end, rates["scene"], gaps["scene"], rng
+            )
+            seconds = seconds[rng.random(len(seconds)) > 0.001]
+            writers["world_timestamps"].write(
+                pd.DataFrame({**ids, "timestamp [ns]": to_ns(start_ns, seconds)})
+            )
+
+            # gaze: fixations of about 300 ms, with saccades in between
+            numbers, seconds = stream_sample_times(
+                chunk_start, chunk_end, rates["gaze"], gaps["gaze"], rng
+            )
+            fixation_ids = (seconds * 3.3).astype(np.int64)
+            first_fixation = int(chunk_start * 3.3)
+            fixation_count = int(np.ceil(chunk_end * 3.3)) - first_fixation + 1
+            targets_azi = np.clip(rng.normal(0, 12, fixation_count), -50, 50)
+            targets_ele = np.clip(rng.normal(-5, 8, fixation_count), -38, 38)
+            targets = np.clip(fixation_ids - first_fixation, 0, fixation_count - 1)
+            azimuths = targets_azi[targets] + rng.normal(0, 0.5, len(seconds))
+            elevations = targets_ele[targets] + rng.normal(0, 0.5, len(seconds))
+            writers["gaze"].write(
+                pd.DataFrame(
+                    {
+                        **ids,
+                        "timestamp [ns]": to_ns(start_ns, seconds),
+                        "gaze x [px]": SCENE_SIZE[0] / 2 + azimuths * PIXELS_PER_DEGREE,
+                        "gaze y [px]": SCENE_SIZE[1] / 2
+                        - elevations * PIXELS_PER_DEGREE,
+                        "worn": 1.0,
+                        "fixation id": fixation_ids + 1,
+                        "blink id": np.nan,
+                        "azimuth [deg]": azimuths,
+                        "elevation [deg]": elevations,
+                    }
+                )
+            )
+
+            # IMU: the head follows the walking direction and looks around
+            numbers, seconds = stream_sample_times(
+                chunk_start, chunk_end, rates["imu"], gaps["imu"], rng
+            )
+            look_around = (
+                25
+                * np.sin(2 * np.pi * seconds / 7.0)
+                * np.sin(2 * np.pi * seconds / 31.0)
+            )
+            # yaw is 0 to the north and increases to the left (counterclockwise)
+            yaws = np.interp(seconds, walk_s, walk_directions) - 90 + look_around
+            yaws = (yaws + 180) % 360 - 180
+            pitches = -10 + 5 * np.sin(2 * np.pi * seconds / 11.0)
+            rolls = 2 * np.sin(2 * np.pi * seconds / 1.1)
+            quaternions = R.from_euler(
+                "ZXY", np.column_stack([yaws, pitches, rolls]), degrees=True
+            ).as_quat(scalar_first=True)
+            gyro = np.gradient(
+                np.unwrap(np.column_stack([pitches, rolls, yaws]), period=360, axis=0),
+                seconds,
+                axis=0,
+            ) + rng.normal(0, 0.5, (len(seconds), 3))
+            acceleration = rng.normal(0, 0.05, (len(seconds), 3))
+            acceleration[:, 2] += 1
+            writers["imu"].write(
+                pd.DataFrame(
+                    {
+                        **ids,
+                        "timestamp [ns]": to_ns(start_ns, seconds),
+                        "gyro x [deg/s]": gyro[:, 0],
+                        "gyro y [deg/s]": gyro[:, 1],
+                        "gyro z [deg/s]": gyro[:, 2],
+                        "acceleration x [g]": acceleration[:, 0],
+                        "acceleration y [g]": acceleration[:, 1],
+                        "acceleration z [g]": acceleration[:, 2],
+                        "roll [deg]": rolls,
+                        "pitch [deg]": pitches,
+                        "yaw [deg]": yaws,
+                        "quaternion w": quaternions[:, 0],
+                        "quaternion x": quaternions[:, 1],
+                        "quaternion y": quaternions[:, 2],
+                        "quaternion z": quaternions[:, 3],
+                    }
+                )
+            )
+
+            # GPS: jittered positions and a few outliers,
+            # written in batches separated by blank lines like the app does
+            numbers, seconds = stream_sample_times(
+                chunk_start, chunk_end, rates["gps"], gaps["gps"], rng
+            )
+            errors = rng.normal(0, gps_noise_m, (len(seconds), 2))
+            outliers = rng.random(len(seconds)) < gps_outliers_per_hour / (
+                3600 * rates["gps"]
+            )
+            errors[outliers] *= rng.uniform(20, 100, (outliers.sum(), 1)) / (
+                gps_noise_m * np.sqrt(2)
+            )
+            lats, lons = offset_positions(
+                np.interp(seconds, walk_s, walk_lats),
+                np.interp(seconds, walk_s, walk_lons),
+                errors[:, 0],
+                errors[:, 1],
+            )
+            gps_ns = to_ns(start_ns, seconds)
+            for idx in range(len(gps_ns)):
+                gps_file.write(f"{gps_ns[idx]},{lats[idx]:.8f},{lons[idx]:.8f}\n")
+                if numbers[idx] % 10 == 9:
+                    gps_file.write("\n")
+
+    event_s = np.sort(
+        rng.uniform(0, duration_s, rng.poisson(events_per_hour * duration_s / 3600))
+    )
+    pd.DataFrame(
+        {
+            "recording id": recording_id,
+            "timestamp [ns]": to_ns(start_ns, np.r_[0, event_s, duration_s]),
+            "name": ["recording.begin"]
+            + [f"event {idx + 1}" for idx in range(len(event_s))]
+            + ["recording.end"],
+            "type": ["recording"] + ["cloud"] * len(event_s) + ["recording"],
+        }
+    ).to_csv(os.path.join(neon_folder_path, "events.csv"), index=False)
+
+    return neon_folder_path, gps_csv_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("output_dir", help="Folder to write the recording folder to")
+    parser.add_argument(
+        "--duration", type=float, default=600, help="Duration in seconds"
+    )
+    for stream, rate in RATES.items():
+        parser.add_argument(
+            f"--{stream}-rate", type=float, default=rate, help=f"{stream} rate [Hz]"
+        )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--gps-noise",
+        type=float,
+        default=3.0,
+        help="Standard deviation of the GPS jitter, in meters",
+    )
+    args = parser.parse_args()
+
+    neon_folder_path, gps_csv_path = generate_recording(
+        args.output_dir,
+        args.duration,
+        rates={stream: getattr(args, f"{stream}_rate") for stream in RATES},
+        seed=args.seed,
+        gps_noise_m=args.gps_noise,
+    )
+    print(neon_folder_path)
+    print(gps_csv_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+"""
+Cache map tiles on disk, so that maps load quickly and also work offline.
+
+The tools serve the map tiles themselves (see add_tile_route): from the
+cache if a tile was fetched before, else from the tile server, keeping a
+copy. Once the cache is larger than its size limit, the least recently used
+tiles are removed. To use the maps without network access, fetch the tiles
+around the GPS tracks ahead of time:
+
+    python tiles.py gps_csv [gps_csv ...] --zoom 13-18
+"""
+
+import argparse
+import hashlib
+import math
+import mimetypes
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import flask
+
+DEFAULT_TILE_URL = "https://tile.openstreetmap.org/{z}/{x}/{y}.png"
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "gps-viz-tool", "tiles"
+)
+DEFAULT_MAX_SIZE_MB = 500
+
+# URL of the served tiles for dl.TileLayer, relative to the page, so that it
+# also works when the app is served below a path prefix
+TILE_LAYER_URL = "tiles/{z}/{x}/{y}"
+
+# tile servers ask clients to identify themselves
+USER_AGENT = "Neon GPS Visualization Tool"
+
+# OpenStreetMap's tile usage policy asks for few connections at a time and
+# forbids bulk downloads, so prefetching is kept to the area of a recording
+PREFETCH_WORKERS = 2
+MAX_PREFETCH_TILES = 5000
+
+# after the tile server could not be reached, it is not asked again for this
+# long, so that an offline map shows its cached tiles without waiting for
+# every other tile to time out
+OFFLINE_RETRY_S = 30.0
+
+# how long browsers may keep a served tile
+TILE_MAX_AGE_S = 24 * 3600
+
+MAX_ZOOM = 19
+
+# the Web Mercator projection of the tiles ends at this latitude
+MAX_LATITUDE = 85.0511287798
+
+
+def tile_xy(lat, lon, zoom):
+    """
+    The x and y of the tile at a zoom level that contains a position.
+    """
+    count = 2**zoom
+    lat = math.radians(min(max(lat, -MAX_LATITUDE), MAX_LATITUDE))
+    x = int((lon + 180) / 360 * count)
+    y = int((1 - math.asinh(math.tan(lat)) / math.pi) / 2 * count)
+    return min(max(x, 0), count - 1), min(max(y, 0), count - 1)
+
+
+def tiles_in_bounds(bounds, zoom_levels, margin=1):
+    """
+    The tiles covering an area, with margin more tiles around it, e.g., for
+    views centered near its edges.
+
+    Args:
+        bounds (list): [[south, west], [north, east]] of the area.
+        zoom_levels (list): The zoom levels to cover.
+
+    Returns:
+        list: (zoom, x, y) of every tile.
+    """
+    (south, west), (north, east) = bounds
+    tiles = []
+    for zoom in zoom_levels:
+        first_x, first_y = tile_xy(north, west, zoom)
+        last_x, last_y = tile_xy(south, east, zoom)
+        last = 2**zoom - 1
+        tiles.extend(
+            (zoom, x, y)
+            for x in range(max(first_x - margin, 0), min(last_x + margin, last) + 1)
+            for y in range(max(first_y - margin, 0), min(last_y + margin, last) + 1)
+        )
+    return tiles
+
+
+def parse_zoom_levels(text):
+    """
+    Zoom levels from a command line argument, e.g., "16" or "13-18".
+    """
+    first, _, last = text.partition("-")
+    try:
+        zoom_levels = list(range(int(first), int(last or first) + 1))
+    except ValueError:
+        zoom_levels = []
+    if not zoom_levels or zoom_levels[0] < 0 or zoom_levels[-1] > MAX_ZOOM:
+        raise argparse.ArgumentTypeError(
+            f"expected a zoom level or a range like 13-18, from 0 to {MAX_ZOOM}"
+        )
+    return zoom_levels
+
+
+class TileCache:
+    """
+    Map tiles of a tile server, kept on disk below cache_dir. Once they take
+    up more than max_size_bytes, the least recently used tiles are removed.
+
+    The tiles of different tile servers (url_templates) are kept apart, and
+    share the size limit. When the cache is used by several processes (e.g.,
+    gunicorn workers), each keeps its own index of it, so the limit is only
+    approximately kept.
+    """
+
+    def __init__(
+        self,
+        cache_dir=DEFAULT_CACHE_DIR,
+        url_template=DEFAULT_TILE_URL,
+        max_size_bytes=DEFAULT_MAX_SIZE_MB * 1024 * 1024,
+        timeout=10,
+    ):
+        """
+        Args:
+            url_template (str): URL of the tiles with {z}, {x} and {y} (and
+                optionally {s}, for the subdomains a, b and c). Any URL that
+                urllib can open, e.g., of a local tile server, or a file://
+                URL of a folder of tiles.
+            timeout (float): Seconds to wait for the tile server.
+        """
+        self.cache_dir = cache_dir
+        self.url_template = url_template
+        self.max_size_bytes = max_size_bytes
+        self.timeout = timeout
+        self.mimetype = (
+            mimetypes.guess_type(urllib.parse.urlsplit(url_template).path)[0]
+            or "image/png"
+        )
+        self._folder = os.path.join(
+            cache_dir, hashlib.sha1(url_template.encode()).hexdigest()[:16]
+        )
+        self._lock = threading.Lock()
+        self._offline_until = 0.0
+
+        # size of every cached tile by path, least recently used first. A
+        # tile's modification time is its last use, so the order is kept
+        # from one run to the next.
+        self._tiles = OrderedDict()
+        self._size = 0
+        cached = []
+        for folder, _, filenames in os.walk(cache_dir):
+            for filename in filenames:
+                if filename.endswith(".tmp"):
+                    continue
+                path = os.path.join(folder, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                cached.append((stat.st_mtime, path, stat.st_size))
+        for _, path, size in sorted(cached):
+            self._tiles[path] = size
+            self._size += size
+
+    @property
+    def size_bytes(self):
+        return self._size
+
+    def tile_path(self, zoom, x, y):
+        return os.path.join(self._folder, str(zoom), str(x), str(y))
+
+    def tile_url(self, zoom, x, y):
+        return self.url_template.format(z=zoom, x=x, y=y, s="abc"[(x + y) % 3])
+
+    def get(self, zoom, x, y):
+        """
+        A tile from the cache, or else from the tile server (and then kept).
+
+        Returns:
+            bytes: The tile, or None if it is not cached and the tile server
+                doesn't have it or can't be reached.
+        """
+        path = self.tile_path(zoom, x, y)
+        data = self._read(path)
+        if data is None:
+            data = self._fetch(zoom, x, y)
+            if data is not None:
+                self._store(path, data)
+        return data
+
+    def prefetch(
+        self,
+        bounds,
+        zoom_levels,
+        max_tiles=MAX_PREFETCH_TILES,
+        workers=PREFETCH_WORKERS,
+    ):
+        """
+        Fetch the tiles covering an area (see tiles_in_bounds) that are not
+        cached yet, and mark those that are as recently used.
+
+        Returns:
+            dict: Numbers of "tiles" covering the area, of those that were
+                "cached" already, and of those that "failed" to download.
+        """
+        tiles = tiles_in_bounds(bounds, zoom_levels)
+        if len(tiles) > max_tiles:
+            raise ValueError(
+                f"{len(tiles)} tiles cover the area at zoom levels "
+                f"{zoom_levels[0]}-{zoom_levels[-1]}, more than the {max_tiles} "
+                "that are fetched at most"
+            )
+        cached = sum(os.path.exists(self.tile_path(*tile)) for tile in tiles)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            failed = sum(
+                data is None for data in pool.map(lambda t: self.get(*t), tiles)
+            )
+        return {"tiles": len(tiles), "cached": cached, "failed": failed}
+
+    def _read(self, path):
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            if path in self._tiles:
+                self._tiles.move_to_end(path)
+            else:
+                # written by another process
+                self._tiles[path] = len(data)
+                self._size += len(data)
+        return data
+
+    def _fetch(self, zoom, x, y):
+        if time.monotonic() < self._offline_until:
+            return None
+        request = urllib.request.Request(
+            self.tile_url(zoom, x, y), headers={"User-Agent": USER_AGENT}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.read()
+        except urllib.error.HTTPError:
+            # the server is there, but has no such tile
+            return None
+        except OSError as e:
+            # a missing file of a file:// URL is just a missing tile
+            if not isinstance(getattr(e, "reason", None), FileNotFoundError):
+                self._offline_until = time.monotonic() + OFFLINE_RETRY_S
+            return None
+
+    def _store(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # written to a temporary file first, so that a tile is never read
+        # half-written (as in batch.write_table)
+        tmp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._size += len(data) - self._tiles.pop(path, 0)
+            self._tiles[path] = len(data)
+            # the least recently used first, but never the new tile
+            while self._size > self.max_size_bytes and len(self._tiles) > 1:
+                evicted, size = self._tiles.popitem(last=False)
+                self._size -= size
+                try:
+                    os.remove(evicted)
+                except FileNotFoundError:
+                    pass
+
+
+def add_tile_route(server, tile_cache):
+    """
+    Serve the tiles of a TileCache on a Flask server, at TILE_LAYER_URL.
+    """
+
+    @server.route("/tiles/<int:zoom>/<int:x>/<int:y>")
+    def serve_tile(zoom, x, y):
+        if not (0 <= zoom <= MAX_ZOOM and 0 <= x < 2**zoom and 0 <= y < 2**zoom):
+            flask.abort(404)
+        data = tile_cache.get(zoom, x, y)
+        if data is None:
+            flask.abort(404, "The tile is not cached and the tile server has none")
+        response = flask.Response(data, mimetype=tile_cache.mimetype)
+        response.cache_control.public = True
+        response.cache_control.max_age = TILE_MAX_AGE_S
+        return response
+
+    return serve_tile
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "gps_csv_paths",
+        nargs="+",
+        metavar="gps_csv",
+        help="GPS CSV file(s), the tiles around all of them are fetched",
+    )
+    parser.add_argument(
+        "--zoom",
+        type=parse_zoom_levels,
+        default=parse_zoom_levels("13-18"),
+        help="Zoom levels to fetch, e.g., 16 or 13-18",
+    )
+    parser.add_argument("--tile-url", default=DEFAULT_TILE_URL)
+    parser.add_argument("--tile-cache", default=DEFAULT_CACHE_DIR)
+    parser.add_argument(
+        "--tile-cache-size",
+        type=float,
+        default=DEFAULT_MAX_SIZE_MB,
+        help="Size limit of the tile cache in MB",
+    )
+    parser.add_argument(
+        "--max-tiles",
+        type=int,
+        default=MAX_PREFETCH_TILES,
+        help="Fetch nothing if more tiles than this cover the area",
+    )
+    args = parser.parse_args(argv)
+
+    # pandas is only needed to read the GPS files
+    import ingest
+
+    souths, wests, norths, easts = [], [], [], []
+    for path in args.gps_csv_paths:
+        gps_df = ingest.read_gps(path)
+        if gps_df.empty:
+            print(f"Skipping {path}: no GPS samples", file=sys.stderr)
+            continue
+        souths.append(gps_df["latitude"].min())
+        norths.append(gps_df["latitude"].max())
+        wests.append(gps_df["longitude"].min())
+        easts.append(gps_df["longitude"].max())
+    if not souths:
+        print("Error: No GPS samples to fetch the tiles around.", file=sys.stderr)
+        return 1
+    bounds = [[min(souths), min(wests)], [max(norths), max(easts)]]
+
+    tile_cache = TileCache(
+        args.tile_cache, args.tile_url, int(args.tile_cache_size * 1024 * 1024)
+    )
+    try:
+        result = tile_cache.prefetch(bounds, args.zoom, max_tiles=args.max_tiles)
+    except ValueError as e:
+        print(f"Error: {e}.", file=sys.stderr)
+        return 1
+    print(
+        f"{result['tiles']} tiles, {result['cached']} were cached, "
+        f"{result['failed']} failed; the cache holds "
+        f"{tile_cache.size_bytes / 1024 / 1024:.1f} MB"
+    )
+    return 1 if result["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+import numpy as np
+from spatial_index import project_to_local_meters
+
+# Web Mercator ground resolution at the equator for zoom 0 (256 px tiles)
+EQUATOR_METERS_PER_PIXEL = 156543.03392
+
+# zoom levels that get a simplified copy of the trajectory,
+# anything above the last one is shown at full detail
+PYRAMID_ZOOM_LEVELS = range(10, 19)
+
+
+def meters_per_pixel(zoom, lat):
+    """
+    Size of one screen pixel on the ground at a given zoom level and latitude.
+    """
+    return EQUATOR_METERS_PER_PIXEL * np.cos(np.deg2rad(lat)) / 2**zoom
+
+
+def douglas_peucker_indices(points, tolerance):
+    """
+    Simplify a polyline with the Douglas-Peucker algorithm.
+
+    Args:
+        points (np.ndarray): An (N, 2) array of planar coordinates in meters.
+        tolerance (float): Maximum allowed deviation from the original line,
+            in meters.
+
+    Returns:
+        np.ndarray: Sorted indices of the points to keep, always including
+            the first and last point.
+    """
+    n = len(points)
+    if n < 3:
+        return np.arange(n)
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+
+    # all segments that are still to be split are split at once, one level of
+    # the recursion at a time, so the work per level is a few passes over
+    # their points in NumPy instead of a Python iteration per segment
+    x = np.ascontiguousarray(points[:, 0])
+    y = np.ascontiguousarray(points[:, 1])
+    firsts = np.array([0])
+    lasts = np.array([n - 1])
+    while len(firsts) > 0:
+        inner = lasts - firsts >= 2
+        firsts = firsts[inner]
+        lasts = lasts[inner]
+        if len(firsts) == 0:
+            break
+
+        # the points between the ends of every segment, one after the other
+        counts = lasts - firsts - 1
+        offsets = np.cumsum(counts) - counts
+        rows = np.arange(offsets[-1] + counts[-1]) + np.repeat(
+            firsts + 1 - offsets, counts
+        )
+
+        ab_x = x[lasts] - x[firsts]
+        ab_y = y[lasts] - y[firsts]
+        ab_len_sq = ab_x**2 + ab_y**2
+        inverse_len_sq = np.divide(
+            1.0, ab_len_sq, out=np.zeros(len(firsts)), where=ab_len_sq > 0
+        )
+        ab_x = np.repeat(ab_x, counts)
+        ab_y = np.repeat(ab_y, counts)
+        ap_x = x[rows] - np.repeat(x[firsts], counts)
+        ap_y = y[rows] - np.repeat(y[firsts], counts)
+
+        # distance to the segment (not the infinite line), so that closed
+        # loops where the first and last point coincide still simplify well
+        t = (ap_x * ab_x + ap_y * ab_y) * np.repeat(inverse_len_sq, counts)
+        np.clip(t, 0.0, 1.0, out=t)
+        ap_x -= t * ab_x
+        ap_y -= t * ab_y
+        distances = ap_x**2 + ap_y**2
+
+        # the farthest point of every segment (the first one of equally far)
+        farthest = np.maximum.reduceat(distances, offsets)
+        candidates = np.flatnonzero(distances == np.repeat(farthest, counts))
+        segments = np.searchsorted(offsets, candidates, side="right")
+        first_candidates = np.ones(len(candidates), dtype=bool)
+        first_candidates[1:] = segments[1:] != segments[:-1]
+
+        split = farthest > tolerance**2
+        splits = rows[candidates[first_candidates]][split]
+        keep[splits] = True
+        firsts, lasts = (
+            np.concatenate([firsts[split], splits]),
+            np.concatenate([splits, lasts[split]]),
+        )
+
+    return np.flatnonzero(keep)
+
+
+def build_trajectory_pyramid(lats, lons, pixel_tolerance=1.0):
+    """
+    Precompute simplified versions of a trajectory for a range of zoom levels,
+    each accurate to about pixel_tolerance screen pixels.
+
+    Levels are built from fine to coarse, each one simplifying the previous
+    level instead of the full trajectory, which keeps the build fast for long
+    recordings. Every run of valid points between invalid (NaN) ones is
+    simplified on its own, so both ends of a run are kept at every level.
+
+    Returns:
+        dict: Maps zoom level -> indices into lats/lons of the kept points.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+
+    valid = np.flatnonzero(np.isfinite(lats) & np.isfinite(lons))
+    if len(valid) == 0:
+        return {zoom: valid for zoom in PYRAMID_ZOOM_LEVELS}
+
+    origin_lat = float(np.mean(lats[valid]))
+    points = project_to_local_meters(
+        lats[valid], lons[valid], origin_lat, float(np.mean(lons[valid]))
+    )
+
+    # positions in valid of consecutive rows, one array per run
+    levels = np.split(np.arange(len(valid)), np.flatnonzero(np.diff(valid) > 1) + 1)
+
+    pyramid = {}
+    for zoom in sorted(PYRAMID_ZOOM_LEVELS, reverse=True):
+        tolerance = pixel_tolerance * meters_per_pixel(zoom, origin_lat)
+        levels = [
+            level[douglas_peucker_indices(points[level], tolerance)] for level in levels
+        ]
+        pyramid[zoom] = valid[np.concatenate(levels)]
+
+    return pyramid
+
+
+def select_trajectory_rows(pyramid, lats, lons, zoom, bounds, start, end):
+    """
+    Pick the trajectory points to send to the browser for the current view.
+
+    Args:
+        pyramid (dict): Output of build_trajectory_pyramid.
+        lats (np.ndarray): Latitudes of the full trajectory.
+        lons (np.ndarray): Longitudes of the full trajectory.
+        zoom (float): Current map zoom level.
+        bounds (list): Current map bounds as [[south, west], [north, east]],
+            or None to skip viewport culling.
+        start (int): First row of the trim window.
+        end (int): Last row of the trim window.
+
+    Returns:
+        list: One array of row indices per polyline to draw. Rows with an
+            invalid (NaN) position are left out, and lines are broken there.
+    """
+    if end < start:
+        return []
+
+    if zoom is None or zoom > max(PYRAMID_ZOOM_LEVELS):
+        indices = np.arange(start, end + 1)
+    else:
+        level = pyramid[max(int(zoom), min(PYRAMID_ZOOM_LEVELS))]
+        window = level[
+            np.searchsorted(level, start, side="left") : np.searchsorted(
+                level, end, side="right"
+            )
+        ]
+        # the trimmed line should start and end exactly at the window edges
+        indices = np.unique(np.concatenate([[start], window, [end]]))
+
+    indices = indices[np.isfinite(lats[indices]) & np.isfinite(lons[indices])]
+    # the pyramid keeps both ends of every run of valid rows, so a line has to
+    # be broken after a point exactly when the row that follows it is invalid
+    following = np.minimum(indices + 1, len(lats) - 1)
+    gap_after = ~(np.isfinite(lats[following]) & np.isfinite(lons[following]))
+    selected_lats = lats[indices]
+    selected_lons = lons[indices]
+
+    if bounds is not None and len(indices) > 0:
+        (south, west), (north, east) = bounds
+        # pad the viewport so small pans don't immediately show missing lines
+        pad_lat = (north - south) * 0.5
+        pad_lon = (east - west) * 0.5
+        inside = (
+            (selected_lats >= south - pad_lat)
+            & (selected_lats <= north + pad_lat)
+            & (selected_lons >= west - pad_lon)
+            & (selected_lons <= east + pad_lon)
+        )
+        # also keep the neighbors of visible points, so that segments crossing
+        # the edge of the viewport are still drawn
+        visible = inside.copy()
+        inside[1:] |= visible[:-1]
+        inside[:-1] |= visible[1:]
+    else:
+        inside = np.ones(len(indices), dtype=bool)
+
+    # split into separate polylines wherever points were culled
+    # and at gaps in the trajectory
+    kept = np.flatnonzero(inside)
+    runs = np.split(
+        kept, np.flatnonzero((np.diff(kept) > 1) | gap_after[kept[:-1]]) + 1
+    )
+
+    return [indices[run] for run in runs if len(run) > 0]
+
+
+def select_trajectory(pyramid, lats, lons, zoom, bounds, start, end, decimals=6):
+    """
+    Coordinates of the trajectory points picked by select_trajectory_rows.
+
+    Args:
+        decimals (int): Rounding of the coordinates, to keep the JSON small.
+
+    Returns:
+        list: A list of polylines (each a list of [lat, lon]), as accepted by
+            dl.Polyline for a MultiPolyline.
+    """
+    return [
+        np.round(np.column_stack([lats[rows], lons[rows]]), decimals).tolist()
+        for rows in select_trajectory_rows(
+            pyramid, lats, lons, zoom, bounds, start, end
+        )
+    ]
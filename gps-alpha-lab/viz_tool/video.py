@@ -0,0 +1,111 @@
+import io
+import mimetypes
+import os
+
+import flask
+from werkzeug.http import is_resource_modified
+from werkzeug.wsgi import wrap_file
+
+# how long browsers may reuse a video without asking the server again
+VIDEO_MAX_AGE_S = 3600
+
+BLOCK_SIZE = 1024 * 1024
+
+
+def send_video(path, max_age=VIDEO_MAX_AGE_S):
+    """
+    Respond to the current request with the video file at path, or with the
+    byte range of it that the request asks for, so that seeking in a long
+    video only downloads the part that is played.
+
+    The file is passed to the WSGI server as a file (wsgi.file_wrapper), so
+    servers that support it (e.g., gunicorn) send it with sendfile, without
+    copying it through Python. Flask's send_file also handles ranges, but
+    reads (and drops) everything before the range unless it serves the file
+    itself, which it doesn't under gunicorn.
+    """
+    request = flask.request
+    stat = os.stat(path)
+    size = stat.st_size
+    # changes when the file is replaced, e.g., by a newly rendered video
+    etag = f"{stat.st_mtime_ns:x}-{size:x}"
+
+    response = flask.Response(
+        mimetype=mimetypes.guess_type(path)[0] or "application/octet-stream",
+        direct_passthrough=True,
+    )
+    response.set_etag(etag)
+    response.last_modified = stat.st_mtime
+    response.accept_ranges = "bytes"
+    # recordings are personal data, so only the browser keeps a copy
+    response.cache_control.private = True
+    response.cache_control.max_age = max_age
+
+    if not is_resource_modified(
+        request.environ, etag=etag, last_modified=response.last_modified
+    ):
+        response.status_code = 304
+        return response
+
+    start, stop = 0, size
+    byte_range = request.range
+    if_range = request.if_range
+    if if_range.etag is not None or if_range.date is not None:
+        # a range of an earlier version of the file is of no use,
+        # then the whole file is sent
+        if if_range.etag != etag and if_range.date != response.last_modified:
+            byte_range = None
+    # browsers ask for a single range, several at once are answered in full
+    if byte_range is not None and len(byte_range.ranges) == 1:
+        span = byte_range.range_for_length(size)
+        if span is None:
+            response.status_code = 416
+            response.headers["Content-Range"] = f"bytes */{size}"
+            return response
+        start, stop = span
+        response.status_code = 206
+        response.headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+
+    response.content_length = stop - start
+    response.response = wrap_file(
+        request.environ, _FileRange(path, start, stop - start), BLOCK_SIZE
+    )
+    return response
+
+
+class _FileRange(io.RawIOBase):
+    # length bytes of a file from start on. The file position is at start,
+    # and the file number is exposed, so that the WSGI server can sendfile
+    # the range (it sends as many bytes as the Content-Length).
+
+    def __init__(self, path, start, length):
+        super().__init__()
+        self._file = open(path, "rb", buffering=0)
+        self._file.seek(start)
+        self._stop = start + length
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        # socket.sendfile moves the position past what it sent
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def read(self, size=-1):
+        remaining = max(self._stop - self._file.tell(), 0)
+        if size < 0 or size > remaining:
+            size = remaining
+        return self._file.read(size) if size else b""
+
+    def close(self):
+        self._file.close()
+        super().close()